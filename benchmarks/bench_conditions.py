@@ -0,0 +1,58 @@
+"""Per-resource cost of compiled conditions vs. PolicyEngine._evaluate_conditions.
+
+    python -m benchmarks.bench_conditions [resources]
+"""
+import random
+import sys
+import timeit
+from types import SimpleNamespace
+
+from condition_compiler import compile_conditions
+from policy_engine import PolicyEngine
+from policy_types import PolicyCondition
+
+CONDITIONS = [
+    PolicyCondition(field="tags.environment", operator="notExists"),
+    PolicyCondition(field="properties.encryption.services.blob.enabled", operator="notEquals", value=True),
+    PolicyCondition(field="location", operator="equals", value="westeurope"),
+]
+
+def synthetic_resources(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    resources = []
+    for i in range(count):
+        tags = {"environment": "prod"} if rng.random() < 0.5 else {}
+        resources.append(SimpleNamespace(
+            id=f"/subscriptions/s/resourceGroups/rg/providers/Microsoft.Storage/storageAccounts/sa{i}",
+            type="Microsoft.Storage/storageAccounts",
+            location=rng.choice(["westeurope", "eastus", "westus2"]),
+            tags=tags,
+            properties={"encryption": {"services": {"blob": {"enabled": rng.random() < 0.8}}}},
+        ))
+    return resources
+
+def reference_evaluate(resources):
+    # An uninitialised engine is enough for _evaluate_conditions and avoids
+    # needing Azure credentials
+    evaluate = PolicyEngine._evaluate_conditions
+    engine = PolicyEngine.__new__(PolicyEngine)
+    return sum(1 for resource in resources if evaluate(engine, resource, CONDITIONS))
+
+def compiled_evaluate(resources, evaluator):
+    return sum(1 for resource in resources if evaluator(resource))
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    resources = synthetic_resources(count)
+    evaluator = compile_conditions(CONDITIONS)
+    assert reference_evaluate(resources) == compiled_evaluate(resources, evaluator)
+
+    reference = min(timeit.repeat(lambda: reference_evaluate(resources), number=1, repeat=3))
+    compiled = min(timeit.repeat(lambda: compiled_evaluate(resources, evaluator), number=1, repeat=3))
+    print(f"resources:  {count}")
+    print(f"reference:  {reference / count * 1e9:8.1f} ns/resource")
+    print(f"compiled:   {compiled / count * 1e9:8.1f} ns/resource")
+    print(f"speedup:    {reference / compiled:8.2f}x")
+
+if __name__ == "__main__":
+    main()
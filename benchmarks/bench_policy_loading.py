@@ -0,0 +1,59 @@
+"""Policy bundle load time: cold (validated), cached, and the old single-file path.
+
+    python -m benchmarks.bench_policy_loading [policies] [files]
+"""
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from policy_loader import load_policies
+
+def policy_data(i: int):
+    return {
+        "id": f"policy-{i}",
+        "name": f"Policy {i}",
+        "description": "synthetic policy",
+        "resource_type": "Microsoft.Storage/storageAccounts",
+        "evaluation_frequency": 5,
+        "scope": {"subscription": f"sub-{i % 20}"},
+        "conditions": [
+            {"field": "tags.owner", "operator": "equals", "value": f"team-{i}"},
+            {"field": "properties.minimumTlsVersion", "operator": "in", "value": ["TLS1_0", "TLS1_1"]},
+        ],
+        "remediation_action": {
+            "type": "tag",
+            "parameters": {"flagged": f"policy-{i}"},
+            "timing": {"delay": "7d", "warning_threshold": "5d"}
+        }
+    }
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    logging.getLogger("policy_loader").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as root:
+        bundle = Path(root) / "bundle"
+        bundle.mkdir()
+        for f in range(files):
+            policies = [policy_data(i) for i in range(f, count, files)]
+            (bundle / f"policies-{f:03d}.json").write_text(json.dumps({"policies": policies}))
+        single = Path(root) / "all.json"
+        single.write_text(json.dumps({"policies": [policy_data(i) for i in range(count)]}))
+        cache_dir = str(Path(root) / "cache")
+
+        print(f"policies: {count}, files: {files}")
+        print(f"single file, serial:   {timed(lambda: load_policies(str(single))):8.3f} s")
+        print(f"directory, 1 worker:   {timed(lambda: load_policies(str(bundle), workers=1)):8.3f} s")
+        print(f"directory, parallel:   {timed(lambda: load_policies(str(bundle), cache_dir)):8.3f} s (fills cache)")
+        print(f"directory, cached:     {timed(lambda: load_policies(str(bundle), cache_dir)):8.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Per-resource cost of matching many policies: one evaluator per policy vs. PredicateIndex.
+
+    python -m benchmarks.bench_predicate_index [resources]
+
+The policies resemble a large rule set: tag-presence rules, location and SKU
+allow-lists, and naming patterns, many of them testing the same fields.
+"""
+import random
+import sys
+import timeit
+
+from condition_compiler import compile_conditions
+from predicate_index import PredicateIndex
+from policy_types import PolicyCondition
+from benchmarks.bench_conditions import synthetic_resources
+
+TAGS = ["environment", "owner", "cost-center", "project", "data-class", "backup", "expiry", "team"]
+LOCATIONS = ["westeurope", "eastus", "westus2", "northeurope", "uksouth"]
+
+def random_policy(rng: random.Random):
+    kind = rng.randrange(4)
+    if kind == 0:
+        return [PolicyCondition(field=f"tags.{rng.choice(TAGS)}", operator="notExists")]
+    if kind == 1:
+        return [PolicyCondition(field="location", operator="equals", value=rng.choice(LOCATIONS)),
+                PolicyCondition(field=f"tags.{rng.choice(TAGS)}", operator="notExists")]
+    if kind == 2:
+        return [PolicyCondition(field="location", operator="in", value=rng.sample(LOCATIONS, 2)),
+                PolicyCondition(field="tags.environment", operator="equals", value=rng.choice(["prod", "dev"]))]
+    return [PolicyCondition(field="tags.environment", operator="exists"),
+            PolicyCondition(field="location", operator="matches", value=f"^{rng.choice(LOCATIONS)[:4]}")]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    resources = synthetic_resources(count)
+    rng = random.Random(1)
+    print(f"resources: {count}")
+    print(f"{'policies':>8}  {'per policy':>12}  {'index':>12}  {'speedup':>8}")
+    for policy_count in (10, 100, 1000):
+        evaluators = [compile_conditions(random_policy(rng)) for _ in range(policy_count)]
+        index = PredicateIndex(list(enumerate(evaluators)))
+
+        def per_policy():
+            return [[i for i, evaluator in enumerate(evaluators) if evaluator(r)] for r in resources]
+
+        def indexed():
+            return [index.match(r) for r in resources]
+
+        assert per_policy() == indexed()
+        loop = min(timeit.repeat(per_policy, number=1, repeat=3)) / count
+        fast = min(timeit.repeat(indexed, number=1, repeat=3)) / count
+        print(f"{policy_count:>8}  {loop * 1e6:9.1f} us  {fast * 1e6:9.1f} us  {loop / fast:7.1f}x")
+
+if __name__ == "__main__":
+    main()
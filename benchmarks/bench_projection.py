@@ -0,0 +1,86 @@
+"""Resident memory per cached resource: SDK GenericResource vs. projected records.
+
+    python -m benchmarks.bench_projection [resources]
+"""
+import json
+import random
+import sys
+import timeit
+import tracemalloc
+
+from azure.mgmt.resource.resources.models import GenericResource
+
+from condition_compiler import compile_conditions
+from inventory import ArmResource
+from policy_types import PolicyCondition
+from resource_projection import ResourceProjection
+
+CONDITIONS = [
+    PolicyCondition(field="tags.environment", operator="notExists"),
+    PolicyCondition(field="location", operator="equals", value="westeurope"),
+    PolicyCondition(field="properties.storageProfile.osDisk.osType", operator="equals", value="Linux"),
+]
+
+def arm_payload(i: int, rng: random.Random):
+    group = f"rg-{rng.randrange(50)}"
+    return {
+        "id": f"/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/{group}"
+              f"/providers/Microsoft.Compute/virtualMachines/vm{i}",
+        "name": f"vm{i}",
+        "type": "Microsoft.Compute/virtualMachines",
+        "location": rng.choice(["westeurope", "eastus", "westus2"]),
+        "tags": {"environment": "prod", "owner": f"team-{rng.randrange(20)}"} if rng.random() < 0.5 else {},
+        "identity": {"type": "SystemAssigned", "principalId": f"{i:032x}", "tenantId": "0" * 32},
+        "properties": {
+            "vmId": f"{i:032x}",
+            "provisioningState": "Succeeded",
+            "hardwareProfile": {"vmSize": "Standard_D2s_v3"},
+            "storageProfile": {
+                "imageReference": {"publisher": "Canonical", "offer": "0001-com-ubuntu-server-jammy",
+                                   "sku": "22_04-lts-gen2", "version": "latest"},
+                "osDisk": {"osType": rng.choice(["Linux", "Windows"]), "name": f"vm{i}_OsDisk",
+                           "createOption": "FromImage", "caching": "ReadWrite", "diskSizeGB": 30,
+                           "managedDisk": {"storageAccountType": "Premium_LRS", "id": f"/disks/vm{i}_OsDisk"}},
+                "dataDisks": [],
+            },
+            "osProfile": {"computerName": f"vm{i}", "adminUsername": "azureuser",
+                          "linuxConfiguration": {"disablePasswordAuthentication": True}},
+            "networkProfile": {"networkInterfaces": [{"id": f"/networkInterfaces/vm{i}-nic"}]},
+        },
+    }
+
+def resident_bytes(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, kept
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rng = random.Random(0)
+    # Response bodies are parsed inside each measurement: the SDK model and
+    # ArmResource keep the parsed dicts alive, a projected record does not
+    bodies = [json.dumps(arm_payload(i, rng)) for i in range(count)]
+    projection = ResourceProjection(condition.field for condition in CONDITIONS)
+
+    sdk_bytes, sdk = resident_bytes(lambda: [GenericResource.deserialize(json.loads(b)) for b in bodies])
+    arm_bytes, arm = resident_bytes(lambda: [ArmResource(json.loads(b)) for b in bodies])
+    compact_bytes, compact = resident_bytes(lambda: [projection.project(ArmResource(json.loads(b))) for b in bodies])
+
+    evaluator = compile_conditions(CONDITIONS)
+    assert sum(map(evaluator, sdk)) == sum(map(evaluator, compact))
+    sdk_time = min(timeit.repeat(lambda: sum(map(evaluator, sdk)), number=1, repeat=3))
+    compact_time = min(timeit.repeat(lambda: sum(map(evaluator, compact)), number=1, repeat=3))
+
+    print(f"resources:        {count}")
+    print(f"GenericResource:  {sdk_bytes / count:8.0f} B/resource")
+    print(f"ArmResource:      {arm_bytes / count:8.0f} B/resource")
+    print(f"projected:        {compact_bytes / count:8.0f} B/resource")
+    print(f"reduction:        {sdk_bytes / compact_bytes:8.2f}x")
+    print(f"evaluate SDK:     {sdk_time / count * 1e9:8.1f} ns/resource")
+    print(f"evaluate record:  {compact_time / count * 1e9:8.1f} ns/resource")
+
+if __name__ == "__main__":
+    main()
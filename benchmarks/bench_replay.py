@@ -0,0 +1,37 @@
+"""Offline replay throughput over a captured synthetic inventory, binary and JSONL.
+
+    python -m benchmarks.bench_replay [resources] [policies] [workers]
+"""
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import MANAGEMENT_GROUP, SyntheticInventory, synthetic_policies
+from replay import ReplayEngine, capture
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    policy_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+    policies = synthetic_policies(policy_count)
+    print(f"resources: {count}, policies: {policy_count}, workers: {workers}")
+    with tempfile.TemporaryDirectory() as root:
+        for name in ("inventory.snap", "inventory.jsonl.gz"):
+            path = os.path.join(root, name)
+            started = time.perf_counter()
+            asyncio.run(capture(path, [f"mg:{MANAGEMENT_GROUP}"], SyntheticInventory(count)))
+            captured = time.perf_counter() - started
+            size = os.path.getsize(path) / 1024 ** 2
+            for run_workers in sorted({1, workers}):
+                report = ReplayEngine(path, workers=run_workers).run(policies)
+                hits = sum(hits.count for hits in report.hits.values())
+                print(f"{name:<20} capture {captured:6.2f} s, {size:7.1f} MB | workers {run_workers:>2}: "
+                      f"{count / report.seconds:10.0f} res/s, {hits} hits, {report.frames_skipped} frames skipped")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS: {peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024:.0f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""End-to-end benchmark suite over a synthetic inventory, with no Azure access.
+
+    python -m benchmarks.bench_suite [--resources 10000 100000] [--policies 1 10 50]
+                                     [--scenarios evaluate daemon remediation]
+                                     [--output results.json] [--compare baseline.json]
+
+Scenarios:
+  evaluate     PolicyEngine.evaluate_policy for every policy, cold then warm cache
+  daemon       PolicyDaemon cycles, one policy at a time and single-pass
+  remediation  one single-pass evaluation, then the remediation pool drained
+               against a fake ARM client with --arm-latency per call
+
+Each (scenario, resources, policies) point runs in a fresh process, so peak
+RSS belongs to that point alone. Results are written to
+benchmarks/results/<commit>.json by default; --compare prints the change
+against an earlier results file and exits non-zero on regressions.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.synthetic import FakeResourceManagementClient, SyntheticInventory, synthetic_policies
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": ordered[-1]}
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def make_engine(options: Dict[str, Any], inventory: SyntheticInventory, state_dir: str):
+    # Imported here so each worker process pays for its own imports
+    from policy_engine import PolicyEngine
+    engine = PolicyEngine(inventory.subscription_ids[0], inventory=inventory, state_dir=state_dir,
+                          condition_evaluator=options["evaluator"])
+    wire_fake_arm(engine, inventory, options)
+    return engine
+
+def wire_fake_arm(engine, inventory: SyntheticInventory, options: Dict[str, Any]):
+    for subscription_id in inventory.subscription_ids:
+        engine.remediation_clients[subscription_id] = FakeResourceManagementClient(
+            inventory, subscription_id, latency=options["arm_latency"])
+    pool = engine.remediation_pool
+    pool.subscription_rate = pool.subscription_burst = options["arm_rate"]
+    pool.provider_rate = pool.provider_burst = options["arm_rate"]
+
+async def drain(engine):
+    await engine.remediation_pool.join()
+
+def bench_evaluate(options: Dict[str, Any], resources: int, policy_count: int, state_dir: str) -> List[Dict[str, Any]]:
+    inventory = SyntheticInventory(resources, options["subscriptions"], options["seed"], page_delay=options["page_delay"])
+    engine = make_engine(options, inventory, state_dir)
+    policies = synthetic_policies(policy_count, seed=options["seed"])
+    # As the daemon does, so the projection is widened once rather than per policy
+    engine.register_policies(policies)
+    results = []
+
+    async def run():
+        for mode in ("cold", "warm"):
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(1 if mode == "cold" else options["repeat"]):
+                if mode == "cold":
+                    engine.resource_cache.clear()
+                for policy in policies:
+                    policy_started = time.perf_counter()
+                    await engine.evaluate_policy(policy)
+                    latencies.append(time.perf_counter() - policy_started)
+            elapsed = time.perf_counter() - started
+            cycles = 1 if mode == "cold" else options["repeat"]
+            results.append({"mode": mode, "seconds": elapsed, "resources_per_second": resources * cycles / elapsed,
+                            "latency": percentiles(latencies)})
+        await drain(engine)
+        await engine.close()
+
+    asyncio.run(run())
+    return results
+
+def bench_daemon(options: Dict[str, Any], resources: int, policy_count: int, state_dir: str) -> List[Dict[str, Any]]:
+    from policy_daemon import PolicyDaemon
+    inventory = SyntheticInventory(resources, options["subscriptions"], options["seed"], page_delay=options["page_delay"])
+    policies = synthetic_policies(policy_count, seed=options["seed"])
+    results = []
+    for single_pass in (False, True):
+        daemon = PolicyDaemon(inventory.subscription_ids[0], policies, single_pass=single_pass,
+                              inventory=inventory, state_dir=state_dir, condition_evaluator=options["evaluator"])
+        engine = daemon.policy_engine
+        wire_fake_arm(engine, inventory, options)
+        engine.register_policies(policies)
+        latencies = []
+        # Cycles print a summary line each; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                cycle_started = time.perf_counter()
+                daemon.loop.run_until_complete(daemon._run_policies(policies))
+                latencies.append(time.perf_counter() - cycle_started)
+            elapsed = time.perf_counter() - started
+            daemon.loop.run_until_complete(drain(engine))
+            daemon.loop.run_until_complete(engine.close())
+        daemon.loop.close()
+        results.append({"mode": "single_pass" if single_pass else "per_policy", "seconds": elapsed,
+                        "resources_per_second": resources * options["repeat"] / elapsed,
+                        "latency": percentiles(latencies)})
+    return results
+
+def bench_remediation(options: Dict[str, Any], resources: int, policy_count: int, state_dir: str) -> List[Dict[str, Any]]:
+    inventory = SyntheticInventory(resources, options["subscriptions"], options["seed"])
+    engine = make_engine(options, inventory, state_dir)
+    # Timed policies only record a first violation; remediate everything now
+    policies = synthetic_policies(policy_count, timed_fraction=0, seed=options["seed"])
+
+    async def run():
+        started = time.perf_counter()
+        report = await engine.evaluate_policies(policies)
+        evaluated = time.perf_counter()
+        await drain(engine)
+        drained = time.perf_counter()
+        # close() drops the clients, so count their calls first
+        calls = sum(sum(client.calls.values()) for client in engine.remediation_clients.values())
+        await engine.close()
+        return report, calls, started, evaluated, drained
+
+    report, calls, started, evaluated, drained = asyncio.run(run())
+    counters = engine.monitoring.get_counters()
+    completed = sum(counters.get(f"remediation_{status}", 0) for status in ("success", "failed", "superseded"))
+    # The monitoring ring keeps the most recent events, which is plenty for percentiles
+    durations = [metric.duration for metric in engine.monitoring.get_history()
+                 if metric.action in ("remediation", "immediate_remediation")]
+    elapsed = drained - started
+    return [{
+        "mode": "single_pass",
+        "seconds": elapsed,
+        "resources_per_second": resources / elapsed,
+        "violations": report.violation_count,
+        "remediations": completed,
+        "arm_calls": calls,
+        "remediations_per_second": completed / max(drained - evaluated, 1e-9),
+        # Queue wait is excluded: these are call durations as recorded by the pool
+        "latency": percentiles(durations),
+    }]
+
+SCENARIOS = {"evaluate": bench_evaluate, "daemon": bench_daemon, "remediation": bench_remediation}
+
+def run_point(scenario: str, options: Dict[str, Any], resources: int, policy_count: int) -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory() as state_dir:
+        results = SCENARIOS[scenario](options, resources, policy_count, state_dir)
+    rss = peak_rss_mb()
+    for result in results:
+        result.update(scenario=scenario, resources=resources, policies=policy_count, peak_rss_mb=rss)
+    return results
+
+def run_isolated(scenario: str, options: Dict[str, Any], resources: int, policy_count: int) -> List[Dict[str, Any]]:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_point, scenario, options, resources, policy_count).result()
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def point_key(result: Dict[str, Any]) -> tuple:
+    return result["scenario"], result["resources"], result["policies"], result["mode"]
+
+def print_results(results: List[Dict[str, Any]]):
+    print(f"{'scenario':<12} {'mode':<12} {'resources':>10} {'policies':>8} {'res/s':>12} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    for result in results:
+        latency = result["latency"]
+        print(f"{result['scenario']:<12} {result['mode']:<12} {result['resources']:>10} {result['policies']:>8} "
+              f"{result['resources_per_second']:>12.0f} {latency.get('p50', 0) * 1000:>9.2f} "
+              f"{latency.get('p99', 0) * 1000:>9.2f} {result['peak_rss_mb']:>8.0f}")
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """Print throughput and p99 changes against a baseline; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {point_key(result): result for result in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(point_key(result))
+        if before is None:
+            continue
+        throughput = result["resources_per_second"] / before["resources_per_second"] - 1
+        p99_before, p99_after = before["latency"].get("p99"), result["latency"].get("p99")
+        p99 = p99_after / p99_before - 1 if p99_before else 0.0
+        regressed = throughput < -threshold or p99 > threshold
+        regressions += regressed
+        print(f"  {' '.join(map(str, point_key(result))):<40} throughput {throughput:+7.1%}  p99 {p99:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--resources", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--policies", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["evaluate", "daemon", "remediation"])
+    parser.add_argument("--subscriptions", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="warm evaluations or daemon cycles per point")
+    parser.add_argument("--evaluator", choices=["compiled", "columnar"], default="compiled")
+    parser.add_argument("--page-delay", type=float, default=0.0, help="simulated seconds per listed page")
+    parser.add_argument("--arm-latency", type=float, default=0.005, help="simulated seconds per remediation call")
+    parser.add_argument("--arm-rate", type=float, default=10_000, help="token bucket rate and burst per subscription")
+    parser.add_argument("--in-process", action="store_true", help="run every point here; peak RSS then accumulates")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    options = {"subscriptions": args.subscriptions, "seed": args.seed, "repeat": args.repeat,
+               "evaluator": args.evaluator, "page_delay": args.page_delay,
+               "arm_latency": args.arm_latency, "arm_rate": args.arm_rate}
+    run = run_point if args.in_process else run_isolated
+    results: List[Dict[str, Any]] = []
+    for scenario in args.scenarios:
+        for resources in args.resources:
+            for policy_count in args.policies:
+                results.extend(run(scenario, options, resources, policy_count))
+    print_results(results)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"commit": commit, "timestamp": datetime.utcnow().isoformat(), "python": platform.python_version(),
+                   "options": options, "results": results}, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
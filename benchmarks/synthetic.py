@@ -0,0 +1,254 @@
+"""Deterministic synthetic Azure inventory and a fake ARM client for benchmarks.
+
+Resources are generated page by page from (seed, subscription, page), so any
+page can be rebuilt on demand and a 5M-resource inventory never has to exist
+in memory outside the engine's own cache. Type, location, tag and property
+frequencies are rough estimates of a typical enterprise tenant.
+"""
+import asyncio
+import random
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from inventory import ArmResource
+from policy_types import PolicyCondition, PolicyDefinition, RemediationAction, Scope, TimingConfig
+
+MANAGEMENT_GROUP = "bench-mg"
+
+# (type, weight)
+RESOURCE_TYPES: List[Tuple[str, float]] = [
+    ("Microsoft.Network/networkInterfaces", 18),
+    ("Microsoft.Compute/disks", 16),
+    ("Microsoft.Compute/virtualMachines", 12),
+    ("Microsoft.Storage/storageAccounts", 10),
+    ("Microsoft.Network/publicIPAddresses", 8),
+    ("Microsoft.Network/networkSecurityGroups", 7),
+    ("Microsoft.Web/sites", 6),
+    ("Microsoft.Sql/servers/databases", 5),
+    ("Microsoft.Network/virtualNetworks", 4),
+    ("Microsoft.KeyVault/vaults", 3),
+    ("Microsoft.Insights/components", 3),
+    ("Microsoft.ContainerRegistry/registries", 2),
+    ("Microsoft.Sql/servers", 2),
+    ("Microsoft.Web/serverFarms", 2),
+    ("Microsoft.Network/loadBalancers", 2),
+]
+
+LOCATIONS: List[Tuple[str, float]] = [
+    ("westeurope", 30), ("eastus", 25), ("northeurope", 12), ("eastus2", 10),
+    ("westus2", 8), ("uksouth", 6), ("southeastasia", 5), ("australiaeast", 4),
+]
+
+ENVIRONMENTS = ["prod", "dev", "test", "staging"]
+VM_SIZES = ["Standard_D2s_v3", "Standard_D4s_v3", "Standard_B2ms", "Standard_E8s_v4", "Standard_F4s_v2"]
+STORAGE_SKUS = ["Standard_LRS", "Standard_GRS", "Premium_LRS", "Standard_ZRS"]
+
+def _cumulative(weighted: List[Tuple[str, float]]) -> Tuple[List[str], List[float]]:
+    names, total, weights = [], 0.0, []
+    for name, weight in weighted:
+        total += weight
+        names.append(name)
+        weights.append(total)
+    return names, weights
+
+_TYPES = _cumulative(RESOURCE_TYPES)
+_LOCATIONS = _cumulative(LOCATIONS)
+
+def _tags(rng: random.Random) -> Dict[str, str]:
+    tags = {}
+    if rng.random() < 0.7:
+        tags["environment"] = rng.choice(ENVIRONMENTS)
+    if rng.random() < 0.45:
+        tags["owner"] = f"team-{int(rng.paretovariate(1.2)) % 60}"
+    if rng.random() < 0.3:
+        tags["costCenter"] = f"cc-{rng.randrange(200):03d}"
+    if rng.random() < 0.35:
+        tags["application"] = f"app-{rng.randrange(400)}"
+    if rng.random() < 0.1:
+        tags["hidden-link"] = "/subscriptions/x/resourceGroups/y"
+    return tags
+
+def _properties(rng: random.Random, resource_type: str, subscription_id: str, group: str) -> Dict[str, Any]:
+    prefix = f"/subscriptions/{subscription_id}/resourceGroups/{group}/providers"
+    if resource_type == "Microsoft.Network/networkInterfaces":
+        properties = {"enableAcceleratedNetworking": rng.random() < 0.4,
+                      "ipConfigurations": [{"name": "ipconfig1", "properties": {"privateIPAllocationMethod": "Dynamic"}}]}
+        if rng.random() < 0.85:
+            properties["virtualMachine"] = {"id": f"{prefix}/Microsoft.Compute/virtualMachines/vm{rng.randrange(10 ** 6)}"}
+        return properties
+    if resource_type == "Microsoft.Compute/disks":
+        return {"diskSizeGB": rng.choice([32, 64, 128, 256, 512, 1024]),
+                "diskState": "Attached" if rng.random() < 0.8 else "Unattached",
+                "encryption": {"type": "EncryptionAtRestWithPlatformKey" if rng.random() < 0.9 else "EncryptionAtRestWithCustomerKey"}}
+    if resource_type == "Microsoft.Compute/virtualMachines":
+        return {"hardwareProfile": {"vmSize": rng.choice(VM_SIZES)},
+                "storageProfile": {"osDisk": {"osType": "Linux" if rng.random() < 0.65 else "Windows"}},
+                "diagnosticsProfile": {"bootDiagnostics": {"enabled": rng.random() < 0.7}}}
+    if resource_type == "Microsoft.Storage/storageAccounts":
+        properties = {"supportsHttpsTrafficOnly": rng.random() < 0.92,
+                      "minimumTlsVersion": "TLS1_2" if rng.random() < 0.8 else "TLS1_0",
+                      "allowBlobPublicAccess": rng.random() < 0.15,
+                      "sku": rng.choice(STORAGE_SKUS),
+                      "encryption": {"services": {"blob": {"enabled": rng.random() < 0.97}}}}
+        if rng.random() < 0.25:
+            properties["accessKeys"] = {"key1": "redacted"}
+        return properties
+    if resource_type == "Microsoft.Web/sites":
+        return {"httpsOnly": rng.random() < 0.75, "siteConfig": {"minTlsVersion": "1.2" if rng.random() < 0.85 else "1.0"}}
+    if resource_type == "Microsoft.Sql/servers/databases":
+        properties = {"status": "Online", "maxSizeBytes": rng.choice([2, 32, 250]) * 1024 ** 3}
+        if rng.random() < 0.4:
+            properties["elasticPoolId"] = f"{prefix}/Microsoft.Sql/servers/sql1/elasticPools/pool1"
+        return properties
+    if resource_type == "Microsoft.KeyVault/vaults":
+        return {"enableSoftDelete": rng.random() < 0.9, "enablePurgeProtection": rng.random() < 0.5}
+    return {"provisioningState": "Succeeded"}
+
+class SyntheticInventory:
+    """Inventory client, in the shape of ArmInventoryClient, over a generated tenant.
+
+    Resource i belongs to subscription i % subscriptions. page_delay simulates
+    the round trip of one ARM page.
+    """
+
+    def __init__(self, resources: int = 10_000, subscriptions: int = 20, seed: int = 0,
+                 page_size: int = 1000, page_delay: float = 0.0):
+        self.resources = resources
+        self.subscription_ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(subscriptions)]
+        self.seed = seed
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.pages_served = 0
+
+    def subscription_size(self, subscription_id: str) -> int:
+        index = self.subscription_ids.index(subscription_id)
+        count = len(self.subscription_ids)
+        return (self.resources - index + count - 1) // count
+
+    def page(self, subscription_id: str, page_number: int) -> List[Dict[str, Any]]:
+        """ARM JSON for one page of a subscription's listing"""
+        index = self.subscription_ids.index(subscription_id)
+        start = page_number * self.page_size
+        stop = min(start + self.page_size, self.subscription_size(subscription_id))
+        rng = random.Random(f"{self.seed}:{index}:{page_number}")
+        items = []
+        for position in range(start, stop):
+            resource_type = rng.choices(_TYPES[0], cum_weights=_TYPES[1])[0]
+            group = f"rg-{rng.randrange(50)}"
+            name = f"{resource_type.rsplit('/', 1)[-1].lower()}-{position}"
+            items.append({
+                "id": f"/subscriptions/{subscription_id}/resourceGroups/{group}/providers/{resource_type}/{name}",
+                "name": name,
+                "type": resource_type,
+                "location": rng.choices(_LOCATIONS[0], cum_weights=_LOCATIONS[1])[0],
+                "tags": _tags(rng),
+                "properties": _properties(rng, resource_type, subscription_id, group),
+                "changedTime": "2026-01-01T00:00:00Z",
+            })
+        return items
+
+    async def list_subscription(self, subscription_id: str) -> AsyncIterator[List[ArmResource]]:
+        pages = -(-self.subscription_size(subscription_id) // self.page_size)
+        for page_number in range(pages):
+            if self.page_delay:
+                await asyncio.sleep(self.page_delay)
+            self.pages_served += 1
+            yield [ArmResource(item) for item in self.page(subscription_id, page_number)]
+
+    async def list_management_group(self, management_group_id: str) -> AsyncIterator[List[ArmResource]]:
+        for subscription_id in self.subscription_ids:
+            async for page in self.list_subscription(subscription_id):
+                yield page
+
+    async def close(self):
+        pass
+
+class FakePoller:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def result(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+class _Operations:
+    def __init__(self, client: "FakeResourceManagementClient"):
+        self.client = client
+
+    async def _start(self, name: str) -> FakePoller:
+        self.client.calls[name] = self.client.calls.get(name, 0) + 1
+        return FakePoller(self.client.latency)
+
+class _ResourceOperations(_Operations):
+    async def begin_update(self, **kwargs) -> FakePoller:
+        return await self._start("update")
+
+    async def begin_delete(self, **kwargs) -> FakePoller:
+        return await self._start("delete")
+
+    async def list(self) -> AsyncIterator[ArmResource]:
+        async for page in self.client.inventory.list_subscription(self.client.subscription_id):
+            for resource in page:
+                yield resource
+
+class _TagOperations(_Operations):
+    async def begin_create_or_update_at_scope(self, scope: str, parameters: Dict[str, Any]) -> FakePoller:
+        return await self._start("tag")
+
+class FakeResourceManagementClient:
+    """Stand-in for the async ResourceManagementClient of one subscription.
+
+    resources.list() serves the synthetic inventory. Remediation calls are
+    counted and return pollers that finish after latency seconds.
+    """
+
+    def __init__(self, inventory: SyntheticInventory, subscription_id: str, latency: float = 0.0):
+        self.inventory = inventory
+        self.subscription_id = subscription_id
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self.resources = _ResourceOperations(self)
+        self.tags = _TagOperations(self)
+
+    async def close(self):
+        pass
+
+# (resource type, conditions, remediation) templates; {k} varies per copy
+_POLICY_TEMPLATES = [
+    ("Microsoft.Storage/storageAccounts", [("properties.accessKeys", "exists", None)], "modify"),
+    ("Microsoft.Storage/storageAccounts", [("properties.minimumTlsVersion", "notEquals", "TLS1_2")], "modify"),
+    ("Microsoft.Compute/virtualMachines", [("tags.environment", "notExists", None)], "tag"),
+    ("Microsoft.Compute/virtualMachines", [("tags.owner", "equals", "team-{k}")], "tag"),
+    ("Microsoft.Compute/disks", [("properties.diskState", "equals", "Unattached")], "delete"),
+    ("Microsoft.Network/networkInterfaces", [("properties.virtualMachine", "notExists", None)], "delete"),
+    ("Microsoft.Web/sites", [("properties.httpsOnly", "equals", False)], "modify"),
+    ("Microsoft.Sql/servers/databases", [("properties.elasticPoolId", "notExists", None),
+                                         ("tags.environment", "in", ["dev", "test"])], "delete"),
+    ("Microsoft.KeyVault/vaults", [("properties.enablePurgeProtection", "equals", False)], "modify"),
+    ("Microsoft.Network/publicIPAddresses", [("tags.costCenter", "notExists", None),
+                                             ("location", "equals", "westeurope")], "tag"),
+]
+
+def synthetic_policies(count: int, timed_fraction: float = 0.2, seed: int = 0) -> List[PolicyDefinition]:
+    """count distinct policies scoped to the synthetic management group"""
+    rng = random.Random(seed)
+    policies = []
+    for k in range(count):
+        resource_type, conditions, action = _POLICY_TEMPLATES[k % len(_POLICY_TEMPLATES)]
+        variant = k // len(_POLICY_TEMPLATES)
+        parameters = {"modify": {"properties": {f"setting{variant}": True}},
+                      "tag": {f"policy-{k}": "flagged"},
+                      "delete": {}}[action]
+        timing = TimingConfig(delay="7d", warning_threshold="5d") if rng.random() < timed_fraction else None
+        policies.append(PolicyDefinition(
+            id=f"bench-{k}",
+            name=f"bench-{k}",
+            description=f"synthetic policy {k}",
+            resource_type=resource_type,
+            evaluation_frequency=5,
+            conditions=[PolicyCondition(field=field, operator=operator,
+                                        value=value.format(k=variant) if isinstance(value, str) else value)
+                        for field, operator, value in conditions],
+            remediation_action=RemediationAction(type=action, parameters=parameters, timing=timing),
+            scope=Scope(managementGroup=MANAGEMENT_GROUP)
+        ))
+    return policies
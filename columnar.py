@@ -0,0 +1,150 @@
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from condition_compiler import CompiledCondition, ConditionEvaluator, _make_accessor, _make_predicate
+
+_INVERT = bytes([1, 0]) + bytes(254)
+
+def _identity(value: Any) -> Any:
+    return value
+
+# Masks are NumPy bool arrays when NumPy is installed, otherwise bytes of 0/1
+# so that AND and lookups still run in C
+
+def _take(table: List[bool], codes: Any) -> Any:
+    if np is not None:
+        return np.asarray(table, dtype=bool)[codes]
+    lookup = bytes(table)
+    if isinstance(codes, bytes):
+        return codes.translate(lookup + bytes(256 - len(lookup)))
+    return bytes(map(lookup.__getitem__, codes))
+
+def _and(left: Any, right: Any) -> Any:
+    if np is not None:
+        return left & right
+    return (int.from_bytes(left, 'little') & int.from_bytes(right, 'little')).to_bytes(len(left), 'little')
+
+def _invert(mask: Any) -> Any:
+    if np is not None:
+        return ~mask
+    return mask.translate(_INVERT)
+
+def _ones(size: int) -> Any:
+    if np is not None:
+        return np.ones(size, dtype=bool)
+    return b'\x01' * size
+
+def _any(mask: Any) -> bool:
+    if np is not None:
+        return bool(mask.any())
+    return 1 in mask
+
+def _indices(mask: Any) -> List[int]:
+    if np is not None:
+        return np.flatnonzero(mask).tolist()
+    indices = []
+    i = mask.find(1)
+    while i != -1:
+        indices.append(i)
+        i = mask.find(1, i + 1)
+    return indices
+
+class Column:
+    """One field path across a batch, dictionary-encoded: codes index into values."""
+
+    __slots__ = ('values', 'codes', 'valid')
+
+    def __init__(self, raw: Sequence[Any]):
+        index: Dict[Tuple[type, Any], int] = {}
+        self.values: List[Any] = []
+        codes = array('I')
+        for value in raw:
+            # Keyed by type too, so 1, 1.0 and True stay distinct
+            key = (type(value), value)
+            try:
+                code = index.get(key)
+            except TypeError:
+                # Unhashable values (dicts, lists) each get their own code
+                key = code = None
+            if code is None:
+                code = len(self.values)
+                self.values.append(value)
+                if key is not None:
+                    index[key] = code
+            codes.append(code)
+        if np is not None:
+            self.codes = np.frombuffer(codes, dtype=np.uint32)
+        elif len(self.values) <= 256:
+            self.codes = bytes(codes.tolist())
+        else:
+            self.codes = codes
+        self.valid = _take([value is not None for value in self.values], self.codes)
+
+    def mask(self, predicate) -> Any:
+        return _take([bool(predicate(value)) for value in self.values], self.codes)
+
+class ColumnarBatch:
+    """Resources of one type as columns, evaluated a whole condition at a time.
+
+    A column is built the first time a field path is needed and is shared by
+    every policy that reads it. Each condition is tested once per distinct
+    value in its column, and the per-value results are spread back over the
+    batch as a mask. A policy's conditions are ANDed mask by mask.
+    """
+
+    def __init__(self, resources: Sequence[Any]):
+        self.resources = resources if isinstance(resources, list) else list(resources)
+        self.size = len(self.resources)
+        self.columns: Dict[Tuple[str, ...], Column] = {}
+        self._masks: Dict[Any, Any] = {}
+
+    def column(self, parts: Tuple[str, ...]) -> Column:
+        column = self.columns.get(parts)
+        if column is None:
+            column = self.columns[parts] = Column(list(map(_make_accessor(parts), self.resources)))
+        return column
+
+    def condition_mask(self, condition: CompiledCondition) -> Any:
+        try:
+            key = (condition.parts, condition.operator, type(condition.value), condition.value)
+            mask = self._masks.get(key)
+        except TypeError:
+            key = mask = None
+        if mask is not None:
+            return mask
+
+        column = self.column(condition.parts)
+        if condition.operator == 'exists':
+            mask = column.valid
+        elif condition.operator == 'notExists':
+            mask = _invert(column.valid)
+        else:
+            mask = column.mask(_make_predicate(condition.operator, _identity, condition.value))
+        if key is not None:
+            self._masks[key] = mask
+        return mask
+
+    def evaluate(self, evaluator: ConditionEvaluator) -> Any:
+        mask: Optional[Any] = None
+        for condition in evaluator.conditions:
+            condition_mask = self.condition_mask(condition)
+            mask = condition_mask if mask is None else _and(mask, condition_mask)
+            if not _any(mask):
+                break
+        return _ones(self.size) if mask is None else mask
+
+    def matching_indices(self, evaluator: ConditionEvaluator) -> List[int]:
+        if not self.size:
+            return []
+        return _indices(self.evaluate(evaluator))
+
+    def matches(self, evaluator: ConditionEvaluator) -> List[Any]:
+        return [self.resources[i] for i in self.matching_indices(evaluator)]
+
+    def __len__(self) -> int:
+        return self.size
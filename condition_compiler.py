@@ -0,0 +1,117 @@
+import re
+from typing import Any, Callable, List, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from policy_types import PolicyCondition
+
+# Operators are ranked so that cheap, selective tests run first and the
+# evaluator can short-circuit before reaching the expensive ones.
+OPERATOR_RANK = {
+    'equals': 0,
+    'in': 0,
+    'exists': 1,
+    'notExists': 1,
+    'notEquals': 2,
+    'contains': 3,
+    'matches': 4,
+}
+
+def resolve_path(obj: Any, parts: Tuple[str, ...]) -> Any:
+    for part in parts:
+        if obj is None:
+            return None
+        if isinstance(obj, dict):
+            obj = obj.get(part)
+        else:
+            obj = getattr(obj, part, None)
+    return obj
+
+def _make_accessor(parts: Tuple[str, ...]) -> Callable[[Any], Any]:
+    if len(parts) == 1:
+        name = parts[0]
+
+        def accessor(obj):
+            if isinstance(obj, dict):
+                return obj.get(name)
+            return getattr(obj, name, None)
+        return accessor
+
+    def accessor(obj):
+        return resolve_path(obj, parts)
+    return accessor
+
+def _make_predicate(operator: str, accessor: Callable[[Any], Any], expected: Any) -> Callable[[Any], bool]:
+    if operator == 'equals':
+        return lambda resource: accessor(resource) == expected
+    if operator == 'notEquals':
+        return lambda resource: accessor(resource) != expected
+    if operator == 'exists':
+        return lambda resource: accessor(resource) is not None
+    if operator == 'notExists':
+        return lambda resource: accessor(resource) is None
+    if operator == 'contains':
+        def contains(resource):
+            value = accessor(resource)
+            try:
+                return expected in value if value else False
+            except TypeError:
+                # Reordering may reach a non-container value that the declared
+                # order would have short-circuited past; treat it as no match
+                return False
+        return contains
+    if operator == 'in':
+        def in_(resource):
+            try:
+                return accessor(resource) in expected
+            except TypeError:
+                return False
+        return in_
+    if operator == 'matches':
+        pattern = re.compile(expected)
+
+        def matches(resource):
+            value = accessor(resource)
+            return isinstance(value, str) and pattern.search(value) is not None
+        return matches
+
+    return lambda resource: False
+
+class CompiledCondition:
+    __slots__ = ('field', 'parts', 'operator', 'value', 'accessor', 'predicate', 'rank')
+
+    def __init__(self, condition: 'PolicyCondition'):
+        self.field = condition.field
+        self.parts = tuple(condition.field.split('.'))
+        self.operator = condition.operator
+        self.value = condition.value
+        self.accessor = _make_accessor(self.parts)
+        self.predicate = _make_predicate(self.operator, self.accessor, self.value)
+        self.rank = OPERATOR_RANK.get(self.operator, len(OPERATOR_RANK))
+
+    def __call__(self, resource: Any) -> bool:
+        return self.predicate(resource)
+
+class ConditionEvaluator:
+    """A policy's conditions compiled into bound predicates, cheapest first."""
+
+    __slots__ = ('source', 'conditions', '_predicates')
+
+    def __init__(self, conditions: Sequence['PolicyCondition']):
+        self.source = list(conditions)
+        compiled = [CompiledCondition(condition) for condition in self.source]
+        # sorted() is stable, so ties keep their declaration order
+        self.conditions: List[CompiledCondition] = sorted(compiled, key=lambda c: (c.rank, len(c.parts)))
+        self._predicates = tuple(condition.predicate for condition in self.conditions)
+
+    def __call__(self, resource: Any) -> bool:
+        for predicate in self._predicates:
+            if not predicate(resource):
+                return False
+        return True
+
+    def __reduce__(self):
+        # Bound predicates are closures; rebuild them on the other side
+        return (ConditionEvaluator, (self.source,))
+
+def compile_conditions(conditions: Sequence['PolicyCondition']) -> ConditionEvaluator:
+    return ConditionEvaluator(conditions)
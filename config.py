@@ -1,14 +1,15 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import yaml
 
 class Config:
-    def __init__(self, config_file: str = "config.yaml"):
+    def __init__(self, config_file: Optional[str] = "config.yaml"):
         self.config: Dict[str, Any] = {}
-        self.load_config(config_file)
+        if config_file is not None:
+            self.load_config(config_file)
 
     def load_config(self, config_file: str):
         with open(config_file, 'r') as f:
-            self.config = yaml.safe_load(f)
+            self.config = yaml.safe_load(f) or {}
 
     @property
     def retry_attempts(self) -> int:
@@ -18,6 +19,23 @@ class Config:
     def cache_timeout(self) -> int:
         return self.config.get('cache_timeout', 300)
 
+    @property
+    def cache_stale_timeout(self) -> int:
+        return self.config.get('cache', {}).get('stale_timeout', 0)
+
+    @property
+    def cache_ttls(self) -> Dict[str, int]:
+        """Per-scope TTLs keyed by scope key ("mg:root") or scope kind ("sub:")"""
+        return self.config.get('cache', {}).get('ttls', {})
+
+    @property
+    def cache_max_entries(self) -> Optional[int]:
+        return self.config.get('cache', {}).get('max_entries')
+
+    @property
+    def cache_max_resources(self) -> Optional[int]:
+        return self.config.get('cache', {}).get('max_resources')
+
     @property
     def log_level(self) -> str:
         return self.config.get('log_level', 'INFO')
@@ -0,0 +1,94 @@
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from condition_compiler import ConditionEvaluator
+from resource_projection import ResourceRecord
+
+def fingerprint(resource: Any) -> Any:
+    """ARM's changedTime when the listing has it, else a hash of the projected fields"""
+    changed_time = getattr(resource, 'changed_time', None)
+    if changed_time is not None:
+        return changed_time
+    if not isinstance(resource, ResourceRecord):
+        return hash(repr(sorted(vars(resource).items())))
+    return hash(repr(tuple(getattr(resource, name) for name in resource.__fields__)))
+
+class PolicyResults:
+    __slots__ = ('evaluator', 'generation', 'violating')
+
+    def __init__(self, evaluator: ConditionEvaluator):
+        self.evaluator = evaluator
+        # Set once an evaluation has been applied; -1 means none has
+        self.generation = -1
+        # Insertion-ordered set of violating resource ids
+        self.violating: Dict[str, None] = {}
+
+class DeltaTracker:
+    """Successive snapshots of one scope, and what each policy last concluded about them.
+
+    Each new snapshot is compared with the previous one by resource id and
+    fingerprint, and starts a new generation. A policy whose results are from
+    an earlier generation that is still in the history only has to be run on
+    the resources changed since then.
+    """
+
+    def __init__(self, history: int = 16):
+        self.generation = 0
+        self.versions: Dict[str, Any] = {}
+        self.records: Dict[str, Any] = {}
+        self.history: Deque[Tuple[int, Set[str]]] = deque(maxlen=history)
+        self.results: Dict[str, PolicyResults] = {}
+        self._snapshot: Optional[weakref.ref] = None
+
+    def observe(self, snapshot: Iterable[Any]) -> List[Any]:
+        """Diff snapshot against the previous one; returns the resources that are gone"""
+        if self._snapshot is not None and self._snapshot() is snapshot:
+            return []
+        versions: Dict[str, Any] = {}
+        records: Dict[str, Any] = {}
+        changed: Set[str] = set()
+        previous = self.versions
+        for resource in snapshot:
+            resource_id = resource.id
+            version = versions[resource_id] = fingerprint(resource)
+            records[resource_id] = resource
+            if previous.get(resource_id) != version:
+                changed.add(resource_id)
+        removed = [resource for resource_id, resource in self.records.items() if resource_id not in records]
+        changed.update(resource.id for resource in removed)
+
+        self.generation += 1
+        self.history.append((self.generation, changed))
+        self.versions = versions
+        self.records = records
+        self._snapshot = weakref.ref(snapshot)
+        return removed
+
+    def changed_since(self, generation: int) -> Optional[Set[str]]:
+        """Ids added, modified or removed after generation, or None if that is no longer known"""
+        if generation == self.generation:
+            return set()
+        if generation < 0 or not self.history or generation < self.history[0][0] - 1:
+            return None
+        changed: Set[str] = set()
+        for entry_generation, ids in self.history:
+            if entry_generation > generation:
+                changed |= ids
+        return changed
+
+    def results_for(self, policy_id: str, evaluator: ConditionEvaluator) -> Tuple[PolicyResults, Optional[Set[str]]]:
+        """The policy's results and the ids to re-evaluate; None means all of them.
+
+        The caller sets results.generation once it has applied the evaluation.
+        """
+        results = self.results.get(policy_id)
+        if results is not None and results.evaluator is evaluator:
+            changed = self.changed_since(results.generation)
+            if changed is not None:
+                return results, changed
+        results = self.results[policy_id] = PolicyResults(evaluator)
+        return results, None
+
+    def forget(self, policy_id: str):
+        self.results.pop(policy_id, None)
@@ -0,0 +1,59 @@
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class DueIndex:
+    """Min-heap of state keys by the time their next warning or remediation is due.
+
+    A key has at most one live due time. Superseded heap entries are skipped
+    when they reach the top.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]] = ()):
+        self._heap: List[Tuple[str, str]] = []
+        self._due: Dict[str, str] = {}
+        self._changed = asyncio.Event()
+        for key, due in entries:
+            self.push(key, due)
+
+    def push(self, key: str, due: str):
+        # due is an ISO timestamp; these sort in time order as strings
+        if self._due.get(key) == due:
+            return
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+        self._changed.set()
+
+    def discard(self, key: str):
+        self._due.pop(key, None)
+
+    def _prune(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        self._prune()
+        return datetime.fromisoformat(self._heap[0][0]) if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[str]:
+        cutoff = now.isoformat()
+        keys = []
+        self._prune()
+        while self._heap and self._heap[0][0] <= cutoff:
+            due, key = heapq.heappop(self._heap)
+            del self._due[key]
+            keys.append(key)
+            self._prune()
+        return keys
+
+    async def wait(self, timeout: Optional[float]):
+        """Sleep for timeout seconds, or until an entry has been pushed since the last wait"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def __len__(self) -> int:
+        return len(self._due)
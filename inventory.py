@@ -0,0 +1,152 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import aiohttp
+
+ARM_ENDPOINT = "https://management.azure.com"
+ARM_SCOPE = "https://management.azure.com/.default"
+RESOURCES_API_VERSION = "2021-04-01"
+MANAGEMENT_GROUPS_API_VERSION = "2020-05-01"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def parse_resource_group(resource_id: str) -> Optional[str]:
+    parts = resource_id.split('/')
+    for i, part in enumerate(parts[:-1]):
+        if part.lower() == 'resourcegroups':
+            return parts[i + 1]
+    return None
+
+class ArmResource:
+    """A resource from an ARM listing, shaped like the SDK's GenericResource."""
+
+    __slots__ = ('id', 'name', 'type', 'location', 'kind', 'sku', 'tags', 'properties', 'resource_group', 'changed_time')
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data['id']
+        self.name = data.get('name')
+        self.type = data.get('type')
+        self.location = data.get('location')
+        self.kind = data.get('kind')
+        self.sku = data.get('sku')
+        self.tags = data.get('tags') or {}
+        self.properties = data.get('properties')
+        self.resource_group = parse_resource_group(self.id)
+        self.changed_time = data.get('changedTime')
+
+    def __repr__(self):
+        return f"ArmResource({self.id!r})"
+
+class ArmInventoryClient:
+    """Async ARM inventory listing over one pooled aiohttp session.
+
+    Pages are produced by background tasks into a bounded queue, so the next
+    page is already in flight while the caller evaluates the current one.
+    Management group listings fan out across the group's subscriptions.
+    """
+
+    def __init__(self, credential: Any, subscription_id: str, base_url: str = ARM_ENDPOINT,
+                 connection_limit: int = 64, prefetch_pages: int = 4, max_retries: int = 3,
+                 session: Optional[aiohttp.ClientSession] = None):
+        self.logger = getLogger(__name__)
+        self.credential = credential
+        self.subscription_id = subscription_id
+        self.base_url = base_url.rstrip('/')
+        self.connection_limit = connection_limit
+        self.prefetch_pages = prefetch_pages
+        self.max_retries = max_retries
+        self._session = session
+        self._owns_session = session is None
+        self._token = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._owns_session = True
+        return self._session
+
+    async def _headers(self) -> Dict[str, str]:
+        if self._token is None or self._token.expires_on - 60 < time.time():
+            self._token = await self.credential.get_token(ARM_SCOPE)
+        return {"Authorization": f"Bearer {self._token.token}"}
+
+    async def _get_json(self, url: str, params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            async with session.get(url, params=params, headers=await self._headers()) as response:
+                if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                    retry_after = float(response.headers.get('Retry-After', 2 ** attempt))
+                    self.logger.warning(f"ARM returned {response.status} for {url}, retrying in {retry_after}s")
+                    await asyncio.sleep(retry_after)
+                    continue
+                response.raise_for_status()
+                return await response.json()
+
+    async def _pages(self, url: str, params: Dict[str, str]) -> AsyncIterator[List[Dict[str, Any]]]:
+        while url:
+            body = await self._get_json(url, params)
+            yield body.get('value', [])
+            # nextLink already carries the query string
+            url, params = body.get('nextLink'), None
+
+    async def _prefetch(self, sources: List[Callable[[], AsyncIterator[List[Dict[str, Any]]]]]) -> AsyncIterator[List[ArmResource]]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch_pages)
+        done = object()
+
+        async def produce(source):
+            try:
+                async for page in source():
+                    await queue.put([ArmResource(item) for item in page])
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await queue.put(done)
+
+        producers = [asyncio.ensure_future(produce(source)) for source in sources]
+        remaining = len(producers)
+        try:
+            while remaining:
+                item = await queue.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for producer in producers:
+                producer.cancel()
+            await asyncio.gather(*producers, return_exceptions=True)
+
+    def _subscription_source(self, subscription_id: str):
+        url = f"{self.base_url}/subscriptions/{subscription_id}/resources"
+        # changedTime lets incremental evaluation skip resources that have not changed
+        return lambda: self._pages(url, {"api-version": RESOURCES_API_VERSION, "$expand": "changedTime"})
+
+    async def list_management_group_subscriptions(self, management_group_id: str) -> List[str]:
+        url = f"{self.base_url}/providers/Microsoft.Management/managementGroups/{management_group_id}/descendants"
+        subscriptions = []
+        async for page in self._pages(url, {"api-version": MANAGEMENT_GROUPS_API_VERSION}):
+            subscriptions.extend(
+                item['name'] for item in page
+                if item.get('type', '').lower().endswith('/subscriptions')
+            )
+        return subscriptions
+
+    def list_subscription(self, subscription_id: Optional[str] = None) -> AsyncIterator[List[ArmResource]]:
+        return self._prefetch([self._subscription_source(subscription_id or self.subscription_id)])
+
+    async def list_management_group(self, management_group_id: str) -> AsyncIterator[List[ArmResource]]:
+        subscriptions = await self.list_management_group_subscriptions(management_group_id)
+        async for page in self._prefetch([self._subscription_source(sub) for sub in subscriptions]):
+            yield page
+
+    async def close(self):
+        if self._session is not None and self._owns_session:
+            await self._session.close()
+        self._session = None
+        close_credential = getattr(self.credential, 'close', None)
+        if close_credential is not None:
+            await close_credential()
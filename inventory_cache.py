@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from services.monitoring_service import MonitoringService
+
+class CacheEntry:
+    __slots__ = ('value', 'fetched_at', 'size')
+
+    def __init__(self, value: Any, fetched_at: float, size: int):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.size = size
+
+class InventoryCache:
+    """Scope snapshots with per-scope TTLs, single-flight loads and LRU bounds.
+
+    A snapshot younger than its TTL is fresh. Up to stale_ttl seconds past
+    that it is still served, but a background refresh is started. Only one
+    load per key is in flight at a time, and other callers wait for it. The
+    least recently used snapshots are evicted once max_entries or
+    max_resources (summed over len() of the snapshots) is exceeded.
+    """
+
+    def __init__(self, default_ttl: float = 300, ttls: Optional[Dict[str, float]] = None,
+                 stale_ttl: float = 0, max_entries: Optional[int] = None, max_resources: Optional[int] = None,
+                 monitoring: Optional[MonitoringService] = None, clock: Callable[[], float] = time.monotonic):
+        self.logger = getLogger(__name__)
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_resources = max_resources
+        self.monitoring = monitoring
+        self.clock = clock
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_resources = 0
+        self.stats: Dict[str, int] = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+            'refreshes': 0, 'refresh_failures': 0, 'evictions': 0
+        }
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshes: Set[asyncio.Task] = set()
+
+    def _count(self, stat: str):
+        self.stats[stat] += 1
+        if self.monitoring is not None:
+            self.monitoring.increment(f"inventory_cache_{stat}")
+
+    def ttl_for(self, key: str) -> float:
+        # Exact scope key first ("mg:root"), then its kind prefix ("mg:"), then the default
+        if key in self.ttls:
+            return self.ttls[key]
+        prefix = key.split(':', 1)[0] + ':'
+        return self.ttls.get(prefix, self.default_ttl)
+
+    def peek(self, key: str) -> Optional[Any]:
+        """A fresh or stale snapshot without counting a hit or starting a refresh"""
+        entry = self.entries.get(key)
+        if entry is None or self.clock() - entry.fetched_at >= self.ttl_for(key) + self.stale_ttl:
+            return None
+        return entry.value
+
+    def get(self, key: str, refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        age = self.clock() - entry.fetched_at
+        ttl = self.ttl_for(key)
+        if age < ttl:
+            self.entries.move_to_end(key)
+            self._count('hits')
+            return entry.value
+        if age < ttl + self.stale_ttl and refresh is not None:
+            self.entries.move_to_end(key)
+            self._count('stale_hits')
+            self._refresh_in_background(key, refresh)
+            return entry.value
+        return None
+
+    def inflight(self, key: str) -> Optional[asyncio.Future]:
+        return self._inflight.get(key)
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Claim the load for key; callers must follow with complete() or fail()"""
+        self._count('misses')
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't let a failure surface as "never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    async def wait(self, future: asyncio.Future) -> Any:
+        self._count('coalesced')
+        return await asyncio.shield(future)
+
+    def complete(self, key: str, value: Any, future: Optional[asyncio.Future] = None):
+        """Finish the load begun as future; a load detached by invalidate() is handed to its waiters but not cached"""
+        current = self._inflight.get(key)
+        future = future or current
+        if future is current:
+            self.set(key, value)
+            self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    def fail(self, key: str, error: BaseException, future: Optional[asyncio.Future] = None):
+        current = self._inflight.get(key)
+        future = future or current
+        if future is current:
+            self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error if isinstance(error, Exception) else RuntimeError(f"Load of {key} abandoned"))
+
+    def _refresh_in_background(self, key: str, refresh: Callable[[], Awaitable[Any]]):
+        if key in self._inflight:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        async def run():
+            try:
+                value = await refresh()
+            except Exception as e:
+                self._count('refresh_failures')
+                self.logger.warning(f"Background refresh of {key} failed: {e}")
+                self.fail(key, e, future)
+                return
+            self._count('refreshes')
+            self.complete(key, value, future)
+
+        self._inflight[key] = future
+        task = asyncio.ensure_future(run())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def set(self, key: str, value: Any):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.total_resources -= previous.size
+        size = len(value) if hasattr(value, '__len__') else 1
+        self.entries[key] = CacheEntry(value, self.clock(), size)
+        self.total_resources += size
+        self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 1 and (
+                (self.max_entries is not None and len(self.entries) > self.max_entries) or
+                (self.max_resources is not None and self.total_resources > self.max_resources)):
+            key, entry = self.entries.popitem(last=False)
+            self.total_resources -= entry.size
+            self._count('evictions')
+            self.logger.info(f"Evicted inventory snapshot {key} ({entry.size} resources)")
+
+    def clear(self):
+        self.entries.clear()
+        self.total_resources = 0
+
+    def invalidate(self):
+        """Drop every snapshot and detach every load in flight, e.g. once they no longer hold the fields needed.
+
+        Callers already waiting on a detached load still get its result, but it
+        is not cached and later callers start a new load instead of joining it.
+        """
+        self.clear()
+        self._inflight.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def close(self):
+        for task in self._refreshes:
+            task.cancel()
+        await asyncio.gather(*self._refreshes, return_exceptions=True)
+        self._refreshes.clear()
@@ -0,0 +1,236 @@
+"""Recorded inventory listings, for replaying policies offline.
+
+Two formats, chosen by file name:
+
+- ``*.jsonl.gz`` / ``*.jsonl``: one ``{"scope": ..., "resource": ...}`` line per
+  resource. Easy to inspect and to produce with other tools, but it can only
+  be read front to back.
+- anything else (``*.snap``): a binary file of frames. Each frame holds up to
+  ``frame_resources`` resources of one scope and one resource type, as
+  zlib-compressed JSON behind a small header naming both. The reader
+  memory-maps the file and walks the headers, so frames of types that no
+  policy reads are skipped without being decompressed. Memory is bounded by
+  one frame, whatever the file size.
+
+Scopes are listing keys: ``mg:<management group>`` or ``sub:<subscription>``.
+"""
+import gzip
+import json
+import mmap
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from inventory import ArmResource
+
+MAGIC = b"PESNAP01"
+# payload bytes, scope bytes, type bytes, resources
+FRAME = struct.Struct("<IHHI")
+
+def is_jsonl(path: str) -> bool:
+    return str(path).endswith((".jsonl", ".jsonl.gz"))
+
+def resource_data(resource: Any) -> Dict[str, Any]:
+    """ARM JSON for a listed resource, as ArmResource would be built from it"""
+    if isinstance(resource, dict):
+        return resource
+    return {
+        "id": resource.id,
+        "name": getattr(resource, "name", None),
+        "type": resource.type,
+        "location": getattr(resource, "location", None),
+        "kind": getattr(resource, "kind", None),
+        "sku": getattr(resource, "sku", None),
+        "tags": getattr(resource, "tags", None) or {},
+        "properties": getattr(resource, "properties", None),
+        "changedTime": getattr(resource, "changed_time", None),
+    }
+
+@dataclass
+class Frame:
+    offset: int
+    length: int
+    scope: str
+    resource_type: str
+    resources: int
+
+class SnapshotWriter:
+    """Streams resources to a snapshot file, written to a temporary name and moved into place on close()"""
+
+    def __init__(self, path: str, frame_resources: int = 2000, compress_level: int = 6):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.jsonl = is_jsonl(path)
+        self.frame_resources = frame_resources
+        self.compress_level = compress_level
+        self.resources = 0
+        # (scope, type) -> resources waiting for a full frame
+        self._pending: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        if self.jsonl:
+            opener = gzip.open if self.path.name.endswith(".gz") else open
+            self._file = opener(self.tmp_path, "wt", encoding="utf-8")
+        else:
+            self._file = open(self.tmp_path, "wb")
+            self._file.write(MAGIC)
+
+    def write(self, scope: str, resources: Iterable[Any]):
+        for resource in resources:
+            data = resource_data(resource)
+            self.resources += 1
+            if self.jsonl:
+                self._file.write(json.dumps({"scope": scope, "resource": data}, separators=(",", ":")) + "\n")
+                continue
+            key = (scope, data.get("type") or "")
+            pending = self._pending.setdefault(key, [])
+            pending.append(data)
+            if len(pending) >= self.frame_resources:
+                self._write_frame(key, self._pending.pop(key))
+
+    def _write_frame(self, key: Tuple[str, str], resources: List[Dict[str, Any]]):
+        scope, resource_type = (part.encode("utf-8") for part in key)
+        payload = zlib.compress(json.dumps(resources, separators=(",", ":")).encode("utf-8"), self.compress_level)
+        self._file.write(FRAME.pack(len(payload), len(scope), len(resource_type), len(resources)))
+        self._file.write(scope)
+        self._file.write(resource_type)
+        self._file.write(payload)
+
+    def close(self):
+        for key, resources in self._pending.items():
+            self._write_frame(key, resources)
+        self._pending.clear()
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class SnapshotReader:
+    """Reads a snapshot written by SnapshotWriter as pages of ArmResource"""
+
+    def __init__(self, path: str, page_size: int = 2000):
+        self.path = Path(path)
+        self.jsonl = is_jsonl(path)
+        self.page_size = page_size
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        if not self.jsonl:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            if self._map[:len(MAGIC)] != MAGIC:
+                self.close()
+                raise ValueError(f"{self.path} is not an inventory snapshot")
+
+    def frames(self) -> Iterator[Frame]:
+        """Every frame's header, in file order; payloads are not read"""
+        data = self._map
+        offset = len(MAGIC)
+        end = len(data)
+        while offset < end:
+            if offset + FRAME.size > end:
+                raise ValueError(f"{self.path} is truncated at byte {offset}")
+            length, scope_length, type_length, resources = FRAME.unpack_from(data, offset)
+            start = offset + FRAME.size
+            scope = data[start:start + scope_length].decode("utf-8")
+            resource_type = data[start + scope_length:start + scope_length + type_length].decode("utf-8")
+            payload = start + scope_length + type_length
+            if payload + length > end:
+                raise ValueError(f"{self.path} is truncated at byte {offset}")
+            yield Frame(payload, length, scope, resource_type, resources)
+            offset = payload + length
+
+    def read_frame(self, frame: Frame) -> List[ArmResource]:
+        payload = zlib.decompress(self._map[frame.offset:frame.offset + frame.length])
+        return [ArmResource(item) for item in json.loads(payload)]
+
+    def _jsonl_pages(self, scopes: Optional[Collection[str]],
+                     types: Optional[Collection[str]]) -> Iterator[Tuple[str, List[ArmResource]]]:
+        opener = gzip.open if self.path.name.endswith(".gz") else open
+        page: List[ArmResource] = []
+        page_scope = None
+        with opener(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                scope, data = entry["scope"], entry["resource"]
+                if (scopes is not None and scope not in scopes) or (types is not None and data.get("type") not in types):
+                    continue
+                if page and (scope != page_scope or len(page) >= self.page_size):
+                    yield page_scope, page
+                    page = []
+                page_scope = scope
+                page.append(ArmResource(data))
+        if page:
+            yield page_scope, page
+
+    def pages(self, scopes: Optional[Collection[str]] = None,
+              types: Optional[Collection[str]] = None) -> Iterator[Tuple[str, List[ArmResource]]]:
+        """(scope, resources) in file order, limited to the given scopes and resource types"""
+        if self.jsonl:
+            yield from self._jsonl_pages(scopes, types)
+            return
+        for frame in self.frames():
+            if (scopes is not None and frame.scope not in scopes) or (types is not None and frame.resource_type not in types):
+                continue
+            yield frame.scope, self.read_frame(frame)
+
+    def scopes(self) -> Dict[str, int]:
+        """scope -> number of resources recorded for it"""
+        counts: Dict[str, int] = {}
+        if self.jsonl:
+            for scope, page in self._jsonl_pages(None, None):
+                counts[scope] = counts.get(scope, 0) + len(page)
+        else:
+            for frame in self.frames():
+                counts[frame.scope] = counts.get(frame.scope, 0) + frame.resources
+        return counts
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class RecordingInventory:
+    """Wraps an inventory client and writes every page it lists to a SnapshotWriter"""
+
+    def __init__(self, inventory: Any, writer: SnapshotWriter):
+        self.inventory = inventory
+        self.writer = writer
+
+    async def _record(self, scope: str, pages: AsyncIterator[List[Any]]) -> AsyncIterator[List[Any]]:
+        async for page in pages:
+            self.writer.write(scope, page)
+            yield page
+
+    def list_subscription(self, subscription_id: Optional[str] = None) -> AsyncIterator[List[Any]]:
+        subscription_id = subscription_id or self.inventory.subscription_id
+        return self._record(f"sub:{subscription_id}", self.inventory.list_subscription(subscription_id))
+
+    def list_management_group(self, management_group_id: str) -> AsyncIterator[List[Any]]:
+        return self._record(f"mg:{management_group_id}", self.inventory.list_management_group(management_group_id))
+
+    async def close(self):
+        await self.inventory.close()
@@ -1,15 +1,64 @@
 import threading
-import time
 import asyncio
-from typing import List
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
 from policy_engine import PolicyEngine
+from policy_scheduler import PolicyScheduler
 from policy_types import PolicyDefinition
+from services.metrics import MetricsServer
+from tracing import tracer
+
+@dataclass
+class PolicyDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+def diff_policies(current: Dict[str, PolicyDefinition], policies: List[PolicyDefinition]) -> PolicyDiff:
+    diff = PolicyDiff()
+    incoming = {policy.id for policy in policies}
+    for policy in policies:
+        existing = current.get(policy.id)
+        if existing is None:
+            diff.added.append(policy.id)
+        elif existing != policy:
+            diff.changed.append(policy.id)
+    diff.removed = [policy_id for policy_id in current if policy_id not in incoming]
+    return diff
 
 class PolicyDaemon:
-    def __init__(self, subscription_id: str, policies: List[PolicyDefinition], cloud_provider: str = 'azure', management_group_id: str = None):
-        self.policy_engine = PolicyEngine(subscription_id, cloud_provider, management_group_id)
+    def __init__(self, subscription_id: str, policies: List[PolicyDefinition], cloud_provider: str = 'azure', management_group_id: str = None,
+                 single_pass: bool = False, max_concurrency: int = 8, start_jitter: float = 30.0,
+                 metrics_port: Optional[int] = None, metrics_host: str = "127.0.0.1",
+                 policy_source: Optional[Any] = None, reload_interval: float = 10.0,
+                 **engine_options):
+        # engine_options are passed through to PolicyEngine (streaming, state_backend, ...)
+        self.policy_engine = PolicyEngine(
+            subscription_id,
+            management_group_id=management_group_id,
+            cloud_provider=cloud_provider,
+            **engine_options
+        )
         self.policies = policies
-        self.threads: List[threading.Thread] = []
+        self.single_pass = single_pass
+        self.scheduler = PolicyScheduler(
+            self._run_policies,
+            max_concurrency=max_concurrency,
+            start_jitter=start_jitter,
+            batch=single_pass
+        )
+        # Prometheus scrape endpoint, only served when a port is given
+        self.metrics_server = (MetricsServer(self.policy_engine.monitoring, metrics_host, metrics_port)
+                               if metrics_port is not None else None)
+        # Polled every reload_interval seconds; see policy_loader.PolicySource
+        self.policy_source = policy_source
+        self.reload_interval = reload_interval
+        self._fingerprint: Any = None
+        self._reload_requested: Optional[asyncio.Event] = None
+        self.thread: Optional[threading.Thread] = None
         self.running = False
         self.loop = asyncio.new_event_loop()
 
@@ -19,29 +68,136 @@ class PolicyDaemon:
         except Exception as e:
             print(f"Error evaluating policy {policy.id}: {e}")
 
-    def _policy_loop(self, policy: PolicyDefinition):
-        asyncio.set_event_loop(self.loop)
-        while self.running:
+    async def _evaluate_policies(self, policies: List[PolicyDefinition]):
+        try:
+            report = await self.policy_engine.evaluate_policies(policies)
+            print(f"Evaluated {report.policies_evaluated} policies over {report.resources_scanned} resources: "
+                  f"{report.violation_count} violations")
+        except Exception as e:
+            print(f"Error evaluating policies {[policy.id for policy in policies]}: {e}")
+
+    async def _run_policies(self, policies: List[PolicyDefinition]):
+        with tracer.span("daemon_cycle", root=True, policies=len(policies), single_pass=self.single_pass):
+            if self.single_pass:
+                await self._evaluate_policies(policies)
+            else:
+                for policy in policies:
+                    await self._evaluate_policy(policy)
+
+    async def _due_actions_loop(self):
+        # Wakes when the earliest warning or delayed remediation is due, or when
+        # an evaluation schedules an earlier one; the hourly cap is a safety net
+        while True:
             try:
-                self.loop.run_until_complete(self._evaluate_policy(policy))
-                time.sleep(policy.evaluation_frequency * 60)
+                with tracer.span("due_actions", root=True):
+                    await self.policy_engine.process_due_actions()
             except Exception as e:
-                print(f"Error in policy loop for {policy.id}: {e}")
-                time.sleep(60)  # Wait before retry
+                print(f"Error processing due remediation actions: {e}")
+            delay = self.policy_engine.seconds_until_due()
+            await self.policy_engine.due_index.wait(3600 if delay is None else min(delay, 3600))
+
+    def apply_policies(self, policies: List[PolicyDefinition]) -> PolicyDiff:
+        """Make policies the running set, touching only those that were added, removed or changed.
+
+        Unchanged policies keep their definition object, compiled conditions and
+        schedule. Caches, in-flight remediations and the pending state of
+        policies that stay are kept; a removed policy's state is dropped.
+        Must be called on the daemon's loop once it is running.
+        """
+        current = {policy.id: policy for policy in self.policies}
+        diff = diff_policies(current, policies)
+        if not diff:
+            return diff
+        changed = set(diff.added) | set(diff.changed)
+        merged = [policy if policy.id in changed else current[policy.id] for policy in policies]
+        fresh = [policy for policy in merged if policy.id in changed]
+        self.policy_engine.register_policies(fresh)
+        for policy_id in diff.removed:
+            self.scheduler.remove(policy_id)
+            self.policy_engine.unregister_policy(policy_id)
+        for policy in fresh:
+            self.scheduler.add(policy)
+        self.policies = merged
+        return diff
+
+    async def reload(self) -> Optional[PolicyDiff]:
+        """Load the policy source off the loop and apply it; a bad update leaves the running set as it was"""
+        loop = asyncio.get_running_loop()
+        try:
+            policies = await loop.run_in_executor(None, self.policy_source.load)
+        except Exception as e:
+            print(f"Rejected policy update from {self.policy_source.path}: {e}")
+            self.policy_engine.monitoring.increment("policy_reload_rejected")
+            return None
+        diff = self.apply_policies(policies)
+        self.policy_engine.monitoring.increment("policy_reload")
+        if diff:
+            print(f"Reloaded policies: {len(diff.added)} added, {len(diff.removed)} removed, "
+                  f"{len(diff.changed)} changed")
+        return diff
+
+    def request_reload(self):
+        """Reload now instead of at the next poll; safe to call from any thread"""
+        if self._reload_requested is not None:
+            self.loop.call_soon_threadsafe(self._reload_requested.set)
+
+    async def _watch_policies(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._reload_requested.wait(), self.reload_interval)
+            except asyncio.TimeoutError:
+                pass
+            forced = self._reload_requested.is_set()
+            self._reload_requested.clear()
+            fingerprint = await loop.run_in_executor(None, self.policy_source.fingerprint)
+            if fingerprint == self._fingerprint and not forced:
+                continue
+            # Recorded even when the update is rejected, so it is not retried until the files change again
+            self._fingerprint = fingerprint
+            await self.reload()
+
+    async def _run(self):
+        due_actions = asyncio.ensure_future(self._due_actions_loop())
+        background = [due_actions]
+        if self.policy_source is not None:
+            background.append(asyncio.ensure_future(self._watch_policies()))
+        try:
+            await self.scheduler.run()
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._run())
+        except Exception as e:
+            print(f"Error in scheduler loop: {e}")
+        finally:
+            self.loop.run_until_complete(self.policy_engine.close())
 
     def start(self):
         self.running = True
+        if self.policy_source is not None:
+            self._fingerprint = self.policy_source.fingerprint()
+            # Created before the loop runs, so request_reload() right after start() is not lost
+            self._reload_requested = asyncio.Event()
+        self.policy_engine.register_policies(self.policies)
         for policy in self.policies:
-            thread = threading.Thread(
-                target=self._policy_loop,
-                args=(policy,),
-                daemon=True
-            )
-            thread.start()
-            self.threads.append(thread)
+            self.scheduler.add(policy)
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
 
     def stop(self):
         self.running = False
-        for thread in self.threads:
-            thread.join()
-        self.threads.clear()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.scheduler.stop)
+        self.thread.join()
+        self.thread = None
@@ -1,82 +1,432 @@
-import json
+import asyncio
+import re
+import time
+import weakref
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, FrozenSet, Iterable, Iterator, List, MutableMapping, Optional, Set, Tuple
 from logging import getLogger
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from tenacity import retry, stop_after_attempt, wait_exponential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.mgmt.resource.resources.aio import ResourceManagementClient as AsyncResourceManagementClient
 
-from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+from columnar import ColumnarBatch
+from condition_compiler import resolve_path
+from config import Config
+from delta_inventory import DeltaTracker, PolicyResults
+from due_index import DueIndex
+from inventory import ArmInventoryClient
+from inventory_cache import InventoryCache
+from predicate_index import PredicateIndex
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, Scope
+from remediation import RemediationPool, RemediationTask, subscription_of
+from resource_index import ResourceIndex
+from resource_projection import ResourceProjection, referenced_paths
+from state_store import open_state_store
+from tracing import tracer
 from services.monitoring_service import MonitoringService, MetricData
 
+@dataclass
+class EvaluationReport:
+    # resource id -> ids of the policies it violated
+    violations: Dict[str, List[str]] = field(default_factory=dict)
+    errors: Dict[str, List[str]] = field(default_factory=dict)
+    scopes_listed: int = 0
+    resources_scanned: int = 0
+    policies_evaluated: int = 0
+    # Incremental evaluation: (resource, policy) results carried over unchanged
+    resources_reused: int = 0
+    violation_count: int = 0
+    # Streaming evaluation only counts violations so memory stays bounded
+    keep_violations: bool = True
+
+    def record_violation(self, resource_id: str, policy_id: str):
+        self.violation_count += 1
+        if self.keep_violations:
+            self.violations.setdefault(resource_id, []).append(policy_id)
+
+    def record_error(self, resource_id: str, policy_id: str):
+        self.errors.setdefault(resource_id, []).append(policy_id)
+
 class PolicyEngine:
-    def __init__(self, subscription_id: str, management_group_id: str = None, cloud_provider: str = "azure"):
+    def __init__(self, subscription_id: str, management_group_id: str = None, cloud_provider: str = "azure",
+                 inventory: Any = None, streaming: bool = False, stream_window: int = 1000,
+                 remediation_workers: int = 8, state_backend: str = "sqlite", state_fsync: str = "normal",
+                 state_dir: str = "./state", config: Optional[Config] = None,
+                 condition_evaluator: str = "compiled", incremental: bool = False,
+                 coalesce_window: float = 0.0, due_retry_backoff: float = 60.0,
+                 due_retry_backoff_max: float = 3600.0):
         self.logger = getLogger(__name__)
         self.management_group_id = management_group_id
-        self.credential = DefaultAzureCredential()
-        self.client = ResourceManagementClient(self.credential, subscription_id)
+        self.inventory = inventory or ArmInventoryClient(AsyncDefaultAzureCredential(), subscription_id)
         self.subscription_id = subscription_id
-        self.state_file = Path("./state/remediation_state.json")
-        self.state_file.parent.mkdir(exist_ok=True)
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(exist_ok=True)
+        self.state_backend = state_backend
+        self.state_fsync = state_fsync
         self.remediation_state = self._load_state()
         self.monitoring = MonitoringService()
-        self.resource_cache = {}
-        self.cache_timeout = timedelta(seconds=300)
+        self.config = config or Config(None)
+        self.resource_cache = InventoryCache(
+            default_ttl=self.config.cache_timeout,
+            ttls=self.config.cache_ttls,
+            stale_ttl=self.config.cache_stale_timeout,
+            max_entries=self.config.cache_max_entries,
+            max_resources=self.config.cache_max_resources,
+            monitoring=self.monitoring
+        )
+        # Cached resources keep only the fields that registered policies read
+        self.projection = ResourceProjection()
+        if condition_evaluator not in ("compiled", "columnar"):
+            raise ValueError(f"Unknown condition evaluator: {condition_evaluator}")
+        self.columnar = condition_evaluator == "columnar"
+        # Columns built for a cached snapshot live as long as the snapshot does
+        self._batches: "weakref.WeakKeyDictionary[ResourceIndex, Dict[str, ColumnarBatch]]" = weakref.WeakKeyDictionary()
+        self.incremental = incremental
+        self.deltas: Dict[str, DeltaTracker] = {}
+        self.streaming = streaming
+        self.stream_window = stream_window
+        self.async_credential = None
+        self.remediation_clients: Dict[str, AsyncResourceManagementClient] = {}
+        self.remediation_pool = RemediationPool(self._apply_remediation, self.monitoring, workers=remediation_workers,
+                                                coalesce_window=coalesce_window)
+        self.policies: Dict[str, PolicyDefinition] = {}
+        self.due_index = DueIndex(self.remediation_state.due_entries())
+        # A due action that raises is retried after due_retry_backoff seconds,
+        # doubling with each failure up to due_retry_backoff_max
+        self.due_retry_backoff = due_retry_backoff
+        self.due_retry_backoff_max = due_retry_backoff_max
 
-    def _load_state(self) -> Dict:
-        if self.state_file.exists():
-            with open(self.state_file, 'r') as f:
-                return json.load(f)
-        return {}
+    def _load_state(self) -> MutableMapping[str, Dict]:
+        # Entries are read lazily; a legacy JSON state file is migrated once
+        return open_state_store(self.state_backend, self.state_dir, self.state_fsync)
 
     def _save_state(self):
-        with open(self.state_file, 'w') as f:
-            json.dump(self.remediation_state, f)
+        # Commits every change buffered since the last call in one batch
+        with tracer.span("save_state"):
+            self.remediation_state.flush()
 
     def _get_resource_key(self, resource: Any) -> str:
         return f"{resource.id}:{resource.type}"
 
-    def _get_cache(self, key: str):
-        cached = self.resource_cache.get(key)
-        if cached:
-            timestamp, resources = cached
-            if datetime.utcnow() - timestamp < self.cache_timeout:
-                return resources
-        return None
+    def _get_scope_key(self, scope: Optional[Scope]) -> str:
+        # Check for defined scope
+        if scope and scope.managementGroup:
+            return f"mg:{scope.managementGroup}"
+        elif scope and scope.subscription:
+            return f"sub:{scope.subscription}"
+        return "all"
+
+    def _list_scope(self, scope: Optional[Scope]) -> AsyncIterator[List[Any]]:
+        if scope and scope.managementGroup:
+            return self.inventory.list_management_group(scope.managementGroup)
+        elif scope and scope.subscription:
+            return self.inventory.list_subscription(scope.subscription)
+        return self.inventory.list_subscription(self.subscription_id)
 
-    def _set_cache(self, key: str, resources: List[Any]):
-        self.resource_cache[key] = (datetime.utcnow(), resources)
+    def _ensure_projection(self, policies: Iterable[PolicyDefinition]):
+        paths = referenced_paths(policies)
+        if self.projection.covers(paths):
+            return
+        self.projection = self.projection.widen(paths)
+        # Snapshots cached or being listed were projected without the new fields
+        self.resource_cache.invalidate()
+
+    async def _load_snapshot(self, scope: Optional[Scope]) -> ResourceIndex:
+        snapshot = ResourceIndex()
+        async for page in tracer.traced("list_page", self._list_scope(scope), scope=self._get_scope_key(scope)):
+            snapshot.merge(ResourceIndex(self.projection.project_all(page)))
+        return snapshot
+
+    async def _scope_pages(self, scope: Optional[Scope]) -> AsyncIterator[ResourceIndex]:
+        # A cached (or stale, while it refreshes) snapshot comes back as one index.
+        # On a miss the first caller lists the scope and gets each page as soon as
+        # it arrives; concurrent callers for the same scope wait for its snapshot
+        cache_key = self._get_scope_key(scope)
+        resources = self.resource_cache.get(cache_key, refresh=lambda: self._load_snapshot(scope))
+        if resources is not None:
+            yield resources
+            return
+
+        pending = self.resource_cache.inflight(cache_key)
+        if pending is not None:
+            yield await self.resource_cache.wait(pending)
+            return
+
+        load = self.resource_cache.begin(cache_key)
+        snapshot = ResourceIndex()
+        try:
+            async for page in tracer.traced("list_page", self._list_scope(scope), scope=cache_key):
+                page_index = ResourceIndex(self.projection.project_all(page))
+                snapshot.merge(page_index)
+                yield page_index
+        except BaseException as e:
+            self.resource_cache.fail(cache_key, e, load)
+            raise
+        # Not cached if the projection was widened meanwhile; the early pages lack the new fields
+        self.resource_cache.complete(cache_key, snapshot, load)
 
     async def evaluate_policy(self, policy: PolicyDefinition) -> None:
-        # Check for defined scope
-        if policy.scope and policy.scope.managementGroup:
-            cache_key = f"mg:{policy.scope.managementGroup}"
-            resources = self._get_cache(cache_key)
-            if not resources:
-                resources = list(self.client.resources.list_by_management_group(policy.scope.managementGroup))
-                self._set_cache(cache_key, resources)
-        elif policy.scope and policy.scope.subscription:
-            cache_key = f"sub:{policy.scope.subscription}"
-            resources = self._get_cache(cache_key)
-            if not resources:
-                resources = list(self.client.resources.list_by_subscription(policy.scope.subscription))
-                self._set_cache(cache_key, resources)
-        else:
-            cache_key = "all"
-            resources = self._get_cache(cache_key)
-            if not resources:
-                resources = list(self.client.resources.list())
-                self._set_cache(cache_key, resources)
-        
-        for resource in resources:
-            if resource.type == policy.resource_type:
-                if self._evaluate_conditions(resource, policy.conditions):
+        if self.streaming:
+            await self.evaluate_streaming([policy])
+            return
+        self.register_policies([policy])
+        index = PredicateIndex([(policy, policy.evaluator)])
+        timed = policy.remediation_action.timing is not None
+        violating: Set[str] = set()
+        started = time.monotonic()
+        with tracer.span("evaluate_policy", policy_id=policy.id, scope=self._get_scope_key(policy.scope)):
+            try:
+                with self.remediation_pool.coalescing():
+                    async for resource, _ in self._scope_matches(policy.scope, {policy.resource_type: index}):
+                        if timed:
+                            violating.add(self._get_resource_key(resource))
+                        await self._handle_remediation(resource, policy)
+                self._sweep_timed([policy], {policy.id: violating})
+            finally:
+                self._save_state()
+                self.monitoring.observe("policy_evaluation", time.monotonic() - started, policy.id)
+
+    def _group_policies(self, policies: Iterable[PolicyDefinition]) -> Dict[str, Dict[str, List[PolicyDefinition]]]:
+        groups: Dict[str, Dict[str, List[PolicyDefinition]]] = {}
+        for policy in policies:
+            by_type = groups.setdefault(self._get_scope_key(policy.scope), {})
+            by_type.setdefault(policy.resource_type, []).append(policy)
+        return groups
+
+    def _type_evaluators(self, by_type: Dict[str, List[PolicyDefinition]]) -> Dict[str, PredicateIndex[PolicyDefinition]]:
+        return {
+            resource_type: PredicateIndex([(policy, policy.evaluator) for policy in type_policies])
+            for resource_type, type_policies in by_type.items()
+        }
+
+    def _batch(self, resources: ResourceIndex, resource_type: str) -> ColumnarBatch:
+        batches = self._batches.get(resources)
+        if batches is None:
+            batches = self._batches[resources] = {}
+        batch = batches.get(resource_type)
+        if batch is None:
+            batch = batches[resource_type] = ColumnarBatch(resources.for_type(resource_type))
+        return batch
+
+    def _matches(self, resources: ResourceIndex, resource_type: str,
+                 index: PredicateIndex[PolicyDefinition]) -> Iterator[Tuple[Any, PolicyDefinition]]:
+        """(resource, policy) for every violation, by resource and then by policy"""
+        candidates = resources.for_type(resource_type)
+        entries = index.entries
+        if not self.columnar:
+            for resource in candidates:
+                for position in index.match(resource):
+                    yield resource, entries[position][0]
+            return
+        batch = self._batch(resources, resource_type)
+        hits = sorted((i, j) for j, (_, evaluator) in enumerate(entries) for i in batch.matching_indices(evaluator))
+        for i, j in hits:
+            yield candidates[i], entries[j][0]
+
+    async def _scope_matches(self, scope: Optional[Scope], type_evaluators: Dict[str, PredicateIndex[PolicyDefinition]],
+                             report: Optional[EvaluationReport] = None) -> AsyncIterator[Tuple[Any, PolicyDefinition]]:
+        if self.incremental:
+            for match in await self._incremental_matches(scope, type_evaluators, report):
+                yield match
+            return
+        async for resources in self._scope_pages(scope):
+            for resource_type, index in type_evaluators.items():
+                candidates = len(resources.for_type(resource_type))
+                if report is not None:
+                    report.resources_scanned += candidates
+                # Matched in full before yielding, so the span times only the conditions
+                with tracer.span("match_conditions", resource_type=resource_type, resources=candidates,
+                                 policies=len(index.entries)):
+                    matches = list(self._matches(resources, resource_type, index))
+                for match in matches:
+                    yield match
+
+    async def _scope_snapshot(self, scope: Optional[Scope]) -> ResourceIndex:
+        pages = [resources async for resources in self._scope_pages(scope)]
+        cached = self.resource_cache.peek(self._get_scope_key(scope))
+        if cached is not None:
+            return cached
+        snapshot = ResourceIndex()
+        for page in pages:
+            snapshot.merge(page)
+        return snapshot
+
+    async def _incremental_matches(self, scope: Optional[Scope], type_evaluators: Dict[str, PredicateIndex[PolicyDefinition]],
+                                   report: Optional[EvaluationReport] = None) -> List[Tuple[Any, PolicyDefinition]]:
+        """Violations from a full snapshot, re-running conditions only where a resource changed"""
+        scope_key = self._get_scope_key(scope)
+        snapshot = await self._scope_snapshot(scope)
+        with tracer.span("match_incremental", scope=scope_key):
+            return self._diff_matches(scope_key, snapshot, type_evaluators, report)
+
+    def _diff_matches(self, scope_key: str, snapshot: ResourceIndex,
+                      type_evaluators: Dict[str, PredicateIndex[PolicyDefinition]],
+                      report: Optional[EvaluationReport]) -> List[Tuple[Any, PolicyDefinition]]:
+        tracker = self.deltas.get(scope_key)
+        if tracker is None:
+            tracker = self.deltas[scope_key] = DeltaTracker()
+        for resource in tracker.observe(snapshot):
+            self._forget_resource(resource)
+
+        matches: List[Tuple[Any, PolicyDefinition]] = []
+        for resource_type, index in type_evaluators.items():
+            candidates = snapshot.for_type(resource_type)
+            if report is not None:
+                report.resources_scanned += len(candidates)
+            # New or changed policies need every resource; the rest only the changed ones
+            results_by_position = []
+            full: Dict[str, PolicyResults] = {}
+            partial: Dict[int, Set[str]] = {}
+            for position, (policy, evaluator) in enumerate(index.entries):
+                results, changed = tracker.results_for(policy.id, evaluator)
+                results_by_position.append(results)
+                if changed is None:
+                    full[policy.id] = results
+                else:
+                    partial[position] = changed
+
+            if full:
+                for resource, policy in self._matches(snapshot, resource_type, index):
+                    results = full.get(policy.id)
+                    if results is not None:
+                        results.violating[resource.id] = None
+
+            # Policies evaluated together share a generation, so their changed sets are usually the same
+            by_changed: Dict[FrozenSet[str], List[int]] = {}
+            for position, changed in partial.items():
+                by_changed.setdefault(frozenset(changed), []).append(position)
+            for changed, positions in by_changed.items():
+                for resource_id in changed:
+                    for position in positions:
+                        results_by_position[position].violating.pop(resource_id, None)
+                changed_resources = [
+                    resource for resource in map(tracker.records.get, changed)
+                    if resource is not None and resource.type == resource_type
+                ]
+                wanted = set(positions)
+                for resource in changed_resources:
+                    for position in index.match(resource):
+                        if position in wanted:
+                            results_by_position[position].violating[resource.id] = None
+                if report is not None:
+                    report.resources_reused += (len(candidates) - len(changed_resources)) * len(positions)
+
+            for (policy, _), results in zip(index.entries, results_by_position):
+                results.generation = tracker.generation
+                matches.extend((tracker.records[resource_id], policy) for resource_id in results.violating)
+        return matches
+
+    def _forget_resource(self, resource: Any):
+        # The resource is gone, so any warning or remediation pending for it is moot
+        resource_key = self._get_resource_key(resource)
+        if self.remediation_state.pop(resource_key, None) is not None:
+            self.due_index.discard(resource_key)
+
+    async def evaluate_policies(self, policies: List[PolicyDefinition]) -> EvaluationReport:
+        """Evaluate many policies with one inventory snapshot and one pass per scope"""
+        if self.streaming:
+            return await self.evaluate_streaming(policies)
+        report = EvaluationReport(policies_evaluated=len(policies))
+        started = time.monotonic()
+        self._ensure_projection(policies)
+        scopes = {self._get_scope_key(policy.scope): policy.scope for policy in policies}
+        pending = []
+
+        for scope_key, by_type in self._group_policies(policies).items():
+            report.scopes_listed += 1
+            with tracer.span("evaluate_scope", scope=scope_key, policies=sum(map(len, by_type.values()))):
+                async for resource, policy in self._scope_matches(scopes[scope_key], self._type_evaluators(by_type), report):
+                    report.record_violation(resource.id, policy.id)
+                    pending.append((resource, policy))
+
+        self.register_policies(policies)
+        violating: Dict[str, Set[str]] = {}
+        # Remediations from every policy in the pass are merged per resource
+        with self.remediation_pool.coalescing():
+            for resource, policy in pending:
+                violating.setdefault(policy.id, set()).add(self._get_resource_key(resource))
+                try:
                     await self._handle_remediation(resource, policy)
+                except Exception as e:
+                    self.logger.error(f"Remediation failed for {resource.id} under policy {policy.id}: {e}")
+                    report.record_error(resource.id, policy.id)
+        self._sweep_timed(policies, violating)
+        self._save_state()
+        self.monitoring.observe("evaluation_pass", time.monotonic() - started)
+        return report
+
+    async def _stream_violations(self, scope: Optional[Scope], type_evaluators, report: EvaluationReport) -> AsyncIterator[Tuple[Any, PolicyDefinition]]:
+        # page -> type filter -> conditions; nothing is cached, so each page can
+        # be released as soon as its violations have been handed on
+        async for page in self._list_scope(scope):
+            for resource in page:
+                index = type_evaluators.get(resource.type)
+                if index is None:
+                    continue
+                report.resources_scanned += 1
+                for policy in index.matching(resource):
+                    report.record_violation(resource.id, policy.id)
+                    yield resource, policy
+
+    async def _remediation_worker(self, queue: asyncio.Queue, report: EvaluationReport):
+        while True:
+            resource, policy = await queue.get()
+            try:
+                await self._handle_remediation(resource, policy)
+            except Exception as e:
+                self.logger.error(f"Remediation failed for {resource.id} under policy {policy.id}: {e}")
+                report.record_error(resource.id, policy.id)
+            finally:
+                queue.task_done()
+
+    async def evaluate_streaming(self, policies: List[PolicyDefinition]) -> EvaluationReport:
+        """Evaluate policies as a bounded pipeline that bypasses the inventory cache.
 
-    async def _handle_remediation(self, resource: Any, policy: PolicyDefinition) -> None:
+        Memory is bounded by the inventory's page prefetch and by stream_window,
+        the number of violations allowed to wait for remediation.
+        """
+        self.register_policies(policies)
+        report = EvaluationReport(policies_evaluated=len(policies), keep_violations=False)
+        scopes = {self._get_scope_key(policy.scope): policy.scope for policy in policies}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.stream_window)
+        worker = asyncio.ensure_future(self._remediation_worker(queue, report))
+        # Only timed policies keep state, so only their violations are remembered for the sweep
+        violating: Dict[str, Set[str]] = {}
+        try:
+            for scope_key, by_type in self._group_policies(policies).items():
+                report.scopes_listed += 1
+                async for resource, policy in self._stream_violations(scopes[scope_key], self._type_evaluators(by_type), report):
+                    if policy.remediation_action.timing:
+                        violating.setdefault(policy.id, set()).add(self._get_resource_key(resource))
+                    await queue.put((resource, policy))
+            await queue.join()
+            self._sweep_timed(policies, violating)
+        finally:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+            self._save_state()
+        return report
+
+    async def close(self):
+        await self.resource_cache.close()
+        await self.remediation_pool.close()
+        for client in self.remediation_clients.values():
+            await client.close()
+        self.remediation_clients.clear()
+        if self.async_credential is not None:
+            await self.async_credential.close()
+        await self.inventory.close()
+        self.remediation_state.close()
+
+    async def _handle_remediation(self, resource: Any, policy: PolicyDefinition, current_time: Optional[datetime] = None) -> None:
+        with tracer.span("handle_remediation", policy_id=policy.id, resource_id=resource.id):
+            await self._remediate(resource, policy, current_time)
+
+    async def _remediate(self, resource: Any, policy: PolicyDefinition, current_time: Optional[datetime]) -> None:
         resource_key = self._get_resource_key(resource)
-        current_time = datetime.utcnow()
+        current_time = current_time or datetime.utcnow()
         
         if policy.remediation_action.timing:
             if resource_key not in self.remediation_state:
@@ -87,12 +437,14 @@ class PolicyEngine:
                     status="pending",
                     duration=0.0
                 ))
-                self.remediation_state[resource_key] = {
+                state = {
                     "first_violation": current_time.isoformat(),
                     "policy_id": policy.id,
-                    "warnings_sent": []
+                    "warnings_sent": [],
+                    "resource": self._resource_snapshot(resource)
                 }
-                self._save_state()
+                self._schedule_due(resource_key, state, policy)
+                self.remediation_state[resource_key] = state
                 return
 
             state = self.remediation_state[resource_key]
@@ -111,54 +463,144 @@ class PolicyEngine:
                 ))
                 await self._send_warning(resource, policy)
                 state["warnings_sent"].append("warning_sent")
-                self._save_state()
+                self.remediation_state[resource_key] = state
 
-            if current_time - first_violation >= delay:
-                start_time = datetime.utcnow()
-                try:
-                    await self._apply_remediation(resource, policy.remediation_action)
-                    duration = (datetime.utcnow() - start_time).total_seconds()
-                    self.monitoring.record_metric(MetricData(
-                        policy_id=policy.id,
-                        resource_id=resource.id,
-                        action="remediation",
-                        status="success",
-                        duration=duration
-                    ))
-                    del self.remediation_state[resource_key]
+            if current_time - first_violation < delay:
+                # Keep the due index in step with the current timing, and backfill
+                # the snapshot for entries written before the index existed
+                previous_due = state.get("next_due")
+                self._schedule_due(resource_key, state, policy)
+                if state["next_due"] != previous_due or "resource" not in state:
+                    state["resource"] = self._resource_snapshot(resource)
+                    self.remediation_state[resource_key] = state
+            else:
+                def clear_state():
+                    self.remediation_state.pop(resource_key, None)
+                    self.due_index.discard(resource_key)
                     self._save_state()
-                except Exception as e:
-                    duration = (datetime.utcnow() - start_time).total_seconds()
-                    self.monitoring.record_metric(MetricData(
-                        policy_id=policy.id,
-                        resource_id=resource.id,
-                        action="remediation",
-                        status="failed",
-                        duration=duration
-                    ))
-                    raise
-        else:
-            start_time = datetime.utcnow()
-            try:
-                await self._apply_remediation(resource, policy.remediation_action)
-                duration = (datetime.utcnow() - start_time).total_seconds()
-                self.monitoring.record_metric(MetricData(
-                    policy_id=policy.id,
-                    resource_id=resource.id,
-                    action="immediate_remediation",
-                    status="success",
-                    duration=duration
-                ))
-            except Exception as e:
-                duration = (datetime.utcnow() - start_time).total_seconds()
-                self.monitoring.record_metric(MetricData(
-                    policy_id=policy.id,
-                    resource_id=resource.id,
-                    action="immediate_remediation",
-                    status="failed",
-                    duration=duration
+                await self.remediation_pool.submit(RemediationTask(
+                    resource=resource,
+                    policy=policy,
+                    action="remediation",
+                    on_success=clear_state
                 ))
-                raise
+        else:
+            await self.remediation_pool.submit(RemediationTask(
+                resource=resource,
+                policy=policy,
+                action="immediate_remediation"
+            ))
+
+    def _resource_snapshot(self, resource: Any) -> Dict[str, Any]:
+        # Enough of the resource to warn or remediate from the due index alone
+        return {
+            "id": resource.id,
+            "type": resource.type,
+            "name": resource.name,
+            "resource_group": resource.resource_group,
+            "tags": dict(resource.tags or {})
+        }
+
+    def _schedule_due(self, resource_key: str, state: Dict[str, Any], policy: PolicyDefinition):
+        timing = policy.remediation_action.timing
+        first_violation = datetime.fromisoformat(state["first_violation"])
+        if (timing.warning_threshold and timing.warning_threshold < timing.delay and
+                "warning_sent" not in state["warnings_sent"]):
+            due = first_violation + timing.warning_threshold
+        else:
+            due = first_violation + timing.delay
+        state["next_due"] = due.isoformat()
+        state.pop("due_failures", None)
+        self.due_index.push(resource_key, state["next_due"])
+
+    def register_policies(self, policies: Iterable[PolicyDefinition]):
+        policies = list(policies)
+        self._ensure_projection(policies)
+        for policy in policies:
+            self.policies[policy.id] = policy
+
+    def unregister_policy(self, policy_id: str):
+        """Stop tracking a policy: its pending warnings and remediations and its delta results are dropped"""
+        self.policies.pop(policy_id, None)
+        for resource_key in self.remediation_state.keys_for_policy(policy_id):
+            del self.remediation_state[resource_key]
+            self.due_index.discard(resource_key)
+        for tracker in self.deltas.values():
+            tracker.forget(policy_id)
+        self._save_state()
+
+    def _due_resource(self, state: Dict[str, Any], policy: PolicyDefinition) -> Optional[Any]:
+        """The resource a due action should act on, or None if it no longer violates.
+
+        A warm inventory snapshot is trusted over the stored copy; without one the
+        stored copy stands, since the last full scan would have swept it otherwise.
+        """
+        snapshot = state.get("resource")
+        if snapshot is None:
+            return None
+        cached = self.resource_cache.peek(self._get_scope_key(policy.scope))
+        if cached is None:
+            return SimpleNamespace(**snapshot)
+        for resource in cached.for_type(policy.resource_type):
+            if resource.id == snapshot["id"]:
+                return resource if policy.evaluator(resource) else None
+        return None
+
+    async def process_due_actions(self, now: Optional[datetime] = None) -> int:
+        """Run every warning and delayed remediation that is due; returns how many fired"""
+        now = now or datetime.utcnow()
+        fired = 0
+        with tracer.span("process_due_actions"), self.remediation_pool.coalescing():
+            for resource_key in self.due_index.pop_due(now):
+                state = self.remediation_state.get(resource_key)
+                if state is None:
+                    continue
+                policy = self.policies.get(state["policy_id"])
+                if policy is None or not policy.remediation_action.timing:
+                    continue
+                try:
+                    resource = self._due_resource(state, policy)
+                    if resource is None:
+                        del self.remediation_state[resource_key]
+                        continue
+                    await self._handle_remediation(resource, policy, now)
+                except Exception as e:
+                    self.logger.error(f"Due action failed for {resource_key} under policy {policy.id}: {e}")
+                    self._retry_due(resource_key, now)
+                    continue
+                fired += 1
+        self._save_state()
+        return fired
+
+    def _retry_due(self, resource_key: str, now: datetime):
+        # The entry was popped from the index; put it back after a backoff so it is not lost
+        state = self.remediation_state.get(resource_key)
+        if state is None:
+            return
+        failures = state.get("due_failures", 0) + 1
+        delay = min(self.due_retry_backoff * 2 ** (failures - 1), self.due_retry_backoff_max)
+        state["due_failures"] = failures
+        state["next_due"] = (now + timedelta(seconds=delay)).isoformat()
+        self.remediation_state[resource_key] = state
+        self.due_index.push(resource_key, state["next_due"])
+        self.monitoring.increment("due_action_failed")
+
+    def seconds_until_due(self, now: Optional[datetime] = None) -> Optional[float]:
+        next_due = self.due_index.next_due()
+        if next_due is None:
+            return None
+        return max(0.0, (next_due - (now or datetime.utcnow())).total_seconds())
+
+    def _sweep_timed(self, policies: Iterable[PolicyDefinition], violating: Dict[str, Set[str]]):
+        # Drop state for resources a timed policy's latest full scan no longer flags
+        for policy in policies:
+            if not policy.remediation_action.timing:
+                continue
+            still_violating = violating.get(policy.id, set())
+            for resource_key in self.remediation_state.keys_for_policy(policy.id):
+                if resource_key not in still_violating:
+                    del self.remediation_state[resource_key]
+                    self.due_index.discard(resource_key)
 
     async def _send_warning(self, resource: Any, policy: PolicyDefinition) -> None:
         print(f"WARNING: Resource {resource.id} will be remediated soon due to policy {policy.id}")
@@ -178,44 +620,47 @@ class PolicyEngine:
             return value is None
         elif condition.operator == 'contains':
             return condition.value in value if value else False
+        elif condition.operator == 'in':
+            return value in condition.value
+        elif condition.operator == 'matches':
+            return isinstance(value, str) and re.search(condition.value, value) is not None
         return False
 
     def _get_nested_value(self, obj: Dict, path: str) -> Any:
-        parts = path.split('.')
-        for part in parts:
-            if obj is None:
-                return None
-            obj = getattr(obj, part, None)
-        return obj
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def _apply_remediation(self, resource: Any, action: RemediationAction) -> None:
-        try:
-            client = ResourceManagementClient(self.credential, self.subscription_id)
-            if action.type == 'modify':
-                await client.resources.begin_update(
-                    resource_group_name=resource.resource_group,
-                    resource_provider_namespace=resource.type.split('/')[0],
-                    parent_resource_path='',
-                    resource_type=resource.type.split('/')[-1],
-                    resource_name=resource.name,
-                    parameters=action.parameters
-                )
-            elif action.type == 'delete':
-                await client.resources.begin_delete(
-                    resource_group_name=resource.resource_group,
-                    resource_provider_namespace=resource.type.split('/')[0],
-                    parent_resource_path='',
-                    resource_type=resource.type.split('/')[-1],
-                    resource_name=resource.name
-                )
-            elif action.type == 'tag':
-                tags = {**resource.tags, **action.parameters}
-                await client.tags.begin_create_or_update_at_scope(
-                    scope=resource.id,
-                    parameters={'tags': tags}
-                )
-        except Exception as e:
-            self.logger.error(f"Remediation error for resource {resource.id}: {e}")
-            await self.eventhub.send_event("RemediationError", resource.id, action.type, {"error": str(e)})
-            raise
+        return resolve_path(obj, tuple(path.split('.')))
+
+    def _get_remediation_client(self, subscription_id: str) -> AsyncResourceManagementClient:
+        client = self.remediation_clients.get(subscription_id)
+        if client is None:
+            if self.async_credential is None:
+                self.async_credential = AsyncDefaultAzureCredential()
+            client = AsyncResourceManagementClient(self.async_credential, subscription_id)
+            self.remediation_clients[subscription_id] = client
+        return client
+
+    async def _apply_remediation(self, resource: Any, action: RemediationAction) -> Any:
+        """Start a remediation and return its poller; RemediationPool awaits it, logs failures and owns retries"""
+        client = self._get_remediation_client(subscription_of(resource.id) or self.subscription_id)
+        if action.type == 'modify':
+            return await client.resources.begin_update(
+                resource_group_name=resource.resource_group,
+                resource_provider_namespace=resource.type.split('/')[0],
+                parent_resource_path='',
+                resource_type=resource.type.split('/')[-1],
+                resource_name=resource.name,
+                parameters=action.parameters
+            )
+        elif action.type == 'delete':
+            return await client.resources.begin_delete(
+                resource_group_name=resource.resource_group,
+                resource_provider_namespace=resource.type.split('/')[0],
+                parent_resource_path='',
+                resource_type=resource.type.split('/')[-1],
+                resource_name=resource.name
+            )
+        elif action.type == 'tag':
+            tags = {**resource.tags, **action.parameters}
+            return await client.tags.begin_create_or_update_at_scope(
+                scope=resource.id,
+                parameters={'tags': tags}
+            )
@@ -1,14 +1,25 @@
 import os
 import json
+import hashlib
+import pickle
 import signal
 import sys
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from time import time
 from pathlib import Path
+import condition_compiler
+import policy_types
 from policy_daemon import PolicyDaemon
 from policy_types import PolicyDefinition
+from sharding import ShardConfig, ShardedDaemon
+from config import Config as EngineConfig
+from tracing import configure_from_env, tracer
 from dacite import from_dict, Config
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -16,61 +27,170 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-def validate_policy_file(file_path: str) -> bool:
-    """Validate that the policy file exists and is valid JSON"""
+@dataclass
+class PolicyFileLoad:
+    path: str
+    digest: str
+    policies: List[PolicyDefinition]
+    seconds: float
+    cached: bool
+
+def policy_files(path: str) -> List[str]:
+    """path itself, or every *.json file under it if it is a directory"""
+    if Path(path).is_dir():
+        return sorted(str(p) for p in Path(path).rglob('*.json'))
+    return [path]
+
+# Bump to invalidate every cached bundle when the cached format changes
+CACHE_VERSION = 1
+
+@lru_cache(maxsize=1)
+def _schema_digest() -> bytes:
+    # Cached bundles are only valid for the code that parsed and compiled them
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+    for source in (policy_types.__file__, condition_compiler.__file__, __file__):
+        digest.update(Path(source).read_bytes())
+    return digest.digest()
+
+def _cache_path(cache_dir: str, digest: str) -> Path:
+    return Path(cache_dir) / f"{digest}.pickle"
+
+def _parse_policies(file_path: str, data: bytes) -> List[PolicyDefinition]:
     try:
-        if not Path(file_path).exists():
-            logger.error(f"Policy file not found: {file_path}")
-            return False
-        with open(file_path, 'r') as f:
-            json.load(f)
-        logger.debug(f"Policy file validated successfully: {file_path}")
-        return True
+        document = json.loads(data)
     except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in policy file {file_path}: {str(e)}")
-        return False
+        raise ValueError(f"Invalid JSON in policy file {file_path}: {e}") from e
+    policies = []
+    for index, policy_data in enumerate(document.get('policies', []), 1):
+        try:
+            policies.append(from_dict(data_class=PolicyDefinition, data=policy_data, config=Config(check_types=True)))
+        except Exception as e:
+            logger.error(f"Error loading policy {index} ({policy_data.get('id', 'UNKNOWN')}) from {file_path}: {e}")
+            raise
+    return policies
+
+def _read_policy_file(file_path: str) -> Tuple[bytes, str]:
+    if not Path(file_path).exists():
+        raise ValueError(f"Policy file not found: {file_path}")
+    data = Path(file_path).read_bytes()
+    return data, hashlib.sha256(_schema_digest() + data).hexdigest()
+
+def _load_cached(file_path: str, digest: str, cache_dir: str) -> Optional[PolicyFileLoad]:
+    start_time = time()
+    try:
+        with open(_cache_path(cache_dir, digest), 'rb') as f:
+            policies = pickle.load(f)
+    except FileNotFoundError:
+        return None
     except Exception as e:
-        logger.error(f"Error validating policy file {file_path}: {str(e)}")
-        return False
+        logger.warning(f"Ignoring unreadable policy cache entry for {file_path}: {e}")
+        return None
+    return PolicyFileLoad(file_path, digest, policies, time() - start_time, cached=True)
 
-def load_policies(file_path: str) -> List[PolicyDefinition]:
+def _compile_policy_file(file_path: str, data: bytes, digest: str, cache_dir: Optional[str]) -> PolicyFileLoad:
+    """Parse a policy file's content and, with a cache_dir, store the result under its digest"""
     start_time = time()
-    logger.info(f"Starting policy load from: {file_path}")
-    
-    if not validate_policy_file(file_path):
-        raise ValueError(f"Invalid policy file: {file_path}")
+    policies = _parse_policies(file_path, data)
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        cache_path = _cache_path(cache_dir, digest)
+        # Written aside and renamed, so a concurrent reader never sees half an entry
+        temp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, 'wb') as f:
+            pickle.dump(policies, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    return PolicyFileLoad(file_path, digest, policies, time() - start_time, cached=False)
 
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Found {len(data.get('policies', []))} policies in file")
-            
-            policies = []
-            for index, policy_data in enumerate(data.get('policies', []), 1):
-                try:
-                    logger.debug(f"Loading policy {index}: {policy_data.get('id', 'UNKNOWN')}")
-                    policy = from_dict(
-                        data_class=PolicyDefinition,
-                        data=policy_data,
-                        config=Config(check_types=True)
-                    )
-                    policies.append(policy)
-                    logger.debug(f"Successfully loaded policy: {policy.id}")
-                except Exception as e:
-                    logger.error(f"Error loading policy {index}: {str(e)}")
-                    logger.error(f"Policy data: {json.dumps(policy_data, indent=2)}")
-                    raise
-
-            load_time = time() - start_time
-            logger.info(f"Successfully loaded {len(policies)} policies in {load_time:.2f} seconds")
-            return policies
+def load_policy_file(file_path: str, cache_dir: Optional[str] = None) -> PolicyFileLoad:
+    """Load one policy file, from the compiled cache when its content is unchanged"""
+    data, digest = _read_policy_file(file_path)
+    if cache_dir is not None:
+        cached = _load_cached(file_path, digest, cache_dir)
+        if cached is not None:
+            return cached
+    return _compile_policy_file(file_path, data, digest, cache_dir)
 
-    except Exception as e:
-        logger.error(f"Failed to load policies from {file_path}: {str(e)}")
-        raise
+def load_policy_files(path: str, cache_dir: Optional[str] = None, workers: Optional[int] = None) -> List[PolicyFileLoad]:
+    """Load a policy file or directory; cache misses are parsed in parallel worker processes"""
+    files = policy_files(path)
+    if not files:
+        raise ValueError(f"No policy files found in: {path}")
+    loads: Dict[str, PolicyFileLoad] = {}
+    # (path, content, digest) of each file the cache can't answer; each file is read and hashed once
+    misses: List[Tuple[str, bytes, str]] = []
+    for file_path in files:
+        data, digest = _read_policy_file(file_path)
+        # Cache hits are cheaper to unpickle here than to ship back from a worker
+        load = _load_cached(file_path, digest, cache_dir) if cache_dir is not None else None
+        if load is not None:
+            loads[file_path] = load
+        else:
+            misses.append((file_path, data, digest))
+
+    workers = min(workers or os.cpu_count() or 1, len(misses))
+    if workers > 1:
+        # Spawned, not forked: a daemon reloads from a thread, and shard workers load with other daemons running
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            paths, contents, digests = zip(*misses)
+            for load in executor.map(_compile_policy_file, paths, contents, digests, [cache_dir] * len(misses)):
+                loads[load.path] = load
+    else:
+        for file_path, data, digest in misses:
+            loads[file_path] = _compile_policy_file(file_path, data, digest, cache_dir)
+    return [loads[file_path] for file_path in files]
+
+def load_policies(file_path: str, cache_dir: Optional[str] = None, workers: Optional[int] = None) -> List[PolicyDefinition]:
+    with tracer.span("load_policies", file=file_path) as span:
+        start_time = time()
+        logger.info(f"Starting policy load from: {file_path}")
+        try:
+            loads = load_policy_files(file_path, cache_dir, workers)
+        except Exception as e:
+            logger.error(f"Failed to load policies from {file_path}: {str(e)}")
+            raise
+
+        policies: List[PolicyDefinition] = []
+        sources: Dict[str, str] = {}
+        for load in loads:
+            logger.info(f"Loaded {len(load.policies)} policies from {load.path} in {load.seconds * 1000:.1f} ms"
+                        f"{' (cached)' if load.cached else ''}")
+            for policy in load.policies:
+                if policy.id in sources:
+                    raise ValueError(f"Duplicate policy id {policy.id} in {load.path} and {sources[policy.id]}")
+                sources[policy.id] = load.path
+                policies.append(policy)
+
+        span.set("policies", len(policies))
+        span.set("files", len(loads))
+        logger.info(f"Successfully loaded {len(policies)} policies from {len(loads)} files "
+                    f"in {time() - start_time:.2f} seconds")
+        return policies
+
+class PolicySource:
+    """A policy file or directory that the daemon can poll for changes and reload"""
+
+    def __init__(self, path: str, cache_dir: Optional[str] = None, workers: Optional[int] = None):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.workers = workers
+
+    def fingerprint(self) -> Tuple[Tuple[str, int, int], ...]:
+        """(path, mtime, size) of every policy file; changes when any file is added, removed or written"""
+        entries = []
+        for file_path in policy_files(self.path):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            entries.append((file_path, stat.st_mtime_ns, stat.st_size))
+        return tuple(entries)
+
+    def load(self) -> List[PolicyDefinition]:
+        return load_policies(self.path, cache_dir=self.cache_dir, workers=self.workers)
 
 def main():
     logger.info("Starting policy engine")
+    profiler = configure_from_env()
     
     subscription_id = os.environ.get('AZURE_SUBSCRIPTION_ID')
     if not subscription_id:
@@ -79,20 +199,74 @@ def main():
 
     management_group_id = os.environ.get('AZURE_MANAGEMENT_GROUP_ID')
     policy_file = os.environ.get('POLICY_CONFIG', './policies/sample-policies.json')
+    policy_cache_dir = os.environ.get('POLICY_CACHE_DIR', './state/policy_cache') or None
+    load_workers = int(os.environ.get('POLICY_LOAD_WORKERS', '0')) or None
+    single_pass = os.environ.get('POLICY_SINGLE_PASS', '').lower() in ('1', 'true', 'yes')
+    max_concurrency = int(os.environ.get('POLICY_MAX_CONCURRENCY', '8'))
+    streaming = os.environ.get('POLICY_STREAMING', '').lower() in ('1', 'true', 'yes')
+    stream_window = int(os.environ.get('POLICY_STREAM_WINDOW', '1000'))
+    state_backend = os.environ.get('POLICY_STATE_BACKEND', 'sqlite')
+    state_fsync = os.environ.get('POLICY_STATE_FSYNC', 'normal')
+    condition_evaluator = os.environ.get('POLICY_EVALUATOR', 'compiled')
+    incremental = os.environ.get('POLICY_INCREMENTAL', '').lower() in ('1', 'true', 'yes')
+    coalesce_window = float(os.environ.get('POLICY_COALESCE_WINDOW', '0'))
+    metrics_port = os.environ.get('POLICY_METRICS_PORT')
+    reload_interval = float(os.environ.get('POLICY_RELOAD_INTERVAL', '10'))
+    shards = int(os.environ.get('POLICY_SHARDS', '0'))
+    shard_workers = int(os.environ.get('POLICY_SHARD_WORKERS', '0')) or None
+    shard_coordinator = os.environ.get('POLICY_SHARD_COORDINATOR', './state/shards.db')
+    shard_lease_ttl = float(os.environ.get('POLICY_SHARD_LEASE_TTL', '30'))
+    engine_config_file = os.environ.get('POLICY_ENGINE_CONFIG', 'config.yaml')
+    engine_config = EngineConfig(engine_config_file if Path(engine_config_file).exists() else None)
     
     logger.info(f"Loading policies from: {policy_file}")
-    policies = load_policies(policy_file)
-    logger.info(f"Initializing daemon with {len(policies)} policies")
-    
-    daemon = PolicyDaemon(subscription_id, policies, management_group_id)
+    source = PolicySource(policy_file, cache_dir=policy_cache_dir, workers=load_workers)
+    policies = source.load()
+    daemon_options = dict(
+        management_group_id=management_group_id,
+        single_pass=single_pass,
+        max_concurrency=max_concurrency,
+        policy_source=source if reload_interval > 0 else None,
+        reload_interval=reload_interval,
+        streaming=streaming,
+        stream_window=stream_window,
+        state_backend=state_backend,
+        state_fsync=state_fsync,
+        config=engine_config,
+        condition_evaluator=condition_evaluator,
+        incremental=incremental,
+        coalesce_window=coalesce_window
+    )
+
+    if shards > 0:
+        # Workers load the policies themselves; loading here validates them and fills the cache
+        logger.info(f"Initializing {shard_workers or shards} shard workers for {shards} shards "
+                    f"with {len(policies)} policies")
+        daemon = ShardedDaemon(
+            ShardConfig(subscription_id, source, shards, coordinator=shard_coordinator,
+                        lease_ttl=shard_lease_ttl, daemon_options=daemon_options),
+            workers=shard_workers,
+            metrics_port=int(metrics_port) if metrics_port else None
+        )
+    else:
+        logger.info(f"Initializing daemon with {len(policies)} policies")
+        daemon = PolicyDaemon(
+            subscription_id,
+            policies,
+            metrics_port=int(metrics_port) if metrics_port else None,
+            **daemon_options
+        )
 
     def handle_shutdown(signum, frame):
         logger.info("Received shutdown signal")
         daemon.stop()
+        profiler.stop()
+        tracer.close()
         sys.exit(0)
 
     signal.signal(signal.SIGTERM, handle_shutdown)
     signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGHUP, lambda signum, frame: daemon.request_reload())
 
     try:
         logger.info("Starting policy daemon")
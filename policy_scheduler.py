@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from policy_types import PolicyDefinition
+
+def frequency_seconds(policy: PolicyDefinition) -> float:
+    return policy.evaluation_frequency * 60
+
+class PolicyScheduler:
+    """Runs policies on one event loop from a heap of next-due times.
+
+    With batch=True every policy that falls due at the same wake-up is handed to
+    `run` as one list, which is how the daemon drives single-pass evaluation.
+    """
+
+    def __init__(self,
+                 run: Callable[[List[PolicyDefinition]], Awaitable[None]],
+                 max_concurrency: int = 8,
+                 start_jitter: float = 30.0,
+                 batch: bool = False,
+                 interval: Callable[[PolicyDefinition], float] = frequency_seconds,
+                 shutdown_timeout: float = 30.0):
+        self.logger = getLogger(__name__)
+        self.run_policies = run
+        self.max_concurrency = max_concurrency
+        self.start_jitter = start_jitter
+        self.batch = batch
+        self.interval = interval
+        self.shutdown_timeout = shutdown_timeout
+        self.policies: Dict[str, PolicyDefinition] = {}
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._generation: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def _push(self, due: float, policy_id: str):
+        heapq.heappush(self._heap, (due, next(self._sequence), policy_id, self._generation[policy_id]))
+
+    def add(self, policy: PolicyDefinition, due: Optional[float] = None):
+        self.policies[policy.id] = policy
+        self._generation[policy.id] = self._generation.get(policy.id, 0) + 1
+        if due is None:
+            jitter = min(self.start_jitter, self.interval(policy))
+            due = time.monotonic() + random.uniform(0, jitter)
+        self._push(due, policy.id)
+        self._notify()
+
+    def remove(self, policy_id: str):
+        # Heap entries of removed policies are discarded lazily when popped
+        self.policies.pop(policy_id, None)
+        self._generation[policy_id] = self._generation.get(policy_id, 0) + 1
+        self._notify()
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            due, _, policy_id, generation = self._heap[0]
+            if self._generation.get(policy_id) == generation and policy_id in self.policies:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stop(self):
+        self._stopping = True
+        self._notify()
+
+    def _pop_due(self, now: float) -> List[PolicyDefinition]:
+        due_policies = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, policy_id, generation = heapq.heappop(self._heap)
+            if self._generation.get(policy_id) != generation or policy_id not in self.policies:
+                continue
+            policy = self.policies[policy_id]
+            next_due = due + self.interval(policy)
+            if next_due <= now:
+                # Fell behind (slow evaluation or a suspended host); don't burst
+                next_due = now + self.interval(policy)
+            self._push(next_due, policy_id)
+            if policy_id in self._running:
+                self.logger.warning(f"Skipping policy {policy_id}: previous evaluation still running")
+                continue
+            due_policies.append(policy)
+        return due_policies
+
+    async def _dispatch(self, policies: List[PolicyDefinition]):
+        ids = [policy.id for policy in policies]
+        self._running.update(ids)
+        try:
+            async with self._semaphore:
+                await self.run_policies(policies)
+        except Exception as e:
+            self.logger.error(f"Error evaluating policies {ids}: {e}")
+        finally:
+            self._running.difference_update(ids)
+
+    def _spawn(self, policies: List[PolicyDefinition]):
+        task = asyncio.ensure_future(self._dispatch(policies))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        try:
+            while not self._stopping:
+                self._wakeup.clear()
+                now = time.monotonic()
+                due_policies = self._pop_due(now)
+                if due_policies:
+                    if self.batch:
+                        self._spawn(due_policies)
+                    else:
+                        for policy in due_policies:
+                            self._spawn([policy])
+
+                next_due = self.next_due()
+                timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self._drain()
+
+    async def _drain(self):
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
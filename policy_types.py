@@ -1,8 +1,10 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Literal, Optional, Union
 from datetime import timedelta
 import re
 
+from condition_compiler import ConditionEvaluator, compile_conditions
+
 def parse_duration(duration_str: str) -> timedelta:
     if not duration_str:
         return timedelta()
@@ -48,7 +50,9 @@ class PolicyCondition:
         'notEquals',
         'contains',
         'exists',
-        'notExists'
+        'notExists',
+        'in',
+        'matches'
     ]
     value: Any = None
 
@@ -72,3 +76,7 @@ class PolicyDefinition:
     conditions: List[PolicyCondition]
     remediation_action: RemediationAction
     scope: Optional[Scope] = None
+    evaluator: ConditionEvaluator = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.evaluator = compile_conditions(self.conditions)
@@ -0,0 +1,178 @@
+from typing import Any, Callable, Dict, Generic, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from condition_compiler import ConditionEvaluator, _make_accessor, _make_predicate
+
+T = TypeVar('T')
+
+# Negative operators are indexed as the positive test they deny
+NEGATIONS = {'notEquals': 'equals', 'notExists': 'exists'}
+
+def _identity(value: Any) -> Any:
+    return value
+
+def _freeze(value: Any) -> Any:
+    # Tagged with the type, since [1] != (1,) and 1 and True must stay distinct
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((key, _freeze(item)) for key, item in value.items())))
+    hash(value)
+    return (type(value), value)
+
+class FieldTests:
+    """Every distinct test on one field path; the value is read once per resource."""
+
+    __slots__ = ('accessor', 'equals', 'equals_scan', 'members', 'in_scan', 'exists', 'others')
+
+    def __init__(self, parts: Tuple[str, ...]):
+        self.accessor = _make_accessor(parts)
+        # expected value -> equals tests, dispatched with one hash lookup
+        self.equals: Dict[Any, List[int]] = {}
+        # (expected, test) for equals tests on unhashable values
+        self.equals_scan: List[Tuple[Any, int]] = []
+        # list item -> "in" tests whose list holds it
+        self.members: Dict[Any, List[int]] = {}
+        # (expected, test) for every "in" test; used when the value or a list item is unhashable
+        self.in_scan: List[Tuple[Any, int, bool]] = []
+        self.exists: Optional[int] = None
+        # (predicate, test) for contains, matches and unknown operators
+        self.others: List[Tuple[Callable[[Any], bool], int]] = []
+
+    def add(self, operator: str, expected: Any, test: int):
+        if operator == 'exists':
+            self.exists = test
+        elif operator == 'equals':
+            try:
+                self.equals.setdefault(expected, []).append(test)
+            except TypeError:
+                self.equals_scan.append((expected, test))
+        elif operator == 'in' and isinstance(expected, (list, tuple, set, frozenset)):
+            try:
+                items = set(expected)
+            except TypeError:
+                self.in_scan.append((expected, test, False))
+                return
+            for item in items:
+                self.members.setdefault(item, []).append(test)
+            self.in_scan.append((expected, test, True))
+        else:
+            self.others.append((_make_predicate(operator, _identity, expected), test))
+
+    def collect(self, value: Any, satisfied: List[int]):
+        if self.exists is not None and value is not None:
+            satisfied.append(self.exists)
+        try:
+            hashed = True
+            if self.equals:
+                satisfied.extend(self.equals.get(value, ()))
+            if self.members:
+                satisfied.extend(self.members.get(value, ()))
+        except TypeError:
+            # An unhashable value can only equal an unhashable expected value,
+            # but the "in" lists still have to be scanned for it
+            hashed = False
+        for expected, test in self.equals_scan:
+            if value == expected:
+                satisfied.append(test)
+        for expected, test, dispatched in self.in_scan:
+            if dispatched and hashed:
+                continue
+            try:
+                if value in expected:
+                    satisfied.append(test)
+            except TypeError:
+                pass
+        for predicate, test in self.others:
+            if predicate(value):
+                satisfied.append(test)
+
+class PredicateIndex(Generic[T]):
+    """Finds every (payload, evaluator) entry whose conditions a resource meets.
+
+    Distinct (field, operator, value) tests are shared between entries and
+    each is run at most once per resource. Each field is read once, and equals
+    and "in" tests are dispatched by a hash lookup on its value. notEquals and
+    notExists are indexed as the equals and exists tests they negate. An entry
+    matches when all of its positive tests pass and none of its negated tests
+    do, so the work per resource follows the tests that pass, not the number
+    of entries.
+    """
+
+    def __init__(self, entries: Sequence[Tuple[T, ConditionEvaluator]]):
+        self.entries = list(entries)
+        self.fields: Dict[Tuple[str, ...], FieldTests] = {}
+        self.tests: Dict[Any, int] = {}
+        # test -> entries that need it to pass / to fail
+        self.positive: List[List[int]] = []
+        self.negative: List[List[int]] = []
+        self.required: List[int] = []
+        self.unconditional: List[int] = []
+
+        for position, (_, evaluator) in enumerate(self.entries):
+            positive: Set[int] = set()
+            negative: Set[int] = set()
+            for condition in evaluator.source:
+                operator = NEGATIONS.get(condition.operator, condition.operator)
+                test = self._test(tuple(condition.field.split('.')), operator, condition.value)
+                (negative if operator != condition.operator else positive).add(test)
+            for test in positive:
+                self.positive[test].append(position)
+            for test in negative:
+                self.negative[test].append(position)
+            self.required.append(len(positive))
+            if not positive:
+                self.unconditional.append(position)
+
+    def _test(self, parts: Tuple[str, ...], operator: str, expected: Any) -> int:
+        if operator == 'exists':
+            # The value is ignored; one exists test per field
+            expected = None
+        try:
+            key = (parts, operator, _freeze(expected))
+            test = self.tests.get(key)
+        except TypeError:
+            key = test = None
+        if test is not None:
+            return test
+        test = len(self.positive)
+        self.positive.append([])
+        self.negative.append([])
+        if key is not None:
+            self.tests[key] = test
+        field = self.fields.get(parts)
+        if field is None:
+            field = self.fields[parts] = FieldTests(parts)
+        field.add(operator, expected, test)
+        return test
+
+    def match(self, resource: Any) -> List[int]:
+        """Positions of the matching entries, in entry order"""
+        if len(self.entries) == 1:
+            return [0] if self.entries[0][1](resource) else []
+
+        satisfied: List[int] = []
+        for field in self.fields.values():
+            field.collect(field.accessor(resource), satisfied)
+
+        counts: Dict[int, int] = {}
+        rejected: Set[int] = set()
+        for test in satisfied:
+            for position in self.positive[test]:
+                counts[position] = counts.get(position, 0) + 1
+            rejected.update(self.negative[test])
+
+        required = self.required
+        matched = [position for position, count in counts.items() if count == required[position]]
+        matched.extend(self.unconditional)
+        if rejected:
+            matched = [position for position in matched if position not in rejected]
+        matched.sort()
+        return matched
+
+    def matching(self, resource: Any) -> Iterator[T]:
+        entries = self.entries
+        for position in self.match(resource):
+            yield entries[position][0]
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,428 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+
+from policy_types import PolicyDefinition, RemediationAction
+from services.monitoring_service import MonitoringService, MetricData
+from tracing import tracer
+
+def subscription_of(resource_id: str) -> str:
+    parts = resource_id.split('/')
+    for i, part in enumerate(parts[:-1]):
+        if part.lower() == 'subscriptions':
+            return parts[i + 1]
+    return ''
+
+def provider_of(resource_type: str) -> str:
+    return resource_type.split('/')[0]
+
+def is_throttled(error: BaseException) -> bool:
+    return getattr(error, 'status_code', None) == 429
+
+def is_transient(error: BaseException) -> bool:
+    """ARM 5xx responses, and requests that failed or timed out before ARM answered"""
+    status_code = getattr(error, 'status_code', None)
+    if isinstance(status_code, int) and status_code >= 500:
+        return True
+    return isinstance(error, (ServiceRequestError, ServiceResponseError, ConnectionError, asyncio.TimeoutError))
+
+def retry_after(error: BaseException, default: float) -> float:
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', default))
+    except (TypeError, ValueError):
+        return default
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token, going into debt if there is none; returns the seconds until it is due"""
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+@dataclass
+class RemediationTask:
+    resource: Any
+    policy: PolicyDefinition
+    # metric action name: "remediation" or "immediate_remediation"
+    action: str
+    on_success: Optional[Callable[[], None]] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.policy.id}:{self.resource.id}"
+
+    @property
+    def remediation_action(self) -> RemediationAction:
+        return self.policy.remediation_action
+
+def merge_parameters(base: Dict[str, Any], update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Deep-merge two modify payloads, or None if they set the same field differently"""
+    merged = dict(base)
+    for key, value in update.items():
+        if key not in merged or merged[key] == value:
+            merged[key] = value
+        elif isinstance(merged[key], dict) and isinstance(value, dict):
+            nested = merge_parameters(merged[key], value)
+            if nested is None:
+                return None
+            merged[key] = nested
+        else:
+            return None
+    return merged
+
+@dataclass
+class RemediationStep:
+    # One ARM call made on behalf of every task in it
+    action: RemediationAction
+    tasks: List[RemediationTask]
+
+@dataclass
+class RemediationBatch:
+    """Everything pending on one resource, merged into as few ARM calls as possible.
+
+    Steps run in order. If a delete is pending it is the only step, and the
+    tag and modify tasks it supersedes complete when it does.
+    """
+    resource: Any
+    steps: List[RemediationStep]
+    superseded: List[RemediationTask] = field(default_factory=list)
+    next_step: int = 0
+    throttled: int = 0
+    # Transient failures of the current step's call
+    retries: int = 0
+    # Token buckets already charged for the next call: 0 none, 1 subscription, 2 both
+    charged: int = 0
+
+def coalesce(resource: Any, tasks: List[RemediationTask], logger=None) -> RemediationBatch:
+    """Merge one resource's tasks: all tags into one call, compatible modifies into one call each"""
+    deletes = [task for task in tasks if task.remediation_action.type == 'delete']
+    if deletes:
+        return RemediationBatch(resource, [RemediationStep(deletes[0].remediation_action, deletes)],
+                                superseded=[task for task in tasks if task.remediation_action.type != 'delete'])
+
+    steps: List[RemediationStep] = []
+    for task in tasks:
+        if task.remediation_action.type != 'modify':
+            continue
+        for step in steps:
+            merged = merge_parameters(step.action.parameters, task.remediation_action.parameters)
+            if merged is not None:
+                step.action = RemediationAction(type='modify', parameters=merged)
+                step.tasks.append(task)
+                break
+        else:
+            steps.append(RemediationStep(task.remediation_action, [task]))
+
+    tag_tasks = [task for task in tasks if task.remediation_action.type == 'tag']
+    if tag_tasks:
+        tags: Dict[str, Any] = {}
+        for task in tag_tasks:
+            for key, value in task.remediation_action.parameters.items():
+                if key in tags and tags[key] != value and logger is not None:
+                    logger.warning(f"Policies disagree on tag {key} for {resource.id}; {task.policy.id} wins")
+                tags[key] = value
+        if len(tag_tasks) == 1:
+            action = tag_tasks[0].remediation_action
+        else:
+            action = RemediationAction(type='tag', parameters=tags)
+        # Tags last, so that a modify payload cannot overwrite them
+        steps.append(RemediationStep(action, tag_tasks))
+    return RemediationBatch(resource, steps)
+
+class RemediationPool:
+    """Async workers that apply remediations off the evaluation path.
+
+    Submitted tasks are staged for coalesce_window seconds, or until the
+    surrounding coalescing() block ends. They are then grouped by resource so
+    that each resource gets as few ARM calls as possible (see coalesce()).
+    Each call is gated by token buckets for its subscription and its resource
+    provider; a batch whose bucket is empty is set aside until its token is
+    due rather than holding a worker, so one busy subscription cannot stall
+    the others. A long-running operation's poller is awaited by a separate
+    task, so it does not hold a worker. Throttled (429) calls go back on the queue
+    after their Retry-After, and calls that fail transiently (5xx, connection
+    errors, timeouts) after an exponential backoff.
+    """
+
+    def __init__(self, apply: Callable[[Any, RemediationAction], Awaitable[Any]], monitoring: MonitoringService,
+                 workers: int = 8, queue_size: int = 10000,
+                 subscription_rate: float = 2.0, subscription_burst: float = 10,
+                 provider_rate: float = 5.0, provider_burst: float = 20,
+                 max_throttle_retries: int = 5, max_retries: int = 2, retry_backoff: float = 4.0,
+                 retry_backoff_max: float = 10.0, coalesce_window: float = 0.0):
+        self.logger = getLogger(__name__)
+        self.apply = apply
+        self.monitoring = monitoring
+        self.workers = workers
+        self.queue_size = queue_size
+        self.subscription_rate = subscription_rate
+        self.subscription_burst = subscription_burst
+        self.provider_rate = provider_rate
+        self.provider_burst = provider_burst
+        self.max_throttle_retries = max_throttle_retries
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.coalesce_window = coalesce_window
+        self.subscription_buckets: Dict[str, TokenBucket] = {}
+        self.provider_buckets: Dict[str, TokenBucket] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        # One per batch between flush() and its last step, whether queued, set aside for a token or polling
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending: Set[str] = set()
+        # resource id -> tasks submitted since the last flush, in submission order
+        self.staged: Dict[str, List[RemediationTask]] = {}
+        self.pollers: Set[asyncio.Task] = set()
+        self._workers: Set[asyncio.Task] = set()
+        self._completions: Deque[float] = deque(maxlen=10000)
+        self._holds = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        # Held for the whole of a flush, which can block while the pool is full
+        self._flushing = asyncio.Lock()
+
+    def _ensure_started(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.queue_size)
+            for _ in range(self.workers):
+                self._workers.add(asyncio.ensure_future(self._worker()))
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _update_gauges(self):
+        self.monitoring.set_gauge("remediation_queue_depth", self.queue.qsize() if self.queue else 0)
+        self.monitoring.set_gauge("remediation_pollers_in_flight", len(self.pollers))
+        now = time.monotonic()
+        while self._completions and now - self._completions[0] > 60:
+            self._completions.popleft()
+        self.monitoring.set_gauge("remediation_throughput_per_minute", len(self._completions))
+
+    async def submit(self, task: RemediationTask) -> bool:
+        """Stage a remediation; returns False if the same one is already pending"""
+        self._ensure_started()
+        if task.key in self.pending:
+            return False
+        self.pending.add(task.key)
+        self.staged.setdefault(task.resource.id, []).append(task)
+        self.monitoring.increment("remediation_submitted")
+        if len(self.staged) >= self.queue_size:
+            # Don't let staging outgrow the queue while a caller holds it open
+            await self.flush()
+        else:
+            if self._flushing.locked():
+                # The pool is full; wait for the flush in progress instead of staging without bound
+                async with self._flushing:
+                    pass
+            self._schedule_flush()
+        return True
+
+    @contextmanager
+    def coalescing(self):
+        """Hold staged tasks until the block ends, so one pass is coalesced together"""
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._holds or not self.staged or self._flush_task is not None:
+            return
+        self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        # _flush_task stays set until the flush is through, so there is only ever one
+        try:
+            await asyncio.sleep(self.coalesce_window)
+            if not self._holds:
+                await self.flush()
+        finally:
+            self._flush_task = None
+        self._schedule_flush()
+
+    async def flush(self):
+        """Coalesce every staged task and queue one batch per resource"""
+        async with self._flushing:
+            staged, self.staged = self.staged, {}
+            for resource_tasks in staged.values():
+                batch = coalesce(resource_tasks[0].resource, resource_tasks, self.logger)
+                calls = len(batch.steps)
+                if len(resource_tasks) > calls:
+                    self.monitoring.increment("remediation_coalesced", len(resource_tasks) - calls)
+                await self._slots.acquire()
+                await self.queue.put(batch)
+        self._update_gauges()
+
+    async def _worker(self):
+        while True:
+            batch = await self.queue.get()
+            try:
+                await self._run(batch)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, batch: RemediationBatch):
+        resource = batch.resource
+        step = batch.steps[batch.next_step]
+        # The provider bucket is only charged once the subscription's token is due, so a
+        # backlog in one subscription doesn't run up debt for every other one
+        if batch.charged < 1:
+            batch.charged = 1
+            delay = self._bucket(self.subscription_buckets, subscription_of(resource.id),
+                                 self.subscription_rate, self.subscription_burst).reserve()
+            if delay:
+                self._requeue_after(batch, delay)
+                return
+        if batch.charged < 2:
+            batch.charged = 2
+            delay = self._bucket(self.provider_buckets, provider_of(resource.type),
+                                 self.provider_rate, self.provider_burst).reserve()
+            if delay:
+                self._requeue_after(batch, delay)
+                return
+        batch.charged = 0
+        start_time = time.monotonic()
+        try:
+            # Workers outlive the evaluation that started them, so calls are their own trees
+            with tracer.span("remediation_call", root=True, action=step.action.type, resource_id=resource.id,
+                             policies=[task.policy.id for task in step.tasks]):
+                poller = await self.apply(resource, step.action)
+        except Exception as e:
+            if is_throttled(e) and batch.throttled < self.max_throttle_retries:
+                self._requeue_throttled(batch, e)
+                return
+            if is_transient(e) and batch.retries < self.max_retries:
+                self._requeue_transient(batch, e)
+                return
+            await self._finish_step(batch, start_time, e)
+            return
+
+        if poller is not None and hasattr(poller, 'result'):
+            tracker = asyncio.ensure_future(self._track(batch, poller, start_time))
+            self.pollers.add(tracker)
+            tracker.add_done_callback(self.pollers.discard)
+            self._update_gauges()
+        else:
+            await self._finish_step(batch, start_time)
+
+    def _requeue_throttled(self, batch: RemediationBatch, error: BaseException):
+        batch.throttled += 1
+        self.monitoring.increment("arm_throttled")
+        delay = retry_after(error, 2 ** batch.throttled)
+        self.logger.warning(f"Remediation for {batch.resource.id} throttled, retrying in {delay}s")
+        self._requeue_after(batch, delay)
+
+    def _requeue_transient(self, batch: RemediationBatch, error: BaseException):
+        batch.retries += 1
+        self.monitoring.increment("remediation_retried")
+        delay = min(self.retry_backoff * 2 ** (batch.retries - 1), self.retry_backoff_max)
+        self.logger.warning(f"Remediation for {batch.resource.id} failed ({error}), retrying in {delay}s")
+        self._requeue_after(batch, delay)
+
+    def _requeue_after(self, batch: RemediationBatch, delay: float):
+        tracker = asyncio.ensure_future(self._requeue_later(batch, delay))
+        self.pollers.add(tracker)
+        tracker.add_done_callback(self.pollers.discard)
+
+    async def _requeue_later(self, batch: RemediationBatch, delay: float):
+        await asyncio.sleep(delay)
+        await self.queue.put(batch)
+
+    async def _track(self, batch: RemediationBatch, poller: Any, start_time: float):
+        try:
+            await poller.result()
+        except Exception as e:
+            if is_throttled(e):
+                self.monitoring.increment("arm_throttled")
+            await self._finish_step(batch, start_time, e)
+            return
+        await self._finish_step(batch, start_time)
+
+    async def _finish_step(self, batch: RemediationBatch, start_time: float, error: Optional[BaseException] = None):
+        step = batch.steps[batch.next_step]
+        for task in step.tasks:
+            self._complete(task, start_time, error)
+        if step.action.type == 'delete':
+            for task in batch.superseded:
+                self._complete(task, start_time, error, status="superseded" if error is None else None)
+        batch.next_step += 1
+        if batch.next_step < len(batch.steps):
+            # The next call on this resource waits its turn like any other
+            batch.throttled = batch.retries = 0
+            await self.queue.put(batch)
+        else:
+            self._slots.release()
+
+    def _complete(self, task: RemediationTask, start_time: float, error: Optional[BaseException] = None,
+                  status: Optional[str] = None):
+        self.pending.discard(task.key)
+        duration = time.monotonic() - start_time
+        if error is None:
+            status = status or "success"
+            if task.on_success is not None:
+                task.on_success()
+        else:
+            status = "failed"
+            self.logger.error(f"Remediation error for resource {task.resource.id} under policy {task.policy.id}: {error}")
+        self.monitoring.record_metric(MetricData(
+            policy_id=task.policy.id,
+            resource_id=task.resource.id,
+            action=task.action,
+            status=status,
+            duration=duration
+        ))
+        self.monitoring.increment(f"remediation_{status}")
+        self._completions.append(time.monotonic())
+        self._update_gauges()
+
+    async def join(self):
+        """Wait until every staged and queued remediation and tracked poller has finished"""
+        while self.queue is not None and (self.pending or self.pollers):
+            await self.flush()
+            await self.queue.join()
+            if self.pollers:
+                await asyncio.gather(*list(self.pollers), return_exceptions=True)
+
+    async def close(self):
+        tasks = set(self._workers) | self.pollers
+        if self._flush_task is not None:
+            tasks.add(self._flush_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        self.pollers.clear()
+        self.staged.clear()
+        self._flush_task = None
+        self._flushing = asyncio.Lock()
+        self._slots = None
+        self.queue = None
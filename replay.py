@@ -0,0 +1,256 @@
+"""What-if evaluation of a policy set against a recorded inventory snapshot.
+
+    python -m replay capture SNAPSHOT [--policies POLICY_CONFIG] [--management-group ID] [--subscription ID]
+    python -m replay run SNAPSHOT POLICY_CONFIG [--subscription ID] [--workers N] [--hits FILE] [--list N]
+
+`capture` lists the scopes that a policy set reads, or the scopes named on the
+command line, from ARM and records them. `run` matches every policy against
+the recorded resources with the engine's compiled conditions, through the
+same PredicateIndex a live pass uses. Nothing is remediated and no state is
+written. The report gives the hit count per policy and the first --list
+resource ids it hit. --hits writes every (policy, resource) hit to a JSONL
+file, so the full lists never have to fit in memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from inventory_snapshot import Frame, RecordingInventory, SnapshotReader, SnapshotWriter
+from predicate_index import PredicateIndex
+from policy_types import PolicyDefinition, Scope
+
+def listing_scope(scope: Optional[Scope], subscription_id: Optional[str]) -> str:
+    """The snapshot scope a live pass would list for a policy scope"""
+    if scope and scope.managementGroup:
+        return f"mg:{scope.managementGroup}"
+    if scope and scope.subscription:
+        return f"sub:{scope.subscription}"
+    if subscription_id is None:
+        raise ValueError("Policies without a scope need a subscription to replay against")
+    return f"sub:{subscription_id}"
+
+@dataclass
+class PolicyHits:
+    count: int = 0
+    # The first max_listed resource ids, in snapshot order
+    resources: List[str] = field(default_factory=list)
+
+@dataclass
+class ReplayReport:
+    hits: Dict[str, PolicyHits] = field(default_factory=dict)
+    resources_scanned: int = 0
+    frames_skipped: int = 0
+    seconds: float = 0.0
+
+    def merge(self, other: "ReplayReport", max_listed: int):
+        for policy_id, hits in other.hits.items():
+            mine = self.hits.setdefault(policy_id, PolicyHits())
+            mine.count += hits.count
+            mine.resources.extend(hits.resources[:max_listed - len(mine.resources)])
+        self.resources_scanned += other.resources_scanned
+        self.frames_skipped += other.frames_skipped
+
+class _Matcher:
+    """Per-scope, per-type PredicateIndex over a policy set, as the engine groups them"""
+
+    def __init__(self, policies: Sequence[PolicyDefinition], subscription_id: Optional[str],
+                 max_listed: int, hits_path: Optional[str]):
+        grouped: Dict[str, Dict[str, List[PolicyDefinition]]] = {}
+        for policy in policies:
+            by_type = grouped.setdefault(listing_scope(policy.scope, subscription_id), {})
+            by_type.setdefault(policy.resource_type, []).append(policy)
+        self.indexes = {
+            scope: {resource_type: PredicateIndex([(policy, policy.evaluator) for policy in type_policies])
+                    for resource_type, type_policies in by_type.items()}
+            for scope, by_type in grouped.items()
+        }
+        self.max_listed = max_listed
+        self.report = ReplayReport(hits={policy.id: PolicyHits() for policy in policies})
+        self.hits_file = open(hits_path, "w") if hits_path else None
+
+    def wants(self, scope: str, resource_type: str) -> bool:
+        return resource_type in self.indexes.get(scope, {})
+
+    def match(self, scope: str, resources: List[Any]):
+        indexes = self.indexes.get(scope, {})
+        report = self.report
+        for resource in resources:
+            index = indexes.get(resource.type)
+            if index is None:
+                continue
+            report.resources_scanned += 1
+            for policy in index.matching(resource):
+                hits = report.hits[policy.id]
+                hits.count += 1
+                if len(hits.resources) < self.max_listed:
+                    hits.resources.append(resource.id)
+                if self.hits_file is not None:
+                    self.hits_file.write(json.dumps({"policy_id": policy.id, "resource_id": resource.id}) + "\n")
+
+    def close(self) -> ReplayReport:
+        if self.hits_file is not None:
+            self.hits_file.close()
+        return self.report
+
+def _replay_frames(path: str, frames: List[Frame], policies: List[PolicyDefinition], subscription_id: Optional[str],
+                   max_listed: int, hits_path: Optional[str]) -> ReplayReport:
+    matcher = _Matcher(policies, subscription_id, max_listed, hits_path)
+    with SnapshotReader(path) as reader:
+        for frame in frames:
+            matcher.match(frame.scope, reader.read_frame(frame))
+    return matcher.close()
+
+class ReplayEngine:
+    """Runs policy sets against a snapshot file with remediation left out.
+
+    Binary snapshots are split into runs of frames by size and matched in up
+    to `workers` processes; each one maps the file itself. JSONL snapshots are
+    read in one pass in this process.
+    """
+
+    def __init__(self, snapshot_path: str, subscription_id: Optional[str] = None,
+                 max_listed: int = 1000, workers: int = 1):
+        self.snapshot_path = snapshot_path
+        self.subscription_id = subscription_id
+        self.max_listed = max_listed
+        self.workers = workers
+
+    def _check_scopes(self, matcher: _Matcher, recorded: Sequence[str]):
+        missing = sorted(set(matcher.indexes) - set(recorded))
+        if missing:
+            raise ValueError(f"Snapshot {self.snapshot_path} has no listing for scopes: {', '.join(missing)}")
+
+    def _chunks(self, frames: List[Frame]) -> List[List[Frame]]:
+        # Contiguous runs of roughly equal bytes, so hits stay in file order
+        target = sum(frame.length for frame in frames) / self.workers
+        chunks: List[List[Frame]] = [[]]
+        size = 0
+        for frame in frames:
+            if size >= target and len(chunks) < self.workers:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(frame)
+            size += frame.length
+        return chunks
+
+    def run(self, policies: Sequence[PolicyDefinition], hits_path: Optional[str] = None) -> ReplayReport:
+        started = time.perf_counter()
+        policies = list(policies)
+        with SnapshotReader(self.snapshot_path) as reader:
+            if reader.jsonl:
+                # One pass, so missing scopes are only known at the end
+                matcher = _Matcher(policies, self.subscription_id, self.max_listed, hits_path)
+                seen = set()
+                for scope, page in reader.pages(scopes=matcher.indexes):
+                    seen.add(scope)
+                    matcher.match(scope, page)
+                report = matcher.close()
+                self._check_scopes(matcher, seen)
+                report.seconds = time.perf_counter() - started
+                return report
+            frames = list(reader.frames())
+        matcher = _Matcher(policies, self.subscription_id, self.max_listed, None)
+        self._check_scopes(matcher, {frame.scope for frame in frames})
+
+        wanted = [frame for frame in frames if matcher.wants(frame.scope, frame.resource_type)]
+        report = ReplayReport(hits={policy.id: PolicyHits() for policy in policies},
+                              frames_skipped=len(frames) - len(wanted))
+        chunks = self._chunks(wanted) if self.workers > 1 else [wanted]
+        parts = [f"{hits_path}.part{i}" if hits_path else None for i in range(len(chunks))]
+        if len(chunks) == 1:
+            results = [_replay_frames(self.snapshot_path, chunks[0], policies, self.subscription_id,
+                                      self.max_listed, parts[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                results = list(executor.map(_replay_frames, [self.snapshot_path] * len(chunks), chunks,
+                                            [policies] * len(chunks), [self.subscription_id] * len(chunks),
+                                            [self.max_listed] * len(chunks), parts))
+        for result in results:
+            report.merge(result, self.max_listed)
+        if hits_path:
+            with open(hits_path, "wb") as out:
+                for part in parts:
+                    with open(part, "rb") as f:
+                        shutil.copyfileobj(f, out)
+                    os.remove(part)
+        report.seconds = time.perf_counter() - started
+        return report
+
+async def capture(output: str, scopes: Sequence[str], inventory: Any, frame_resources: int = 2000) -> int:
+    """List each scope ("mg:<id>" or "sub:<id>") through inventory into a snapshot; returns the resources written"""
+    with SnapshotWriter(output, frame_resources=frame_resources) as writer:
+        recording = RecordingInventory(inventory, writer)
+        try:
+            for scope in scopes:
+                kind, _, name = scope.partition(":")
+                pages = (recording.list_management_group(name) if kind == "mg"
+                         else recording.list_subscription(name))
+                async for _ in pages:
+                    pass
+        finally:
+            await recording.close()
+    return writer.resources
+
+def _capture_scopes(args) -> List[str]:
+    scopes = [f"mg:{name}" for name in args.management_group] + [f"sub:{name}" for name in args.subscription]
+    if args.policies:
+        from policy_loader import load_policies
+        default = args.subscription[0] if args.subscription else os.environ.get("AZURE_SUBSCRIPTION_ID")
+        scopes.extend(listing_scope(policy.scope, default) for policy in load_policies(args.policies))
+    return list(dict.fromkeys(scopes))
+
+def print_report(report: ReplayReport, policies: Sequence[PolicyDefinition], listed: int):
+    print(f"{'policy':<40} {'hits':>10}")
+    for policy in policies:
+        hits = report.hits[policy.id]
+        print(f"{policy.id:<40} {hits.count:>10}")
+        for resource_id in hits.resources[:listed]:
+            print(f"    {resource_id}")
+    print(f"{report.resources_scanned} resources matched in {report.seconds:.2f} s, "
+          f"{report.frames_skipped} frames skipped")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    capture_parser = commands.add_parser("capture", help="record inventory listings from ARM")
+    capture_parser.add_argument("snapshot", help="*.snap for the binary format, *.jsonl.gz for compressed JSONL")
+    capture_parser.add_argument("--policies", help="capture every scope these policies read")
+    capture_parser.add_argument("--management-group", action="append", default=[])
+    capture_parser.add_argument("--subscription", action="append", default=[])
+    run_parser = commands.add_parser("run", help="replay policies against a snapshot")
+    run_parser.add_argument("snapshot")
+    run_parser.add_argument("policies", help="a policy file or directory")
+    run_parser.add_argument("--subscription", help="where policies without a scope were listed")
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    run_parser.add_argument("--hits", help="write every hit to this JSONL file")
+    run_parser.add_argument("--list", type=int, default=10, help="resource ids to print per policy")
+    args = parser.parse_args(argv)
+
+    if args.command == "capture":
+        from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+        from inventory import ArmInventoryClient
+        scopes = _capture_scopes(args)
+        if not scopes:
+            parser.error("nothing to capture; pass --policies, --management-group or --subscription")
+        subscription_id = args.subscription[0] if args.subscription else os.environ.get("AZURE_SUBSCRIPTION_ID", "")
+        inventory = ArmInventoryClient(AsyncDefaultAzureCredential(), subscription_id)
+        written = asyncio.run(capture(args.snapshot, scopes, inventory))
+        print(f"Captured {written} resources from {len(scopes)} scopes to {args.snapshot}")
+        return 0
+
+    from policy_loader import load_policies
+    policies = load_policies(args.policies)
+    engine = ReplayEngine(args.snapshot, args.subscription or os.environ.get("AZURE_SUBSCRIPTION_ID"),
+                          max_listed=args.list, workers=args.workers)
+    print_report(engine.run(policies, hits_path=args.hits), policies, args.list)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
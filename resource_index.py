@@ -0,0 +1,45 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+class ResourceIndex:
+    """Resources of one listing, bucketed by type and by (type, resource group)."""
+
+    def __init__(self, resources: Iterable[Any] = ()):
+        self.by_type: Dict[str, List[Any]] = {}
+        self.by_group: Dict[Tuple[str, Optional[str]], List[Any]] = {}
+        self.count = 0
+        for resource in resources:
+            self.add(resource)
+
+    def add(self, resource: Any) -> None:
+        resource_type = resource.type
+        bucket = self.by_type.get(resource_type)
+        if bucket is None:
+            bucket = self.by_type[resource_type] = []
+        bucket.append(resource)
+
+        group_key = (resource_type, getattr(resource, 'resource_group', None))
+        group_bucket = self.by_group.get(group_key)
+        if group_bucket is None:
+            group_bucket = self.by_group[group_key] = []
+        group_bucket.append(resource)
+        self.count += 1
+
+    def merge(self, other: 'ResourceIndex') -> None:
+        for resource_type, bucket in other.by_type.items():
+            self.by_type.setdefault(resource_type, []).extend(bucket)
+        for group_key, bucket in other.by_group.items():
+            self.by_group.setdefault(group_key, []).extend(bucket)
+        self.count += other.count
+
+    def for_type(self, resource_type: str) -> List[Any]:
+        return self.by_type.get(resource_type, [])
+
+    def for_group(self, resource_type: str, resource_group: Optional[str]) -> List[Any]:
+        return self.by_group.get((resource_type, resource_group), [])
+
+    def __iter__(self):
+        for bucket in self.by_type.values():
+            yield from bucket
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,123 @@
+import sys
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple, Type, TYPE_CHECKING
+
+from inventory import parse_resource_group
+
+if TYPE_CHECKING:
+    from policy_types import PolicyDefinition
+
+# Read by the engine itself: resource keys, remediation, the due-action snapshot
+# and change detection for incremental evaluation
+BASE_FIELDS = ('id', 'type', 'name', 'resource_group', 'tags', 'changed_time')
+# Low-cardinality strings repeated across most of an inventory
+INTERNED_FIELDS = frozenset(('type', 'resource_group', 'location'))
+
+_record_types: Dict[Tuple[str, ...], Type['ResourceRecord']] = {}
+
+class ResourceRecord:
+    """Base for the compact, slot-only records a projection produces."""
+
+    __slots__ = ()
+    # Dunder, so that it cannot collide with a slot named after a resource field such as properties.fields
+    __fields__: Tuple[str, ...] = ()
+
+    def __reduce__(self):
+        return build_record, (self.__fields__, tuple(getattr(self, name) for name in self.__fields__))
+
+    def __repr__(self):
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__fields__)
+        return f"ResourceRecord({values})"
+
+def record_type(fields: Tuple[str, ...]) -> Type[ResourceRecord]:
+    cls = _record_types.get(fields)
+    if cls is None:
+        cls = _record_types[fields] = type('ResourceRecord', (ResourceRecord,), {'__slots__': fields, '__fields__': fields})
+    return cls
+
+def build_record(fields: Tuple[str, ...], values: Tuple[Any, ...]) -> ResourceRecord:
+    cls = record_type(fields)
+    record = cls.__new__(cls)
+    for name, value in zip(fields, values):
+        setattr(record, name, value)
+    return record
+
+def referenced_paths(policies: Iterable['PolicyDefinition']) -> FrozenSet[str]:
+    return frozenset(condition.field for policy in policies for condition in policy.conditions)
+
+def _path_tree(paths: Iterable[str]) -> Dict[str, Optional[dict]]:
+    # name -> None to keep the whole value, or a subtree naming the keys to keep.
+    # Shorter paths go first so that a whole-value path absorbs longer ones below it
+    tree: Dict[str, Optional[dict]] = {}
+    for parts in sorted((tuple(path.split('.')) for path in paths), key=len):
+        node = tree
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                node[part] = None
+                break
+            if part in node and node[part] is None:
+                break
+            node = node.setdefault(part, {})
+    return tree
+
+def _get(obj: Any, name: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+def _prune(value: Any, subtree: Optional[dict]) -> Any:
+    if subtree is None or value is None:
+        return value
+    # Nested dicts and SDK models become slot records too where the kept keys
+    # are identifiers; condition paths resolve the same through either
+    names = tuple(subtree)
+    if not all(name.isidentifier() for name in names):
+        return {name: _prune(_get(value, name), child) for name, child in subtree.items()}
+    return build_record(names, tuple(_prune(_get(value, name), child) for name, child in subtree.items()))
+
+class ResourceProjection:
+    """Copies only the fields that policies reference out of listed resources.
+
+    Each resource becomes a slot-only record with one attribute per top-level
+    field. Nested values such as properties keep only the referenced keys.
+    """
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self.paths = frozenset(paths) | frozenset(BASE_FIELDS)
+        self.tree = _path_tree(self.paths)
+        self.fields = BASE_FIELDS + tuple(sorted(set(self.tree) - set(BASE_FIELDS)))
+        self.record_type = record_type(self.fields)
+        self._plan = tuple((name, self.tree[name], name in INTERNED_FIELDS) for name in self.fields)
+
+    @classmethod
+    def for_policies(cls, policies: Iterable['PolicyDefinition']) -> 'ResourceProjection':
+        return cls(referenced_paths(policies))
+
+    def covers(self, paths: Iterable[str]) -> bool:
+        return all(self._covers(path) for path in paths)
+
+    def _covers(self, path: str) -> bool:
+        node = self.tree
+        for part in path.split('.'):
+            if part not in node:
+                return False
+            node = node[part]
+            if node is None:
+                return True
+        return False
+
+    def widen(self, paths: Iterable[str]) -> 'ResourceProjection':
+        return ResourceProjection(self.paths | frozenset(paths))
+
+    def project(self, resource: Any) -> ResourceRecord:
+        record = self.record_type.__new__(self.record_type)
+        for name, subtree, intern in self._plan:
+            value = _prune(_get(resource, name), subtree)
+            if name == 'resource_group' and value is None:
+                value = parse_resource_group(_get(resource, 'id') or '')
+            if intern and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(record, name, value)
+        return record
+
+    def project_all(self, resources: Iterable[Any]) -> Iterator[ResourceRecord]:
+        return map(self.project, resources)
@@ -0,0 +1,186 @@
+import re
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; covers a condition pass over one scope up to a long-running ARM operation
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+OVERFLOW_LABEL = "__other__"
+
+class RingBuffer:
+    """Fixed-size columns of the most recent events; the oldest are overwritten.
+
+    Every slot is allocated up front, so recording is a few list stores and
+    never allocates a container. Callers hold the owner's lock.
+    """
+
+    FIELDS = ("timestamp", "policy_id", "resource_id", "action", "status", "duration")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.columns: Dict[str, List[Any]] = {name: [None] * capacity for name in self.FIELDS}
+        self.next = 0
+        self.size = 0
+
+    def append(self, timestamp: float, policy_id: str, resource_id: str, action: str, status: str, duration: float):
+        i = self.next
+        columns = self.columns
+        columns["timestamp"][i] = timestamp
+        columns["policy_id"][i] = policy_id
+        columns["resource_id"][i] = resource_id
+        columns["action"][i] = action
+        columns["status"][i] = status
+        columns["duration"][i] = duration
+        self.next = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        """Oldest event first"""
+        start = (self.next - self.size) % self.capacity
+        columns = [self.columns[name] for name in self.FIELDS]
+        for offset in range(self.size):
+            i = (start + offset) % self.capacity
+            yield tuple(column[i] for column in columns)
+
+class Histogram:
+    """Cumulative-on-read bucket counts, in the shape Prometheus expects"""
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        # One slot per bound plus +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def state(self) -> Dict[str, Any]:
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def merge(self, state: Dict[str, Any]):
+        """Add another histogram's state(), e.g. one from a shard worker, into this one"""
+        if tuple(state["bounds"]) != self.bounds:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, state["counts"])]
+        self.sum += state["sum"]
+        self.count += state["count"]
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((_format_value(bound), total))
+        return buckets
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for upper, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            if total >= rank:
+                return upper
+        return float("inf")
+
+_NAME_INVALID = re.compile(r"[^a-zA-Z0-9_:]")
+
+def metric_name(name: str) -> str:
+    name = _NAME_INVALID.sub("_", name)
+    return f"_{name}" if name[:1].isdigit() else name
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render_counter(lines: List[str], name: str, help_text: str, label_names: Sequence[str],
+                   series: Dict[Tuple[str, ...], float], kind: str = "counter"):
+    name = metric_name(name)
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for label_values, value in sorted(series.items()):
+        lines.append(f"{name}{_labels(label_names, label_values)} {_format_value(value)}")
+
+def render_histograms(lines: List[str], name: str, help_text: str, label_names: Sequence[str],
+                      series: Dict[Tuple[str, ...], Histogram]):
+    name = metric_name(name)
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for label_values, histogram in sorted(series.items()):
+        for bound, total in histogram.cumulative():
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_labels(label_names, label_values, le)} {total}")
+        lines.append(f"{name}_sum{_labels(label_names, label_values)} {_format_value(histogram.sum)}")
+        lines.append(f"{name}_count{_labels(label_names, label_values)} {histogram.count}")
+
+class MetricsServer:
+    """Serves MonitoringService.render_prometheus() at /metrics from a background thread"""
+
+    def __init__(self, monitoring: Any, host: str = "127.0.0.1", port: int = 9464):
+        self.logger = getLogger(__name__)
+        self.monitoring = monitoring
+        self.host = host
+        self.port = port
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def _handler(self):
+        monitoring = self.monitoring
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = monitoring.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are frequent; don't write an access log line for each
+                pass
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.server.daemon_threads = True
+        # Port 0 picks a free port; report the one actually bound
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+        self.thread = None
@@ -1,8 +1,14 @@
 import logging
+import threading
+import time
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
+from services.metrics import (
+    DEFAULT_BUCKETS, OVERFLOW_LABEL, Histogram, RingBuffer, render_counter, render_histograms
+)
+
 @dataclass
 class MetricData:
     policy_id: str
@@ -12,19 +18,159 @@ class MetricData:
     duration: float
 
 class MonitoringService:
-    def __init__(self):
+    """Thread-safe metric recording with bounded memory.
+
+    Every MetricData lands in a fixed-size ring of recent events, a counter per
+    (policy, action, status) and a duration histogram per (policy, action).
+    Policy ids beyond max_policies are folded into one "__other__" label, so
+    the number of series does not grow with the inventory. Resource ids only
+    ever live in the ring.
+    """
+
+    def __init__(self, history_size: int = 65536, max_policies: int = 1000,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
         self.logger = logging.getLogger(__name__)
-        self.metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.history = RingBuffer(history_size)
+        self.max_policies = max_policies
+        self.buckets = buckets
+        self._policies: Dict[str, str] = {}
+        # (policy, action, status) -> count
+        self.action_counts: Dict[Tuple[str, str, str], float] = {}
+        # (policy, action) -> durations
+        self.durations: Dict[Tuple[str, str], Histogram] = {}
+        # (name, policy) -> observations made with observe()
+        self.timings: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+
+    def _policy_label(self, policy_id: str) -> str:
+        label = self._policies.get(policy_id)
+        if label is None:
+            # The first max_policies ids get their own label; later ones share one
+            if len(self._policies) >= self.max_policies:
+                return OVERFLOW_LABEL
+            label = self._policies[policy_id] = policy_id
+        return label
 
     def record_metric(self, metric: MetricData):
-        key = f"{metric.policy_id}:{metric.resource_id}"
-        self.metrics[key] = {
-            "timestamp": datetime.utcnow(),
-            "action": metric.action,
-            "status": metric.status,
-            "duration": metric.duration
-        }
-        self.logger.info(f"Recorded metric: {metric}")
-
-    def get_metrics(self):
-        return self.metrics
+        with self._lock:
+            self.history.append(time.time(), metric.policy_id, metric.resource_id,
+                                metric.action, metric.status, metric.duration)
+            policy = self._policy_label(metric.policy_id)
+            key = (policy, metric.action, metric.status)
+            self.action_counts[key] = self.action_counts.get(key, 0.0) + 1
+            histogram = self.durations.get((policy, metric.action))
+            if histogram is None:
+                histogram = self.durations[(policy, metric.action)] = Histogram(self.buckets)
+            histogram.observe(metric.duration)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Recorded metric: {metric}")
+
+    def observe(self, name: str, seconds: float, policy_id: str = ""):
+        """Add a latency observation, such as one policy evaluation, to a histogram"""
+        with self._lock:
+            key = (name, self._policy_label(policy_id) if policy_id else "")
+            histogram = self.timings.get(key)
+            if histogram is None:
+                histogram = self.timings[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: float = 1.0):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0.0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Latest retained event per policy:resource"""
+        with self._lock:
+            events = list(self.history)
+        metrics: Dict[str, Any] = {}
+        for timestamp, policy_id, resource_id, action, status, duration in events:
+            metrics[f"{policy_id}:{resource_id}"] = {
+                "timestamp": datetime.utcfromtimestamp(timestamp),
+                "action": action,
+                "status": status,
+                "duration": duration
+            }
+        return metrics
+
+    def get_history(self, limit: Optional[int] = None) -> List[MetricData]:
+        """Retained events, oldest first"""
+        with self._lock:
+            events = list(self.history)
+        if limit is not None:
+            events = events[-limit:]
+        return [MetricData(policy_id, resource_id, action, status, duration)
+                for _, policy_id, resource_id, action, status, duration in events]
+
+    def get_counters(self) -> Dict[str, float]:
+        """A copy of the counters, safe to read while other threads record"""
+        with self._lock:
+            return dict(self.counters)
+
+    def get_gauges(self) -> Dict[str, float]:
+        """A copy of the gauges, safe to read while other threads record"""
+        with self._lock:
+            return dict(self.gauges)
+
+    def get_histogram(self, policy_id: str, action: str) -> Optional[Histogram]:
+        return self.durations.get((self._policies.get(policy_id, OVERFLOW_LABEL), action))
+
+    def get_timing(self, name: str, policy_id: str = "") -> Optional[Histogram]:
+        return self.timings.get((name, self._policies.get(policy_id, OVERFLOW_LABEL) if policy_id else ""))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters, gauges and histograms as JSON-serialisable data; the event ring is left out"""
+        with self._lock:
+            return {
+                "action_counts": [[*key, value] for key, value in self.action_counts.items()],
+                "durations": [[*key, histogram.state()] for key, histogram in self.durations.items()],
+                "timings": [[*key, histogram.state()] for key, histogram in self.timings.items()],
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        """Add another service's snapshot() into this one. Counters, histograms and gauges are summed"""
+        with self._lock:
+            for policy, action, status, value in snapshot["action_counts"]:
+                key = (self._policy_label(policy), action, status)
+                self.action_counts[key] = self.action_counts.get(key, 0.0) + value
+            for policy, action, state in snapshot["durations"]:
+                key = (self._policy_label(policy), action)
+                if key not in self.durations:
+                    self.durations[key] = Histogram(state["bounds"])
+                self.durations[key].merge(state)
+            for name, policy, state in snapshot["timings"]:
+                key = (name, self._policy_label(policy) if policy else "")
+                if key not in self.timings:
+                    self.timings[key] = Histogram(state["bounds"])
+                self.timings[key].merge(state)
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0.0) + value
+            for name, value in snapshot["gauges"].items():
+                self.gauges[name] = self.gauges.get(name, 0.0) + value
+
+    def render_prometheus(self) -> str:
+        """Every counter, gauge and histogram in Prometheus text exposition format"""
+        with self._lock:
+            lines: List[str] = []
+            render_counter(lines, "policy_actions_total", "Recorded policy events by action and status",
+                           ("policy", "action", "status"), self.action_counts)
+            render_histograms(lines, "policy_action_duration_seconds", "Duration of recorded policy events",
+                              ("policy", "action"), self.durations)
+            by_name: Dict[str, Dict[Tuple[str, ...], Histogram]] = {}
+            for (name, policy), histogram in self.timings.items():
+                by_name.setdefault(name, {})[(policy,) if policy else ()] = histogram
+            for name, series in sorted(by_name.items()):
+                label_names = ("policy",) if any(series) else ()
+                render_histograms(lines, f"{name}_seconds", name.replace("_", " "), label_names, series)
+            for name, value in sorted(self.counters.items()):
+                render_counter(lines, f"{name}_total", name.replace("_", " "), (), {(): value})
+            for name, value in sorted(self.gauges.items()):
+                render_counter(lines, name, name.replace("_", " "), (), {(): value}, kind="gauge")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,358 @@
+"""Sharded evaluation: the inventory split by (subscription, resource type) across worker processes.
+
+A fixed number of shards is laid out on a consistent-hash ring. Each worker
+process holds leases on one or more shards in a SQLite coordinator file and
+runs, per shard, an ordinary PolicyDaemon whose inventory only yields the
+resources that shard owns, so the inventory cache, condition matching,
+remediation and remediation state are all partitioned. Workers publish metric snapshots to the coordinator,
+where the parent process sums them for /metrics.
+
+Several hosts can share the shards by pointing at the same coordinator file
+and state directory, e.g. on a shared volume. A worker that cannot get a lease
+waits as a standby and takes over a shard whose owner stopped renewing.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from logging import getLogger
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from remediation import subscription_of
+from services.metrics import MetricsServer
+from services.monitoring_service import MonitoringService
+
+logger = getLogger(__name__)
+
+def shard_key(subscription_id: str, resource_type: str) -> str:
+    return f"{subscription_id.lower()}/{(resource_type or '').lower()}"
+
+def _hash(value: str) -> int:
+    # Stable across processes and hosts, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hashing of shard keys onto shards 0..shards-1.
+
+    Every shard owns `replicas` points on the ring. Changing the number of
+    shards moves only about 1/shards of the keys.
+    """
+
+    def __init__(self, shards: int, replicas: int = 64):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.shards = shards
+        points = sorted((_hash(f"shard-{shard}:{replica}"), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+        self._memo: Dict[str, int] = {}
+
+    def shard_for(self, key: str) -> int:
+        shard = self._memo.get(key)
+        if shard is None:
+            position = bisect_right(self._points, _hash(key)) % len(self._points)
+            shard = self._memo[key] = self._owners[position]
+        return shard
+
+    def owns(self, shard: int, resource: Any) -> bool:
+        return self.shard_for(shard_key(subscription_of(resource.id), resource.type)) == shard
+
+class ShardInventory:
+    """An inventory client whose listings keep only the resources of one shard"""
+
+    def __init__(self, inventory: Any, ring: HashRing, shard: int):
+        self.inventory = inventory
+        self.ring = ring
+        self.shard = shard
+
+    async def _owned(self, pages: AsyncIterator[List[Any]]) -> AsyncIterator[List[Any]]:
+        async for page in pages:
+            owned = [resource for resource in page if self.ring.owns(self.shard, resource)]
+            if owned:
+                yield owned
+
+    def list_subscription(self, subscription_id: Optional[str] = None) -> AsyncIterator[List[Any]]:
+        return self._owned(self.inventory.list_subscription(subscription_id))
+
+    def list_management_group(self, management_group_id: str) -> AsyncIterator[List[Any]]:
+        return self._owned(self.inventory.list_management_group(management_group_id))
+
+    async def close(self):
+        await self.inventory.close()
+
+class ShardCoordinator:
+    """Shard leases and metric snapshots in one SQLite file.
+
+    A lease is held until `expires` and must be renewed before then; once it
+    lapses any worker may acquire the shard. The number of shards is fixed when
+    the file is created, so every worker agrees on the ring.
+    """
+
+    def __init__(self, path: str, shards: int, lease_ttl: float = 30.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.shards = shards
+        self.lease_ttl = lease_ttl
+        self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._transaction():
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS leases (shard INTEGER PRIMARY KEY, owner TEXT, expires REAL)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots (shard INTEGER PRIMARY KEY, owner TEXT, updated REAL, body TEXT)"
+            )
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shards', ?)", (str(shards),))
+            existing = int(self.conn.execute("SELECT value FROM meta WHERE key = 'shards'").fetchone()[0])
+            if existing != shards:
+                raise ValueError(f"{self.path} was created for {existing} shards, not {shards}")
+            self.conn.executemany("INSERT OR IGNORE INTO leases (shard, owner, expires) VALUES (?, NULL, 0)",
+                                  [(shard,) for shard in range(shards)])
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers cannot claim one shard
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def acquire(self, owner: str, now: Optional[float] = None) -> Optional[int]:
+        """Lease the lowest free or expired shard to owner; None when all are held.
+
+        Shards already leased to owner are skipped even when expired, since
+        owner is still serving them and only has to renew.
+        """
+        now = time.time() if now is None else now
+        with self._transaction():
+            row = self.conn.execute(
+                "SELECT shard FROM leases WHERE (owner IS NULL OR expires < ?) AND owner IS NOT ? ORDER BY shard LIMIT 1",
+                (now, owner)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE leases SET owner = ?, expires = ? WHERE shard = ?",
+                              (owner, now + self.lease_ttl, row[0]))
+        return row[0]
+
+    def renew(self, shard: int, owner: str, now: Optional[float] = None) -> bool:
+        """Extend owner's lease; False if it lapsed and another worker took the shard"""
+        now = time.time() if now is None else now
+        with self._transaction():
+            cursor = self.conn.execute("UPDATE leases SET expires = ? WHERE shard = ? AND owner = ?",
+                                       (now + self.lease_ttl, shard, owner))
+        return cursor.rowcount == 1
+
+    def release(self, shard: int, owner: str):
+        with self._transaction():
+            self.conn.execute("UPDATE leases SET owner = NULL, expires = 0 WHERE shard = ? AND owner = ?", (shard, owner))
+
+    def leases(self, now: Optional[float] = None) -> Dict[int, str]:
+        """shard -> owner for every lease that has not expired"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self.conn.execute("SELECT shard, owner FROM leases WHERE owner IS NOT NULL AND expires >= ?",
+                                     (now,)).fetchall()
+        return dict(rows)
+
+    def publish(self, shard: int, owner: str, snapshot: Dict[str, Any]) -> bool:
+        """Store owner's latest MonitoringService snapshot for a shard; False if owner no longer holds it"""
+        with self._transaction():
+            row = self.conn.execute("SELECT owner FROM leases WHERE shard = ?", (shard,)).fetchone()
+            if row is None or row[0] != owner:
+                return False
+            self.conn.execute("INSERT OR REPLACE INTO snapshots (shard, owner, updated, body) VALUES (?, ?, ?, ?)",
+                              (shard, owner, time.time(), json.dumps(snapshot)))
+        return True
+
+    def snapshots(self) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            rows = self.conn.execute("SELECT shard, body FROM snapshots").fetchall()
+        return {shard: json.loads(body) for shard, body in rows}
+
+    def close(self):
+        self.conn.close()
+
+class ShardMetrics:
+    """The sum of every shard's latest snapshot, rendered like a MonitoringService"""
+
+    def __init__(self, coordinator: ShardCoordinator):
+        self.coordinator = coordinator
+
+    def collect(self) -> MonitoringService:
+        monitoring = MonitoringService(history_size=1)
+        for snapshot in self.coordinator.snapshots().values():
+            monitoring.merge(snapshot)
+        monitoring.set_gauge("shards", self.coordinator.shards)
+        monitoring.set_gauge("shards_leased", len(self.coordinator.leases()))
+        return monitoring
+
+    def render_prometheus(self) -> str:
+        return self.collect().render_prometheus()
+
+@dataclass
+class ShardConfig:
+    """Everything a worker process needs to build its daemon; must pickle"""
+    subscription_id: str
+    # policy_loader.PolicySource; each worker loads (and reloads) policies itself
+    policy_source: Any
+    shards: int
+    coordinator: str = "./state/shards.db"
+    state_dir: str = "./state"
+    lease_ttl: float = 30.0
+    # PolicyDaemon and PolicyEngine keyword arguments, as for an unsharded daemon
+    daemon_options: Dict[str, Any] = field(default_factory=dict)
+    # Used instead of the ARM inventory when set, e.g. a synthetic one
+    inventory: Any = None
+    # Shards one worker leases and runs a daemon for; ShardedDaemon raises it when it has fewer workers than shards
+    shards_per_worker: int = 1
+
+def _build_daemon(config: ShardConfig, ring: HashRing, shard: int):
+    from policy_daemon import PolicyDaemon
+    inventory = config.inventory
+    if inventory is None:
+        from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+        from inventory import ArmInventoryClient
+        inventory = ArmInventoryClient(AsyncDefaultAzureCredential(), config.subscription_id)
+    state_dir = Path(config.state_dir) / f"shard-{shard}"
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return PolicyDaemon(config.subscription_id, config.policy_source.load(),
+                        inventory=ShardInventory(inventory, ring, shard), state_dir=str(state_dir),
+                        **config.daemon_options)
+
+def run_worker(config: ShardConfig, stop: Any):
+    """Worker process: lease up to config.shards_per_worker shards, run a daemon for each and renew until stop is set"""
+    # Ctrl-C reaches the whole process group; the parent decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    daemons: Dict[int, Any] = {}
+    reload_pending = threading.Event()
+
+    def request_reload(signum, frame):
+        reload_pending.set()
+        for daemon in list(daemons.values()):
+            daemon.request_reload()
+
+    # Before the first lease, so that SIGHUP to a standby or to a worker still loading policies doesn't kill it
+    signal.signal(signal.SIGHUP, request_reload)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    heartbeat = config.lease_ttl / 3
+    ring = HashRing(config.shards)
+    coordinator = ShardCoordinator(config.coordinator, config.shards, config.lease_ttl)
+
+    def renew():
+        for shard in list(daemons):
+            if not coordinator.renew(shard, owner):
+                # Another worker owns the shard now; stop before both act on it
+                logger.error(f"Worker {owner} lost the lease on shard {shard}")
+                daemons.pop(shard).stop()
+
+    try:
+        while True:
+            renew()
+            while len(daemons) < config.shards_per_worker:
+                shard = coordinator.acquire(owner)
+                if shard is None:
+                    break
+                logger.info(f"Worker {owner} leased shard {shard} of {config.shards}")
+                # A reload requested while the daemon loads its policies may not be in them
+                reload_pending.clear()
+                daemon = _build_daemon(config, ring, shard)
+                daemon.start()
+                daemons[shard] = daemon
+                if reload_pending.is_set():
+                    daemon.request_reload()
+                # Building a daemon can take a while; keep the other leases alive before the next one
+                renew()
+            for shard, daemon in daemons.items():
+                coordinator.publish(shard, owner, daemon.policy_engine.monitoring.snapshot())
+            if stop.wait(heartbeat):
+                return
+    finally:
+        for shard, daemon in daemons.items():
+            daemon.stop()
+            coordinator.publish(shard, owner, daemon.policy_engine.monitoring.snapshot())
+            coordinator.release(shard, owner)
+        coordinator.close()
+
+class ShardedDaemon:
+    """Runs `workers` shard worker processes on this host and restarts any that exit.
+
+    Has the same start()/stop()/request_reload() surface as PolicyDaemon.
+    """
+
+    def __init__(self, config: ShardConfig, workers: Optional[int] = None,
+                 metrics_port: Optional[int] = None, metrics_host: str = "127.0.0.1"):
+        self.workers = workers or config.shards
+        if self.workers < config.shards:
+            # Otherwise the shards beyond the workers would only be served by other hosts, if any
+            per_worker = -(-config.shards // self.workers)
+            logger.warning(f"{self.workers} workers for {config.shards} shards; each worker leases up to {per_worker}")
+            config = replace(config, shards_per_worker=max(config.shards_per_worker, per_worker))
+        self.config = config
+        # Checked and recorded before any worker starts
+        self.coordinator = ShardCoordinator(config.coordinator, config.shards, config.lease_ttl)
+        self.metrics = ShardMetrics(self.coordinator)
+        self.metrics_server = (MetricsServer(self.metrics, metrics_host, metrics_port)
+                               if metrics_port is not None else None)
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.processes: List[Any] = []
+        self.supervisor: Optional[threading.Thread] = None
+        self.running = False
+
+    def _spawn(self):
+        # Not daemonic: a worker loads its policy bundle through a ProcessPoolExecutor, and stop() reaps it
+        process = self.context.Process(target=run_worker, args=(self.config, self.stop_event))
+        process.start()
+        return process
+
+    def _supervise(self):
+        while not self.stop_event.wait(self.config.lease_ttl / 3):
+            for i, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.warning(f"Shard worker {process.pid} exited with {process.exitcode}; restarting")
+                    self.processes[i] = self._spawn()
+
+    def start(self):
+        self.running = True
+        self.processes = [self._spawn() for _ in range(self.workers)]
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self.supervisor.start()
+
+    def request_reload(self):
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    def stop(self, timeout: float = 30.0):
+        self.running = False
+        self.stop_event.set()
+        if self.supervisor is not None:
+            self.supervisor.join()
+            self.supervisor = None
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.coordinator.close()
@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Set, Tuple
+
+SYNCHRONOUS_MODES = {'off': 'OFF', 'normal': 'NORMAL', 'full': 'FULL'}
+
+class JsonStateStore(dict):
+    """The original whole-file JSON state, written atomically on flush."""
+
+    def __init__(self, path: Path, fsync: bool = True):
+        super().__init__()
+        self.path = Path(path)
+        self.fsync = fsync
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.update(json.load(f))
+
+    def keys_for_policy(self, policy_id: str) -> List[str]:
+        return [key for key, value in self.items() if value.get('policy_id') == policy_id]
+
+    def due_entries(self) -> List[Tuple[str, str]]:
+        return [(key, value['next_due']) for key, value in self.items() if value.get('next_due')]
+
+    def flush(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.flush()
+
+class SqliteStateStore(MutableMapping[str, Dict[str, Any]]):
+    """Remediation state in SQLite (WAL mode), read lazily and written in batches.
+
+    Reads go to the database on first access and are kept in an LRU cache of
+    cache_size entries. Writes and deletes are buffered until flush(), which
+    commits them in a single transaction.
+    Entries handed out are plain dicts, so callers that mutate one must assign
+    it back for the change to be persisted.
+    """
+
+    def __init__(self, path: Path, synchronous: str = 'normal', legacy_json: Optional[Path] = None,
+                 cache_size: int = 10000):
+        self.logger = getLogger(__name__)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={SYNCHRONOUS_MODES[synchronous.lower()]}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS remediation_state ("
+            "key TEXT PRIMARY KEY, policy_id TEXT, value TEXT NOT NULL, next_due TEXT)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(remediation_state)")}
+        if 'next_due' not in columns:
+            self.conn.execute("ALTER TABLE remediation_state ADD COLUMN next_due TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS remediation_state_policy ON remediation_state (policy_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS remediation_state_due ON remediation_state (next_due)")
+        self.cache_size = cache_size
+        self._loaded: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._deleted: Set[str] = set()
+        if legacy_json is not None:
+            self._migrate(Path(legacy_json))
+
+    def _migrate(self, legacy_json: Path):
+        if not legacy_json.exists():
+            return
+        with open(legacy_json, 'r') as f:
+            entries = json.load(f)
+        self.conn.execute("BEGIN")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO remediation_state (key, policy_id, value) VALUES (?, ?, ?)",
+            [(key, value.get('policy_id'), json.dumps(value)) for key, value in entries.items()]
+        )
+        self.conn.execute("COMMIT")
+        legacy_json.rename(legacy_json.with_suffix(legacy_json.suffix + '.migrated'))
+        self.logger.info(f"Migrated {len(entries)} remediation state entries from {legacy_json}")
+
+    def _fetch(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT value FROM remediation_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _stored_keys(self, keys: List[str]) -> Set[str]:
+        stored: Set[str] = set()
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key FROM remediation_state WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            stored.update(key for (key,) in rows)
+        return stored
+
+    def _cache(self, key: str, value: Dict[str, Any]):
+        self._loaded[key] = value
+        self._loaded.move_to_end(key)
+        # Pending writes live in _dirty, so an evicted entry is only ever re-read
+        while len(self._loaded) > self.cache_size:
+            self._loaded.popitem(last=False)
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        if key in self._deleted:
+            raise KeyError(key)
+        if key in self._dirty:
+            return self._dirty[key]
+        value = self._loaded.get(key)
+        if value is None:
+            value = self._fetch(key)
+            if value is None:
+                raise KeyError(key)
+        self._cache(key, value)
+        return value
+
+    def __setitem__(self, key: str, value: Dict[str, Any]):
+        self._deleted.discard(key)
+        self._dirty[key] = value
+        self._cache(key, value)
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self._dirty.pop(key, None)
+        self._loaded.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._deleted:
+            return False
+        if key in self._dirty or key in self._loaded:
+            return True
+        return self.conn.execute("SELECT 1 FROM remediation_state WHERE key = ?", (key,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set(self._dirty)
+        yield from list(self._dirty)
+        for (key,) in self.conn.execute("SELECT key FROM remediation_state").fetchall():
+            if key not in seen and key not in self._deleted:
+                yield key
+
+    def __len__(self) -> int:
+        count = self.conn.execute("SELECT COUNT(*) FROM remediation_state").fetchone()[0]
+        if not self.has_pending_writes:
+            return count
+        stored = self._stored_keys([*self._dirty, *self._deleted])
+        new_keys = sum(1 for key in self._dirty if key not in stored)
+        removed = sum(1 for key in self._deleted if key in stored)
+        return count + new_keys - removed
+
+    def keys_for_policy(self, policy_id: str) -> List[str]:
+        rows = self.conn.execute("SELECT key FROM remediation_state WHERE policy_id = ?", (policy_id,)).fetchall()
+        keys = {key for (key,) in rows if key not in self._deleted}
+        keys.update(key for key, value in self._dirty.items() if value.get('policy_id') == policy_id)
+        return sorted(keys)
+
+    def due_entries(self) -> List[Tuple[str, str]]:
+        """(key, next_due) for every entry with a pending timed action, without loading values"""
+        rows = self.conn.execute("SELECT key, next_due FROM remediation_state WHERE next_due IS NOT NULL").fetchall()
+        entries = {key: due for key, due in rows if key not in self._deleted}
+        entries.update((key, value['next_due']) for key, value in self._dirty.items() if value.get('next_due'))
+        return list(entries.items())
+
+    @property
+    def has_pending_writes(self) -> bool:
+        return bool(self._dirty or self._deleted)
+
+    def flush(self):
+        if not self.has_pending_writes:
+            return
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO remediation_state (key, policy_id, value, next_due) VALUES (?, ?, ?, ?)",
+                [(key, value.get('policy_id'), json.dumps(value), value.get('next_due')) for key, value in self._dirty.items()]
+            )
+            self.conn.executemany("DELETE FROM remediation_state WHERE key = ?", [(key,) for key in self._deleted])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self._dirty.clear()
+        self._deleted.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def open_state_store(backend: str, state_dir: Path, fsync: str = 'normal') -> MutableMapping[str, Dict[str, Any]]:
+    state_dir = Path(state_dir)
+    legacy_json = state_dir / 'remediation_state.json'
+    if backend == 'json':
+        return JsonStateStore(legacy_json, fsync=fsync.lower() != 'off')
+    if backend == 'sqlite':
+        return SqliteStateStore(state_dir / 'remediation_state.db', synchronous=fsync, legacy_json=legacy_json)
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+
+class FakeInventory:
+    """In-memory stand-in for ArmInventoryClient that serves fixed pages."""
+
+    def __init__(self, subscriptions: Optional[Dict[str, List[Any]]] = None,
+                 management_groups: Optional[Dict[str, List[str]]] = None, page_size: int = 2, page_delay: float = 0):
+        self.subscriptions = subscriptions or {}
+        self.management_groups = management_groups or {}
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.calls: List[str] = []
+
+    def upsert(self, subscription_id, resource):
+        """Add resource, or replace the one with the same id"""
+        resources = self.subscriptions.setdefault(subscription_id, [])
+        for i, existing in enumerate(resources):
+            if existing.id == resource.id:
+                resources[i] = resource
+                return
+        resources.append(resource)
+
+    def remove(self, subscription_id, resource_id):
+        self.subscriptions[subscription_id] = [
+            resource for resource in self.subscriptions.get(subscription_id, []) if resource.id != resource_id
+        ]
+
+    async def _pages(self, resources):
+        for start in range(0, len(resources), self.page_size):
+            await asyncio.sleep(self.page_delay)
+            yield list(resources[start:start + self.page_size])
+
+    async def list_subscription(self, subscription_id):
+        self.calls.append(f"sub:{subscription_id}")
+        async for page in self._pages(self.subscriptions.get(subscription_id, [])):
+            yield page
+
+    async def list_management_group(self, management_group_id):
+        self.calls.append(f"mg:{management_group_id}")
+        for subscription_id in self.management_groups.get(management_group_id, []):
+            async for page in self._pages(self.subscriptions.get(subscription_id, [])):
+                yield page
+
+    async def close(self):
+        pass
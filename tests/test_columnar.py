@@ -0,0 +1,154 @@
+import asyncio
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import columnar
+from columnar import ColumnarBatch
+from condition_compiler import compile_conditions
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+from fakes import FakeInventory
+
+VM_TYPE = "Microsoft.Compute/virtualMachines"
+
+FIELD_VALUES = {
+    "location": ["westus", "eastus", None],
+    "tags.environment": ["prod", "dev", None],
+    "properties.sku": [1, 1.0, True, "1", None],
+    "properties.ports": [[80, 443], [22], [], None],
+    "properties.name": ["web-01", "db-01", "", None],
+}
+OPERATORS = ["equals", "notEquals", "exists", "notExists", "contains"]
+CONDITION_VALUES = {
+    "location": ["westus", None],
+    "tags.environment": ["prod"],
+    "properties.sku": [1, True, "1"],
+    "properties.ports": [22, [22]],
+    "properties.name": ["web", "db-01"],
+}
+
+
+def random_resource(rng, i):
+    values = {field: rng.choice(options) for field, options in FIELD_VALUES.items()}
+    tags = {} if values["tags.environment"] is None else {"environment": values["tags.environment"]}
+    properties = {key.split(".")[1]: values[key] for key in FIELD_VALUES if key.startswith("properties.")}
+    return SimpleNamespace(id=f"vm{i}", type=VM_TYPE, name=f"vm{i}", resource_group="rg", location=values["location"],
+                           tags=tags, properties=properties if rng.random() < 0.9 else None)
+
+
+def random_conditions(rng):
+    conditions = []
+    for _ in range(rng.randint(0, 3)):
+        field = rng.choice(list(FIELD_VALUES))
+        operator = rng.choice(OPERATORS)
+        conditions.append(PolicyCondition(field=field, operator=operator, value=rng.choice(CONDITION_VALUES[field])))
+    return conditions
+
+
+def reference_matches(resources, conditions):
+    engine = PolicyEngine.__new__(PolicyEngine)
+    matches = []
+    for resource in resources:
+        try:
+            if engine._evaluate_conditions(resource, conditions):
+                matches.append(resource)
+        except TypeError:
+            # The reference raises where "contains" meets a non-container; the
+            # compiled and columnar evaluators treat that as no match
+            pass
+    return matches
+
+
+class TestColumnarBatch(unittest.TestCase):
+    def check_against_reference(self):
+        rng = random.Random(7)
+        resources = [random_resource(rng, i) for i in range(300)]
+        batch = ColumnarBatch(resources)
+        for _ in range(300):
+            conditions = random_conditions(rng)
+            self.assertEqual(batch.matches(compile_conditions(conditions)), reference_matches(resources, conditions),
+                             conditions)
+
+    def test_matches_reference_evaluation(self):
+        self.check_against_reference()
+
+    def test_matches_reference_evaluation_without_numpy(self):
+        with patch.object(columnar, "np", None):
+            self.check_against_reference()
+
+    def test_wide_columns_without_numpy(self):
+        resources = [SimpleNamespace(id=f"vm{i}", name=f"vm{i}", type=VM_TYPE) for i in range(1000)]
+        evaluator = compile_conditions([PolicyCondition(field="name", operator="contains", value="99")])
+
+        with patch.object(columnar, "np", None):
+            matches = ColumnarBatch(resources).matches(evaluator)
+
+        self.assertEqual([r.name for r in matches], ["vm99", "vm199", "vm299", "vm399", "vm499",
+                                                     "vm599", "vm699", "vm799", "vm899", "vm990", "vm991",
+                                                     "vm992", "vm993", "vm994", "vm995", "vm996", "vm997",
+                                                     "vm998", "vm999"])
+
+    def test_columns_and_masks_are_shared_across_policies(self):
+        resources = [SimpleNamespace(location="westus" if i % 2 else "eastus") for i in range(10)]
+        batch = ColumnarBatch(resources)
+        west = compile_conditions([PolicyCondition(field="location", operator="equals", value="westus")])
+
+        batch.matching_indices(west)
+        batch.matching_indices(compile_conditions(west.source))
+
+        self.assertEqual(list(batch.columns), [("location",)])
+        self.assertEqual(len(batch._masks), 1)
+
+    def test_empty_batch(self):
+        evaluator = compile_conditions([PolicyCondition(field="location", operator="exists")])
+        self.assertEqual(ColumnarBatch([]).matches(evaluator), [])
+
+
+class TestColumnarEngine(unittest.TestCase):
+    def make_engine(self, condition_evaluator):
+        engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name,
+                              condition_evaluator=condition_evaluator)
+        self.addCleanup(engine.remediation_state.conn.close)
+        engine._handle_remediation = AsyncMock()
+        return engine
+
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        rng = random.Random(3)
+        self.inventory = FakeInventory(page_size=50)
+        self.inventory.subscriptions["test-subscription-id"] = [random_resource(rng, i) for i in range(200)]
+
+    def test_report_matches_compiled_evaluator(self):
+        rng = random.Random(11)
+        policies = [
+            PolicyDefinition(
+                id=f"p{i}", name=f"p{i}", description="", resource_type=VM_TYPE, evaluation_frequency=60,
+                conditions=random_conditions(rng),
+                remediation_action=RemediationAction(type="delete", parameters={})
+            )
+            for i in range(8)
+        ]
+
+        compiled = asyncio.run(self.make_engine("compiled").evaluate_policies(policies))
+        engine = self.make_engine("columnar")
+        first = asyncio.run(engine.evaluate_policies(policies))
+        cached = asyncio.run(engine.evaluate_policies(policies))
+
+        self.assertTrue(compiled.violations)
+        self.assertEqual(first.violations, compiled.violations)
+        self.assertEqual(cached.violations, compiled.violations)
+        self.assertEqual(first.resources_scanned, compiled.resources_scanned)
+        order = [call.args[0].id for call in engine._handle_remediation.await_args_list]
+        self.assertEqual(order[:len(order) // 2], order[len(order) // 2:])
+
+    def test_unknown_evaluator_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.make_engine("vectorised")
+
+
+if __name__ == '__main__':
+    unittest.main()
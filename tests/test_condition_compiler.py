@@ -0,0 +1,103 @@
+import pickle
+import random
+import re
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from condition_compiler import compile_conditions
+from policy_engine import PolicyEngine
+from policy_types import PolicyCondition
+
+FIELDS = ["location", "tags.environment", "properties.encryption.enabled", "sku.name", "missing.path"]
+VALUES = [None, "westus", "prod", True, False, "Standard_LRS", ["westus", "eastus"], 3]
+OPERATORS = ["equals", "notEquals", "exists", "notExists", "contains"]
+
+
+def random_resource(rng):
+    def pick():
+        return rng.choice(VALUES)
+    tags = {key: pick() for key in rng.sample(["environment", "owner"], rng.randint(0, 2))}
+    return SimpleNamespace(
+        id=f"r{rng.random()}",
+        type="Microsoft.Storage/storageAccounts",
+        location=rng.choice(["westus", "eastus", None]),
+        tags=tags,
+        properties={"encryption": {"enabled": pick()}} if rng.random() < 0.7 else None,
+        sku=SimpleNamespace(name=rng.choice(["Standard_LRS", "Premium_LRS"])),
+    )
+
+
+class TestConditionCompiler(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.policy_engine = PolicyEngine('test-subscription-id', state_dir=self.state_dir.name)
+        self.addCleanup(self.policy_engine.remediation_state.conn.close)
+
+    def test_matches_reference_evaluation(self):
+        rng = random.Random(7)
+        resources = [random_resource(rng) for _ in range(200)]
+        for _ in range(300):
+            conditions = [
+                PolicyCondition(field=rng.choice(FIELDS), operator=rng.choice(OPERATORS), value=rng.choice(VALUES[:6]))
+                for _ in range(rng.randint(1, 4))
+            ]
+            evaluator = compile_conditions(conditions)
+            for resource in resources:
+                try:
+                    expected = self.policy_engine._evaluate_conditions(resource, conditions)
+                except TypeError:
+                    # contains on a non-container; the compiled form reports no match
+                    self.assertFalse(evaluator(resource))
+                    continue
+                self.assertEqual(evaluator(resource), expected, (conditions, resource))
+
+    def test_reads_tags_and_properties(self):
+        resource = SimpleNamespace(tags={"environment": "prod"}, properties={"accessKeys": {"enabled": True}})
+        self.assertTrue(compile_conditions([PolicyCondition(field="tags.environment", operator="equals", value="prod")])(resource))
+        self.assertTrue(compile_conditions([PolicyCondition(field="properties.accessKeys.enabled", operator="exists")])(resource))
+        self.assertTrue(compile_conditions([PolicyCondition(field="tags.owner", operator="notExists")])(resource))
+
+    def test_orders_cheap_conditions_first(self):
+        conditions = [
+            PolicyCondition(field="tags.environment", operator="contains", value="pr"),
+            PolicyCondition(field="location", operator="notEquals", value="westus"),
+            PolicyCondition(field="properties.a.b", operator="exists"),
+            PolicyCondition(field="location", operator="equals", value="eastus"),
+        ]
+        evaluator = compile_conditions(conditions)
+        self.assertEqual([c.operator for c in evaluator.conditions], ["equals", "exists", "notEquals", "contains"])
+
+    def test_in_and_matches_operators(self):
+        resources = [
+            SimpleNamespace(location="westus2", sku=SimpleNamespace(name="Standard_LRS")),
+            SimpleNamespace(location="eastus", sku=SimpleNamespace(name="Premium_LRS")),
+            SimpleNamespace(location=None, sku=None),
+        ]
+        conditions = [
+            [PolicyCondition(field="location", operator="in", value=["eastus", "westus2"])],
+            [PolicyCondition(field="location", operator="matches", value="^west")],
+            [PolicyCondition(field="sku.name", operator="matches", value="_LRS$"),
+             PolicyCondition(field="location", operator="in", value=["eastus"])],
+        ]
+        for policy_conditions in conditions:
+            evaluator = compile_conditions(policy_conditions)
+            for resource in resources:
+                expected = self.policy_engine._evaluate_conditions(resource, policy_conditions)
+                self.assertEqual(evaluator(resource), expected, (policy_conditions, resource))
+        self.assertEqual([c.operator for c in compile_conditions(conditions[2]).conditions], ["in", "matches"])
+
+    def test_invalid_pattern_fails_when_policy_is_loaded(self):
+        with self.assertRaises(re.error):
+            compile_conditions([PolicyCondition(field="name", operator="matches", value="(")])
+
+    def test_evaluator_survives_pickling(self):
+        evaluator = compile_conditions([PolicyCondition(field="location", operator="equals", value="westus")])
+        restored = pickle.loads(pickle.dumps(evaluator))
+        self.assertTrue(restored(SimpleNamespace(location="westus")))
+        self.assertFalse(restored(SimpleNamespace(location="eastus")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from config import Config
+from delta_inventory import DeltaTracker
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, TimingConfig
+from resource_index import ResourceIndex
+from fakes import FakeInventory
+
+SUB = "test-subscription-id"
+VM_TYPE = "Microsoft.Compute/virtualMachines"
+SA_TYPE = "Microsoft.Storage/storageAccounts"
+
+
+def make_resource(name, resource_type=VM_TYPE, location="westus", changed_time=None, **tags):
+    return SimpleNamespace(id=f"/subscriptions/{SUB}/resourceGroups/rg/providers/{resource_type}/{name}",
+                           type=resource_type, name=name, resource_group="rg", location=location, tags=tags,
+                           changed_time=changed_time)
+
+
+def make_policy(policy_id, conditions, resource_type=VM_TYPE, timing=None):
+    return PolicyDefinition(
+        id=policy_id, name=policy_id, description=policy_id, resource_type=resource_type, evaluation_frequency=60,
+        conditions=conditions, remediation_action=RemediationAction(type="delete", parameters={}, timing=timing)
+    )
+
+
+WEST = make_policy("west", [PolicyCondition(field="location", operator="equals", value="westus")])
+UNOWNED = make_policy("unowned", [PolicyCondition(field="tags.owner", operator="notExists")])
+
+
+class TestDeltaTracker(unittest.TestCase):
+    def test_reports_added_modified_and_removed(self):
+        tracker = DeltaTracker()
+        first = ResourceIndex([make_resource("a"), make_resource("b"), make_resource("c")])
+        self.assertEqual(tracker.observe(first), [])
+        self.assertEqual(tracker.observe(first), [])
+        self.assertEqual(tracker.generation, 1)
+
+        second = ResourceIndex([make_resource("a"), make_resource("b", location="eastus"), make_resource("d")])
+        removed = tracker.observe(second)
+
+        self.assertEqual([r.name for r in removed], ["c"])
+        self.assertEqual({i.rsplit("/", 1)[1] for i in tracker.changed_since(1)}, {"b", "c", "d"})
+        self.assertEqual(tracker.changed_since(2), set())
+        self.assertIsNone(tracker.changed_since(-1))
+
+    def test_changed_time_takes_precedence_over_content(self):
+        tracker = DeltaTracker()
+        tracker.observe(ResourceIndex([make_resource("a", changed_time="2024-01-01T00:00:00Z")]))
+        tracker.observe(ResourceIndex([make_resource("a", location="eastus", changed_time="2024-01-01T00:00:00Z")]))
+        self.assertEqual(tracker.changed_since(1), set())
+
+    def test_old_generations_fall_out_of_history(self):
+        tracker = DeltaTracker(history=2)
+        for location in ("westus", "eastus", "westus", "eastus"):
+            tracker.observe(ResourceIndex([make_resource("a", location=location)]))
+        self.assertIsNotNone(tracker.changed_since(2))
+        self.assertIsNone(tracker.changed_since(1))
+
+
+class TestIncrementalEvaluation(unittest.TestCase):
+    def make_engine(self, incremental=True):
+        config = Config(None)
+        # Every evaluation lists the scope again, as each tick would once the TTL passes
+        config.config = {"cache_timeout": 0}
+        engine = PolicyEngine(SUB, inventory=self.inventory, state_dir=self.state_dir.name, config=config,
+                              incremental=incremental)
+        self.addCleanup(engine.remediation_state.conn.close)
+        engine._handle_remediation = AsyncMock()
+        engine._send_warning = AsyncMock()
+        return engine
+
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = FakeInventory()
+        for i in range(10):
+            self.inventory.upsert(SUB, make_resource(f"vm{i}", location="westus" if i % 2 else "eastus"))
+        self.inventory.upsert(SUB, make_resource("sa0", resource_type=SA_TYPE))
+        self.engine = self.make_engine()
+
+    def evaluate(self, policies=(WEST, UNOWNED)):
+        return asyncio.run(self.engine.evaluate_policies(list(policies)))
+
+    def test_unchanged_listing_reuses_every_result(self):
+        first = self.evaluate()
+        second = self.evaluate()
+
+        self.assertEqual(self.inventory.calls, [f"sub:{SUB}"] * 2)
+        self.assertEqual(first.resources_reused, 0)
+        self.assertEqual(second.resources_reused, 20)
+        self.assertEqual(second.violations, first.violations)
+        self.assertEqual(self.engine._handle_remediation.await_count, 2 * (5 + 10))
+
+    def test_only_changed_resources_are_evaluated(self):
+        self.evaluate()
+        self.inventory.upsert(SUB, make_resource("vm0", location="westus", owner="me"))
+        self.inventory.upsert(SUB, make_resource("vm10", location="westus"))
+
+        with patch('predicate_index.PredicateIndex.match', autospec=True, side_effect=lambda index, r: [
+                position for position, (_, evaluator) in enumerate(index.entries) if evaluator(r)]) as match:
+            report = self.evaluate()
+
+        self.assertEqual(sorted(call.args[1].name for call in match.call_args_list), ["vm0", "vm10"])
+        self.assertEqual(report.resources_reused, 2 * 9)
+        self.assertEqual(report.violations[make_resource("vm0").id], ["west"])
+        self.assertEqual(report.violations[make_resource("vm10").id], ["west", "unowned"])
+
+    def test_deleted_resources_lose_their_state(self):
+        delayed = make_policy("delayed", [PolicyCondition(field="location", operator="equals", value="westus")],
+                              timing=TimingConfig(delay="7d", warning_threshold="5d"))
+        del self.engine._handle_remediation
+        self.engine.remediation_pool.submit = AsyncMock()
+        self.evaluate([delayed])
+        key = self.engine._get_resource_key(make_resource("vm1"))
+        self.assertIn(key, self.engine.remediation_state)
+
+        self.inventory.remove(SUB, make_resource("vm1").id)
+        report = self.evaluate([UNOWNED])
+
+        self.assertNotIn(key, self.engine.remediation_state)
+        self.assertNotIn(key, dict(self.engine.remediation_state.due_entries()))
+        self.assertNotIn(make_resource("vm1").id, report.violations)
+
+    def test_new_and_changed_policies_are_evaluated_in_full(self):
+        self.evaluate([WEST])
+        report = self.evaluate([WEST, UNOWNED])
+        self.assertEqual(report.resources_reused, 10)
+
+        narrowed = make_policy("west", [PolicyCondition(field="location", operator="equals", value="westus"),
+                                        PolicyCondition(field="tags.owner", operator="exists")])
+        report = self.evaluate([narrowed, UNOWNED])
+        self.assertEqual(report.resources_reused, 10)
+        # Nothing has an owner, so the narrowed policy no longer matches anything
+        self.assertEqual({tuple(v) for v in report.violations.values()}, {("unowned",)})
+
+    def test_matches_full_evaluation_through_random_changes(self):
+        rng = random.Random(4)
+        reference = self.make_engine(incremental=False)
+        policies = [WEST, UNOWNED, make_policy("sa-east", [PolicyCondition(field="location", operator="in",
+                                                                             value=["eastus"])], SA_TYPE)]
+        for _ in range(25):
+            for _ in range(rng.randint(0, 4)):
+                name = f"vm{rng.randrange(14)}"
+                if rng.random() < 0.25:
+                    self.inventory.remove(SUB, make_resource(name).id)
+                else:
+                    tags = {"owner": "x"} if rng.random() < 0.5 else {}
+                    self.inventory.upsert(SUB, make_resource(name, location=rng.choice(["westus", "eastus"]), **tags))
+            incremental = self.evaluate(policies)
+            full = asyncio.run(reference.evaluate_policies(policies))
+            self.assertEqual(incremental.violations, full.violations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from due_index import DueIndex
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, TimingConfig
+from fakes import FakeInventory
+
+VM_TYPE = "Microsoft.Compute/virtualMachines"
+
+
+def make_resource(name, location="westus"):
+    return SimpleNamespace(
+        id=f"/subscriptions/test-subscription-id/resourceGroups/rg/providers/{VM_TYPE}/{name}",
+        type=VM_TYPE, name=name, resource_group="rg", tags={}, location=location
+    )
+
+
+def make_policy():
+    return PolicyDefinition(
+        id="delayed-delete",
+        name="delayed-delete",
+        description="delayed-delete",
+        resource_type=VM_TYPE,
+        evaluation_frequency=60,
+        conditions=[PolicyCondition(field="location", operator="equals", value="westus")],
+        remediation_action=RemediationAction(
+            type="delete", parameters={}, timing=TimingConfig(delay="7d", warning_threshold="5d")
+        )
+    )
+
+
+class TestDueIndex(unittest.TestCase):
+    def test_pops_in_due_order_and_honours_reschedule(self):
+        index = DueIndex([("a", "2024-01-03T00:00:00"), ("b", "2024-01-01T00:00:00")])
+        index.push("c", "2024-01-02T00:00:00")
+        index.push("b", "2024-01-05T00:00:00")
+        index.discard("c")
+
+        self.assertEqual(index.next_due(), datetime(2024, 1, 3))
+        self.assertEqual(index.pop_due(datetime(2024, 1, 4)), ["a"])
+        self.assertEqual(index.pop_due(datetime(2024, 1, 4)), [])
+        self.assertEqual(index.pop_due(datetime(2024, 1, 6)), ["b"])
+        self.assertIsNone(index.next_due())
+        self.assertEqual(len(index), 0)
+
+
+class TestDueActions(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = FakeInventory()
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.addCleanup(self.policy_engine.remediation_state.conn.close)
+        self.policy_engine._send_warning = AsyncMock()
+        self.policy_engine.remediation_pool.submit = AsyncMock()
+        self.policy = make_policy()
+        self.vm = make_resource("vm1")
+        self.key = self.policy_engine._get_resource_key(self.vm)
+        self.inventory.subscriptions["test-subscription-id"] = [self.vm]
+
+    def first_violation(self):
+        asyncio.run(self.policy_engine.evaluate_policy(self.policy))
+        return datetime.fromisoformat(self.policy_engine.remediation_state[self.key]["first_violation"])
+
+    def test_warning_and_remediation_fire_on_time_without_a_scan(self):
+        first = self.first_violation()
+        self.assertEqual(self.policy_engine.due_index.next_due(), first + timedelta(days=5))
+
+        self.assertEqual(asyncio.run(self.policy_engine.process_due_actions(first + timedelta(days=4))), 0)
+        self.assertEqual(asyncio.run(self.policy_engine.process_due_actions(first + timedelta(days=5, seconds=1))), 1)
+        self.policy_engine._send_warning.assert_awaited_once()
+        self.assertEqual(self.policy_engine.due_index.next_due(), first + timedelta(days=7))
+
+    def test_remediation_fires_when_delay_elapses(self):
+        first = self.first_violation()
+        state = self.policy_engine.remediation_state[self.key]
+        state["warnings_sent"].append("warning_sent")
+        self.policy_engine.remediation_state[self.key] = state
+        self.policy_engine.due_index.push(self.key, (first + timedelta(days=7)).isoformat())
+
+        asyncio.run(self.policy_engine.process_due_actions(first + timedelta(days=7, seconds=1)))
+
+        task = self.policy_engine.remediation_pool.submit.await_args.args[0]
+        self.assertEqual((task.resource.id, task.action), (self.vm.id, "remediation"))
+
+    def test_due_action_drops_resource_that_became_compliant(self):
+        first = self.first_violation()
+        cached = self.policy_engine.resource_cache.peek("all")
+        next(iter(cached)).location = "eastus"
+
+        asyncio.run(self.policy_engine.process_due_actions(first + timedelta(days=6)))
+
+        self.assertNotIn(self.key, self.policy_engine.remediation_state)
+        self.policy_engine._send_warning.assert_not_awaited()
+
+    def test_scan_sweeps_entries_that_no_longer_violate(self):
+        self.first_violation()
+        self.policy_engine.resource_cache.clear()
+        self.inventory.subscriptions["test-subscription-id"] = [make_resource("vm1", location="eastus")]
+
+        asyncio.run(self.policy_engine.evaluate_policy(self.policy))
+
+        self.assertNotIn(self.key, self.policy_engine.remediation_state)
+        self.assertEqual(self.policy_engine.remediation_state.due_entries(), [])
+        self.assertIsNone(self.policy_engine.due_index.next_due())
+
+    def test_failed_due_action_is_retried_with_backoff(self):
+        first = self.first_violation()
+        self.policy_engine._send_warning.side_effect = [RuntimeError("mail relay down"), RuntimeError("again"), None]
+        due = first + timedelta(days=5, seconds=1)
+
+        self.assertEqual(asyncio.run(self.policy_engine.process_due_actions(due)), 0)
+        self.assertEqual(self.policy_engine.due_index.next_due(), due + timedelta(seconds=60))
+        self.assertEqual(asyncio.run(self.policy_engine.process_due_actions(due + timedelta(seconds=60))), 0)
+        self.assertEqual(self.policy_engine.due_index.next_due(), due + timedelta(seconds=180))
+        self.assertEqual(asyncio.run(self.policy_engine.process_due_actions(due + timedelta(seconds=180))), 1)
+
+        self.assertEqual(self.policy_engine.due_index.next_due(), first + timedelta(days=7))
+        self.assertNotIn("due_failures", self.policy_engine.remediation_state[self.key])
+        self.assertEqual(self.policy_engine.monitoring.get_counters()["due_action_failed"], 2)
+
+    def test_due_entry_of_unregistered_policy_is_dropped(self):
+        first = self.first_violation()
+        self.policy_engine.policies.pop(self.policy.id)
+
+        self.assertEqual(asyncio.run(self.policy_engine.process_due_actions(first + timedelta(days=6))), 0)
+        self.assertIsNone(self.policy_engine.due_index.next_due())
+        self.policy_engine._send_warning.assert_not_awaited()
+
+    def test_index_is_rebuilt_from_state_on_restart(self):
+        first = self.first_violation()
+
+        restarted = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.addCleanup(restarted.remediation_state.conn.close)
+
+        self.assertEqual(restarted.due_index.next_due(), first + timedelta(days=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
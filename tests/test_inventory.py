@@ -0,0 +1,149 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from inventory import ArmInventoryClient, parse_resource_group
+
+
+class FakeCredential:
+    async def get_token(self, *scopes):
+        return SimpleNamespace(token="fake-token", expires_on=time.time() + 3600)
+
+    async def close(self):
+        pass
+
+
+def arm_resource(subscription_id, index):
+    return {
+        "id": f"/subscriptions/{subscription_id}/resourceGroups/rg-{index % 3}/providers/Microsoft.Storage/storageAccounts/sa{index}",
+        "name": f"sa{index}",
+        "type": "Microsoft.Storage/storageAccounts",
+        "location": "westeurope",
+        "tags": {"environment": "prod"} if index % 2 else {},
+    }
+
+
+class FakeArmServer:
+    """Serves ARM-shaped paginated listings for a few subscriptions."""
+
+    def __init__(self, subscriptions, page_size=5, delay=0.0, throttle_first=False):
+        self.subscriptions = subscriptions
+        self.page_size = page_size
+        self.delay = delay
+        self.throttle_first = throttle_first
+        self.requests = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        app = web.Application()
+        app.router.add_get("/subscriptions/{sub}/resources", self.list_resources)
+        app.router.add_get("/providers/Microsoft.Management/managementGroups/{mg}/descendants", self.descendants)
+        self.server = TestServer(app)
+
+    @property
+    def base_url(self):
+        return str(self.server.make_url("")).rstrip("/")
+
+    async def list_resources(self, request):
+        self.requests.append(str(request.rel_url))
+        assert request.headers["Authorization"] == "Bearer fake-token"
+        assert request.query["api-version"]
+        if self.throttle_first:
+            self.throttle_first = False
+            return web.Response(status=429, headers={"Retry-After": "0"})
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+
+        subscription_id = request.match_info["sub"]
+        skip = int(request.query.get("$skiptoken", 0))
+        count = self.subscriptions[subscription_id]
+        value = [arm_resource(subscription_id, i) for i in range(skip, min(skip + self.page_size, count))]
+        if "changedTime" in request.query.get("$expand", ""):
+            for item in value:
+                item["changedTime"] = "2024-05-01T12:00:00.0000000Z"
+        body = {"value": value}
+        if skip + self.page_size < count:
+            next_url = self.server.make_url(request.path).with_query({
+                "api-version": request.query["api-version"],
+                "$expand": request.query.get("$expand", ""),
+                "$skiptoken": str(skip + self.page_size),
+            })
+            body["nextLink"] = str(next_url)
+        return web.json_response(body)
+
+    async def descendants(self, request):
+        value = [
+            {"id": f"/subscriptions/{sub}", "name": sub, "type": "Microsoft.Management/managementGroups/subscriptions"}
+            for sub in self.subscriptions
+        ]
+        value.append({"id": "/providers/Microsoft.Management/managementGroups/child", "name": "child",
+                      "type": "Microsoft.Management/managementGroups"})
+        return web.json_response({"value": value})
+
+
+class TestArmInventoryClient(unittest.IsolatedAsyncioTestCase):
+    async def start_server(self, **kwargs):
+        server = FakeArmServer(**kwargs)
+        await server.server.start_server()
+        self.addAsyncCleanup(server.server.close)
+        client = ArmInventoryClient(FakeCredential(), "sub-a", base_url=server.base_url)
+        self.addAsyncCleanup(client.close)
+        return server, client
+
+    async def test_follows_next_links(self):
+        server, client = await self.start_server(subscriptions={"sub-a": 12})
+
+        pages = [page async for page in client.list_subscription()]
+
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        resource = pages[0][1]
+        self.assertEqual(resource.name, "sa1")
+        self.assertEqual(resource.resource_group, "rg-1")
+        self.assertEqual(resource.tags, {"environment": "prod"})
+        self.assertEqual(pages[2][0].changed_time, "2024-05-01T12:00:00.0000000Z")
+        self.assertEqual(len(server.requests), 3)
+
+    async def test_management_group_fans_out_in_parallel(self):
+        server, client = await self.start_server(subscriptions={"sub-a": 10, "sub-b": 10, "sub-c": 10}, delay=0.05)
+
+        pages = [page async for page in client.list_management_group("mg-root")]
+
+        ids = {resource.id for page in pages for resource in page}
+        self.assertEqual(len(ids), 30)
+        self.assertEqual(server.peak_in_flight, 3)
+
+    async def test_retries_throttled_requests(self):
+        server, client = await self.start_server(subscriptions={"sub-a": 3}, throttle_first=True)
+
+        pages = [page async for page in client.list_subscription("sub-a")]
+
+        self.assertEqual(sum(len(page) for page in pages), 3)
+        self.assertEqual(len(server.requests), 2)
+
+    async def test_prefetches_next_page_while_caller_works(self):
+        server, client = await self.start_server(subscriptions={"sub-a": 20})
+
+        requests_seen = []
+        async for page in client.list_subscription("sub-a"):
+            await asyncio.sleep(0.02)
+            requests_seen.append(len(server.requests))
+
+        # The fetch for later pages was already issued before the caller finished the first
+        self.assertGreater(requests_seen[0], 1)
+
+
+class TestParseResourceGroup(unittest.TestCase):
+    def test_parse_resource_group(self):
+        self.assertEqual(parse_resource_group("/subscriptions/s/resourceGroups/my-rg/providers/X/y/z"), "my-rg")
+        self.assertEqual(parse_resource_group("/subscriptions/s/resourcegroups/other/providers/X/y/z"), "other")
+        self.assertIsNone(parse_resource_group("/subscriptions/s"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from config import Config
+from inventory_cache import InventoryCache
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+from fakes import FakeInventory
+
+VM_TYPE = "Microsoft.Compute/virtualMachines"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_policy(policy_id):
+    return PolicyDefinition(
+        id=policy_id,
+        name=policy_id,
+        description=policy_id,
+        resource_type=VM_TYPE,
+        evaluation_frequency=60,
+        conditions=[PolicyCondition(field="location", operator="equals", value="westus")],
+        remediation_action=RemediationAction(type="delete", parameters={})
+    )
+
+
+class TestInventoryCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    async def test_per_scope_ttl(self):
+        cache = InventoryCache(default_ttl=300, ttls={"mg:": 900, "sub:hot": 30}, clock=self.clock)
+        for key in ("mg:root", "sub:hot", "sub:cold"):
+            cache.set(key, [key])
+
+        self.clock.now = 60
+        self.assertEqual(cache.get("mg:root"), ["mg:root"])
+        self.assertIsNone(cache.get("sub:hot"))
+        self.assertEqual(cache.get("sub:cold"), ["sub:cold"])
+
+    async def test_stale_entry_is_served_while_refreshing(self):
+        cache = InventoryCache(default_ttl=10, stale_ttl=50, clock=self.clock)
+        cache.set("sub:a", ["old"])
+        refresh = AsyncMock(return_value=["new"])
+
+        self.clock.now = 20
+        self.assertEqual(cache.get("sub:a", refresh=refresh), ["old"])
+        self.assertEqual(cache.get("sub:a", refresh=refresh), ["old"])
+        await asyncio.sleep(0)
+
+        refresh.assert_awaited_once()
+        self.assertEqual(cache.get("sub:a"), ["new"])
+        self.assertEqual(cache.stats["stale_hits"], 2)
+        self.assertEqual(cache.stats["refreshes"], 1)
+
+        self.clock.now = 100
+        self.assertIsNone(cache.get("sub:a", refresh=refresh))
+
+    async def test_failed_refresh_keeps_stale_entry(self):
+        cache = InventoryCache(default_ttl=10, stale_ttl=50, clock=self.clock)
+        cache.set("sub:a", ["old"])
+        self.clock.now = 20
+
+        cache.get("sub:a", refresh=AsyncMock(side_effect=RuntimeError("throttled")))
+        await asyncio.sleep(0)
+
+        self.assertEqual(cache.peek("sub:a"), ["old"])
+        self.assertEqual(cache.stats["refresh_failures"], 1)
+        self.assertIsNone(cache.inflight("sub:a"))
+
+    async def test_lru_eviction_by_entries_and_resources(self):
+        cache = InventoryCache(max_entries=2, max_resources=5, clock=self.clock)
+        cache.set("a", [1, 2])
+        cache.set("b", [1])
+        cache.get("a")
+        cache.set("c", [1])
+        self.assertEqual(list(cache.entries), ["a", "c"])
+
+        cache.set("d", [1, 2, 3, 4])
+        self.assertEqual(list(cache.entries), ["c", "d"])
+        self.assertEqual(cache.total_resources, 5)
+
+        cache.set("huge", list(range(10)))
+        self.assertEqual(list(cache.entries), ["huge"])
+        self.assertEqual(cache.stats["evictions"], 4)
+
+    async def test_waiters_share_one_load(self):
+        cache = InventoryCache()
+        cache.begin("sub:a")
+        waiters = [asyncio.ensure_future(cache.wait(cache.inflight("sub:a"))) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        cache.complete("sub:a", ["r"])
+
+        self.assertEqual(await asyncio.gather(*waiters), [["r"]] * 3)
+        self.assertEqual((cache.stats["misses"], cache.stats["coalesced"]), (1, 3))
+
+    async def test_invalidated_load_is_not_joined_or_cached(self):
+        cache = InventoryCache()
+        narrow = cache.begin("sub:a")
+        waiter = asyncio.ensure_future(cache.wait(narrow))
+        await asyncio.sleep(0)
+
+        cache.invalidate()
+        self.assertIsNone(cache.inflight("sub:a"))
+        wide = cache.begin("sub:a")
+        cache.complete("sub:a", ["narrow"], narrow)
+
+        self.assertEqual(await waiter, ["narrow"])
+        self.assertIsNone(cache.peek("sub:a"))
+        self.assertIs(cache.inflight("sub:a"), wide)
+        cache.complete("sub:a", ["wide"], wide)
+        self.assertEqual(cache.peek("sub:a"), ["wide"])
+
+
+
+class TestEngineInventoryCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = FakeInventory(page_delay=0.001)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.policy_engine._handle_remediation = AsyncMock()
+
+    async def asyncTearDown(self):
+        await self.policy_engine.close()
+
+    async def test_concurrent_evaluations_list_scope_once(self):
+        self.inventory.subscriptions["test-subscription-id"] = [
+            SimpleNamespace(id=f"vm{i}", type=VM_TYPE, name=f"vm{i}", resource_group="rg", tags={}, location="westus")
+            for i in range(5)
+        ]
+
+        await asyncio.gather(*(self.policy_engine.evaluate_policy(make_policy(f"p{i}")) for i in range(4)))
+
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"])
+        self.assertEqual(self.policy_engine._handle_remediation.await_count, 20)
+        counters = self.policy_engine.monitoring.get_counters()
+        self.assertEqual(counters["inventory_cache_misses"], 1)
+        self.assertEqual(counters["inventory_cache_coalesced"], 3)
+
+    async def test_empty_listing_is_cached(self):
+        await self.policy_engine.evaluate_policy(make_policy("p1"))
+        await self.policy_engine.evaluate_policy(make_policy("p2"))
+
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"])
+
+    async def test_ttls_come_from_config(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+            f.write("cache_timeout: 120\ncache:\n  stale_timeout: 600\n  ttls:\n    'mg:': 1800\n  max_entries: 16\n")
+        self.addCleanup(os.unlink, f.name)
+        config = Config(f.name)
+        engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name, config=config)
+        self.addAsyncCleanup(engine.close)
+
+        cache = engine.resource_cache
+        self.assertEqual((cache.ttl_for("sub:x"), cache.ttl_for("mg:root")), (120, 1800))
+        self.assertEqual((cache.stale_ttl, cache.max_entries), (600, 16))
+
+
+if __name__ == '__main__':
+    unittest.main()
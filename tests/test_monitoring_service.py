@@ -0,0 +1,133 @@
+import threading
+import unittest
+import urllib.request
+
+from services.metrics import Histogram, MetricsServer, RingBuffer
+from services.monitoring_service import MetricData, MonitoringService
+
+
+def metric(policy_id="p1", resource_id="r1", action="remediation", status="success", duration=0.02):
+    return MetricData(policy_id, resource_id, action, status, duration)
+
+
+class TestMonitoringService(unittest.TestCase):
+    def test_history_is_kept_and_bounded(self):
+        monitoring = MonitoringService(history_size=3)
+        monitoring.record_metric(metric(action="violation_detected", status="pending"))
+        monitoring.record_metric(metric(action="remediation", status="success"))
+
+        self.assertEqual([m.action for m in monitoring.get_history()], ["violation_detected", "remediation"])
+        self.assertEqual(monitoring.get_metrics()["p1:r1"]["status"], "success")
+
+        for i in range(5):
+            monitoring.record_metric(metric(resource_id=f"r{i + 2}"))
+        self.assertEqual([m.resource_id for m in monitoring.get_history()], ["r4", "r5", "r6"])
+        self.assertEqual(len(monitoring.get_metrics()), 3)
+
+    def test_counts_and_histograms_per_policy_and_action(self):
+        monitoring = MonitoringService()
+        monitoring.record_metric(metric(duration=0.02))
+        monitoring.record_metric(metric(duration=3))
+        monitoring.record_metric(metric(status="failed", duration=0.02))
+
+        self.assertEqual(monitoring.action_counts[("p1", "remediation", "success")], 2)
+        self.assertEqual(monitoring.action_counts[("p1", "remediation", "failed")], 1)
+        histogram = monitoring.get_histogram("p1", "remediation")
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.quantile(0.5), 0.025)
+
+    def test_policy_labels_are_capped(self):
+        monitoring = MonitoringService(max_policies=2)
+        for i in range(5):
+            monitoring.record_metric(metric(policy_id=f"p{i}"))
+
+        policies = {policy for policy, _, _ in monitoring.action_counts}
+        self.assertEqual(policies, {"p0", "p1", "__other__"})
+        self.assertEqual(monitoring.action_counts[("__other__", "remediation", "success")], 3)
+
+    def test_concurrent_recording_loses_nothing(self):
+        monitoring = MonitoringService(history_size=100)
+
+        def record():
+            for _ in range(1000):
+                monitoring.record_metric(metric())
+                monitoring.increment("events")
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(monitoring.action_counts[("p1", "remediation", "success")], 8000)
+        self.assertEqual(monitoring.get_counters()["events"], 8000)
+        self.assertEqual(len(monitoring.get_history()), 100)
+
+    def test_scrape_while_gauges_are_set(self):
+        monitoring = MonitoringService()
+
+        def set_gauges():
+            for i in range(20000):
+                monitoring.set_gauge(f"gauge_{i}", i)
+
+        thread = threading.Thread(target=set_gauges)
+        thread.start()
+        while thread.is_alive():
+            monitoring.render_prometheus()
+            monitoring.get_gauges()
+        thread.join()
+
+        gauges = monitoring.get_gauges()
+        self.assertEqual(len(gauges), 20000)
+        gauges.clear()
+        self.assertEqual(len(monitoring.get_gauges()), 20000)
+
+    def test_prometheus_text(self):
+        monitoring = MonitoringService()
+        monitoring.record_metric(metric(duration=0.02))
+        monitoring.observe("policy_evaluation", 1.5, "p1")
+        monitoring.increment("remediation_submitted")
+        monitoring.set_gauge("remediation_queue_depth", 4)
+
+        text = monitoring.render_prometheus()
+        self.assertIn('policy_actions_total{policy="p1",action="remediation",status="success"} 1', text)
+        self.assertIn('policy_action_duration_seconds_bucket{policy="p1",action="remediation",le="0.025"} 1', text)
+        self.assertIn('policy_action_duration_seconds_bucket{policy="p1",action="remediation",le="+Inf"} 1', text)
+        self.assertIn('policy_evaluation_seconds_count{policy="p1"} 1', text)
+        self.assertIn("# TYPE remediation_submitted_total counter\nremediation_submitted_total 1", text)
+        self.assertIn("# TYPE remediation_queue_depth gauge\nremediation_queue_depth 4", text)
+
+
+class TestMetricsServer(unittest.TestCase):
+    def test_serves_metrics(self):
+        monitoring = MonitoringService()
+        monitoring.increment("remediation_submitted", 2)
+        server = MetricsServer(monitoring, port=0)
+        server.start()
+        self.addCleanup(server.stop)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+
+        self.assertIn("remediation_submitted_total 2", body)
+        self.assertTrue(content_type.startswith("text/plain; version=0.0.4"))
+
+
+class TestPrimitives(unittest.TestCase):
+    def test_ring_buffer_wraps_oldest_first(self):
+        ring = RingBuffer(2)
+        for i in range(3):
+            ring.append(i, "p", f"r{i}", "a", "s", 0.0)
+        self.assertEqual([event[2] for event in ring], ["r1", "r2"])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((1, 2))
+        for value in (0.5, 1, 1.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [("1", 2), ("2", 3), ("+Inf", 4)])
+        self.assertEqual(histogram.sum, 8.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
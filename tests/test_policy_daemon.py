@@ -0,0 +1,124 @@
+import asyncio
+import json
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from delta_inventory import DeltaTracker
+from policy_daemon import PolicyDaemon, diff_policies
+from policy_loader import PolicySource
+from fakes import FakeInventory
+
+
+def policy_data(policy_id, frequency=5, field="tags.owner"):
+    return {
+        "id": policy_id,
+        "name": policy_id,
+        "description": policy_id,
+        "resource_type": "Microsoft.Compute/virtualMachines",
+        "evaluation_frequency": frequency,
+        "conditions": [{"field": field, "operator": "notExists"}],
+        "remediation_action": {"type": "tag", "parameters": {"owner": "unknown"}}
+    }
+
+
+class TestHotReload(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.bundle = self.root / "policies"
+        self.bundle.mkdir()
+        self.write("a.json", [policy_data("keep"), policy_data("change"), policy_data("drop")])
+        self.source = PolicySource(str(self.bundle), cache_dir=str(self.root / "cache"), workers=1)
+
+        self.daemon = PolicyDaemon('test-subscription-id', self.source.load(), start_jitter=3600,
+                                   policy_source=self.source, reload_interval=0.02,
+                                   inventory=FakeInventory(), state_dir=str(self.root / "state"))
+
+    def write(self, name, policies):
+        (self.bundle / name).write_text(json.dumps({"policies": policies}))
+
+    def run_on_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.daemon.loop).result(5)
+
+    def wait_for(self, predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail("condition not reached")
+
+    def test_diff_policies(self):
+        current = {policy.id: policy for policy in self.daemon.policies}
+        updated = PolicySource(str(self.bundle)).load()
+        self.assertFalse(diff_policies(current, updated))
+
+        self.write("a.json", [policy_data("keep"), policy_data("change", frequency=10), policy_data("new")])
+        diff = diff_policies(current, PolicySource(str(self.bundle)).load())
+        self.assertEqual((diff.added, diff.removed, diff.changed), (["new"], ["drop"], ["change"]))
+
+    def test_watcher_applies_only_the_diff(self):
+        self.daemon.start()
+        self.addCleanup(self.daemon.stop)
+        keep = self.daemon.scheduler.policies["keep"]
+        keep_generation = self.daemon.scheduler._generation["keep"]
+        cache = self.daemon.policy_engine.resource_cache
+
+        self.write("a.json", [policy_data("keep"), policy_data("change", frequency=10)])
+        self.write("b.json", [policy_data("new")])
+        self.wait_for(lambda: "new" in self.daemon.scheduler.policies)
+
+        scheduler = self.daemon.scheduler
+        self.assertEqual(set(scheduler.policies), {"keep", "change", "new"})
+        self.assertEqual(scheduler.policies["change"].evaluation_frequency, 10)
+        # Untouched policies keep their object and their place in the schedule
+        self.assertIs(scheduler.policies["keep"], keep)
+        self.assertEqual(scheduler._generation["keep"], keep_generation)
+        self.assertIs(self.daemon.policy_engine.resource_cache, cache)
+        self.assertEqual(set(self.daemon.policy_engine.policies), {"keep", "change", "new"})
+
+    def test_malformed_update_is_rejected(self):
+        self.daemon.start()
+        self.addCleanup(self.daemon.stop)
+        before = list(self.daemon.policies)
+
+        self.write("a.json", [policy_data("keep"), {"id": "broken"}])
+        monitoring = self.daemon.policy_engine.monitoring
+        self.wait_for(lambda: monitoring.get_counters().get("policy_reload_rejected"))
+
+        self.assertEqual(self.daemon.policies, before)
+        self.assertEqual(set(self.daemon.scheduler.policies), {"keep", "change", "drop"})
+
+        # A forced reload after a fix goes through
+        self.write("a.json", [policy_data("keep")])
+        self.daemon.request_reload()
+        self.wait_for(lambda: set(self.daemon.scheduler.policies) == {"keep"})
+
+    def test_reload_drops_only_removed_policy_state(self):
+        engine = self.daemon.policy_engine
+        for key, policy_id in (("r1:type", "drop"), ("r2:type", "keep")):
+            engine.remediation_state[key] = {"first_violation": "2026-01-01T00:00:00", "policy_id": policy_id,
+                                             "warnings_sent": [], "next_due": "2099-01-02T00:00:00"}
+            engine.due_index.push(key, "2099-01-02T00:00:00")
+        tracker = engine.deltas["sub:test-subscription-id"] = DeltaTracker()
+        tracker.results["drop"] = tracker.results["keep"] = object()
+        self.daemon.start()
+        self.addCleanup(self.daemon.stop)
+
+        self.write("a.json", [policy_data("keep"), policy_data("change")])
+        # Either this reload or the watcher's may apply the change first.
+        self.run_on_loop(self.daemon.reload())
+        self.wait_for(lambda: "drop" not in engine.policies)
+
+        self.assertNotIn("r1:type", engine.remediation_state)
+        self.assertIn("r2:type", engine.remediation_state)
+        self.assertEqual(engine.due_index.pop_due(datetime(2099, 1, 3)), ["r2:type"])
+        self.assertEqual(set(tracker.results), {"keep"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,58 +1,92 @@
+import tempfile
 import unittest
-from unittest.mock import AsyncMock, patch
 from datetime import timedelta
+from types import SimpleNamespace
+
 from policy_engine import PolicyEngine
-from types.policy import PolicyDefinition, PolicyCondition, RemediationAction, RemediationTiming
-
-class TestPolicyEngine(unittest.TestCase):
-    @patch('policy_engine.ResourceManagementClient')
-    @patch('policy_engine.DefaultAzureCredential')
-    def setUp(self, MockCredential, MockClient):
-        self.subscription_id = 'test-subscription-id'
-        self.management_group_id = 'test-management-group-id'
-        self.policy_engine = PolicyEngine(self.subscription_id, 'azure', self.management_group_id)
-        self.policy_engine.client = MockClient()
-        self.policy_engine.eventhub = AsyncMock()
-
-    def test_evaluate_policy(self):
-        policy = PolicyDefinition(
-            id="test-policy",
-            name="Test Policy",
-            description="A test policy",
-            resource_type="Microsoft.Resources/resources",
-            evaluation_frequency=5,
-            conditions=[PolicyCondition(field="tags.environment", operator="notExists")],
-            remediation_action=RemediationAction(
-                type="tag",
-                parameters={"environment": "development"},
-                timing=RemediationTiming(delay=timedelta(days=7), warning_threshold=timedelta(days=5))
-            )
-        )
-        self.policy_engine.client.resources.list_by_management_group.return_value = [
-            AsyncMock(id="resource1", type="Microsoft.Resources/resources", tags={})
-        ]
-        self.policy_engine.client.resources.list_by_subscription.return_value = [
-            AsyncMock(id="resource2", type="Microsoft.Resources/resources", tags={})
-        ]
-
-        self.policy_engine.evaluate_policy(policy)
-        self.policy_engine.eventhub.send_event.assert_called()
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, Scope, TimingConfig
+from fakes import FakeInventory
+
+
+def make_resource(resource_id, tags=None):
+    return SimpleNamespace(
+        id=f"/subscriptions/test-subscription-id/resourceGroups/rg/providers/Microsoft.Resources/resources/{resource_id}",
+        type="Microsoft.Resources/resources", name=resource_id, resource_group="rg", tags=tags or {}
+    )
+
+
+def make_policy(timing=None):
+    return PolicyDefinition(
+        id="test-policy",
+        name="Test Policy",
+        description="A test policy",
+        resource_type="Microsoft.Resources/resources",
+        evaluation_frequency=5,
+        conditions=[PolicyCondition(field="tags.environment", operator="notExists")],
+        remediation_action=RemediationAction(type="tag", parameters={"environment": "development"}, timing=timing),
+        scope=Scope(subscription="test-subscription-id")
+    )
+
+
+class TestPolicyEngine(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = FakeInventory({"test-subscription-id": [
+            make_resource("resource1"),
+            make_resource("resource2", tags={"environment": "prod"}),
+        ]})
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.applied = []
+
+        async def apply(resource, action):
+            self.applied.append((resource.name, action.type, action.parameters))
+
+        self.policy_engine.remediation_pool.apply = apply
+
+    async def asyncTearDown(self):
+        await self.policy_engine.close()
+
+    async def test_evaluate_policy(self):
+        await self.policy_engine.evaluate_policy(make_policy())
+        await self.policy_engine.remediation_pool.join()
+
+        self.assertEqual(self.applied, [("resource1", "tag", {"environment": "development"})])
 
     def test_evaluate_conditions(self):
-        resource = AsyncMock(id="test-resource", type="test-type", tags={})
+        resource = SimpleNamespace(id="test-resource", type="test-type", tags={})
         condition = PolicyCondition(field="tags.environment", operator="notExists")
-        result = self.policy_engine._evaluate_conditions(resource, [condition])
-        self.assertTrue(result)
+        self.assertTrue(self.policy_engine._evaluate_conditions(resource, [condition]))
+        resource.tags["environment"] = "prod"
+        self.assertFalse(self.policy_engine._evaluate_conditions(resource, [condition]))
+
+    async def test_remediation_timing(self):
+        policy = make_policy(TimingConfig(delay=timedelta(days=7), warning_threshold=timedelta(days=5)))
+        await self.policy_engine.evaluate_policy(policy)
+        await self.policy_engine.remediation_pool.join()
+
+        # The first violation only starts the clock
+        self.assertEqual(self.applied, [])
+        key = self.policy_engine._get_resource_key(make_resource("resource1"))
+        self.assertEqual(self.policy_engine.remediation_state[key]["policy_id"], "test-policy")
+        self.assertIsNotNone(self.policy_engine.seconds_until_due())
+
+    async def test_error_handling(self):
+        async def apply(resource, action):
+            raise RuntimeError("boom")
+
+        self.policy_engine.remediation_pool.apply = apply
+        await self.policy_engine.evaluate_policy(make_policy())
+        await self.policy_engine.remediation_pool.join()
+
+        self.assertEqual(self.policy_engine.monitoring.get_counters()["remediation_failed"], 1)
 
-    def test_remediation_timing(self):
-        # Add timing tests
+    async def test_resource_caching(self):
+        await self.policy_engine.evaluate_policy(make_policy())
+        await self.policy_engine.evaluate_policy(make_policy())
 
-    def test_error_handling(self):
-        # Add error handling tests
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"])
 
-    @patch('policy_engine.ResourceManagementClient')
-    def test_resource_caching(self, MockClient):
-        # Add caching tests
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,100 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import policy_loader
+from policy_loader import load_policies, load_policy_files
+
+
+def policy_data(policy_id, operator="exists"):
+    return {
+        "id": policy_id,
+        "name": policy_id,
+        "description": policy_id,
+        "resource_type": "Microsoft.Storage/storageAccounts",
+        "evaluation_frequency": 5,
+        "conditions": [{"field": "properties.accessKeys", "operator": operator}],
+        "remediation_action": {"type": "delete", "parameters": {}, "timing": {"delay": "7d"}}
+    }
+
+
+class TestPolicyLoader(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.bundle = self.root / "bundle"
+        self.cache_dir = str(self.root / "cache")
+        (self.bundle / "team-b").mkdir(parents=True)
+
+    def write(self, name, policies):
+        path = self.bundle / name
+        path.write_text(json.dumps({"policies": policies}))
+        return path
+
+    def test_directory_is_loaded_in_file_order(self):
+        self.write("a.json", [policy_data("a1"), policy_data("a2")])
+        self.write("team-b/b.json", [policy_data("b1")])
+        (self.bundle / "notes.txt").write_text("not a policy")
+
+        for workers in (1, 2):
+            policies = load_policies(str(self.bundle), workers=workers)
+            self.assertEqual([policy.id for policy in policies], ["a1", "a2", "b1"])
+            self.assertEqual(policies[0].remediation_action.timing.delay.days, 7)
+            self.assertTrue(policies[0].evaluator)
+
+    def test_unchanged_files_skip_validation(self):
+        self.write("a.json", [policy_data("a1")])
+        changed = self.write("b.json", [policy_data("b1")])
+        with patch('policy_loader._read_policy_file', wraps=policy_loader._read_policy_file) as read:
+            first = load_policy_files(str(self.bundle), self.cache_dir)
+        self.assertEqual([load.cached for load in first], [False, False])
+        # A miss is read and hashed once, and its content handed to the parser
+        self.assertEqual(read.call_count, 2)
+
+        changed.write_text(json.dumps({"policies": [policy_data("b1", operator="notExists")]}))
+        with patch('policy_loader.from_dict', wraps=__import__('dacite').from_dict) as from_dict:
+            second = load_policy_files(str(self.bundle), self.cache_dir, workers=1)
+
+        self.assertEqual([load.cached for load in second], [True, False])
+        self.assertEqual(from_dict.call_count, 1)
+        self.assertEqual(second[1].policies[0].conditions[0].operator, "notExists")
+        self.assertEqual(second[0].policies, first[0].policies)
+        self.assertTrue(all(load.seconds >= 0 for load in second))
+
+    def test_cache_is_keyed_to_the_loader_version(self):
+        self.write("a.json", [policy_data("a1")])
+        load_policy_files(str(self.bundle), self.cache_dir)
+        self.addCleanup(policy_loader._schema_digest.cache_clear)
+        policy_loader._schema_digest.cache_clear()
+        with patch('policy_loader.CACHE_VERSION', policy_loader.CACHE_VERSION + 1):
+            reloaded = load_policy_files(str(self.bundle), self.cache_dir)
+        self.assertEqual([load.cached for load in reloaded], [False])
+
+    def test_invalid_policy_is_rejected(self):
+        self.write("a.json", [policy_data("a1", operator="bogus")])
+        with self.assertRaises(Exception):
+            load_policies(str(self.bundle), self.cache_dir)
+        # Nothing was cached for the bad file
+        self.assertFalse(Path(self.cache_dir).exists() and any(Path(self.cache_dir).iterdir()))
+
+    def test_invalid_json_and_duplicates(self):
+        bad = self.write("a.json", [])
+        bad.write_text("{not json")
+        with self.assertRaisesRegex(ValueError, "Invalid JSON"):
+            load_policies(str(bad))
+
+        self.write("a.json", [policy_data("same")])
+        self.write("b.json", [policy_data("same")])
+        with self.assertRaisesRegex(ValueError, "Duplicate policy id same"):
+            load_policies(str(self.bundle))
+
+    def test_missing_path(self):
+        with self.assertRaises(ValueError):
+            load_policies(str(self.root / "missing.json"))
+
+
+if __name__ == '__main__':
+    unittest.main()
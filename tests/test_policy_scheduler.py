@@ -0,0 +1,109 @@
+import asyncio
+import time
+import unittest
+
+from policy_scheduler import PolicyScheduler
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+
+
+def make_policy(policy_id, frequency=5):
+    return PolicyDefinition(
+        id=policy_id,
+        name=policy_id,
+        description=policy_id,
+        resource_type="Microsoft.Compute/virtualMachines",
+        evaluation_frequency=frequency,
+        conditions=[PolicyCondition(field="id", operator="exists")],
+        remediation_action=RemediationAction(type="delete", parameters={})
+    )
+
+
+class TestPolicyScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_policies_repeatedly_on_their_interval(self):
+        runs = []
+
+        async def run(policies):
+            runs.extend(policy.id for policy in policies)
+
+        scheduler = PolicyScheduler(run, start_jitter=0, interval=lambda policy: policy.evaluation_frequency / 100)
+        scheduler.add(make_policy("fast", frequency=2))
+        scheduler.add(make_policy("slow", frequency=50))
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.11)
+        scheduler.stop()
+        await task
+
+        self.assertGreaterEqual(runs.count("fast"), 4)
+        self.assertEqual(runs.count("slow"), 1)
+
+    async def test_caps_concurrent_evaluations(self):
+        active = 0
+        peak = 0
+
+        async def run(policies):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+
+        scheduler = PolicyScheduler(run, max_concurrency=3, start_jitter=0, interval=lambda policy: 10)
+        for i in range(50):
+            scheduler.add(make_policy(f"p{i}"))
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.05)
+        scheduler.stop()
+        await task
+
+        self.assertEqual(peak, 3)
+
+    async def test_batch_mode_groups_policies_due_together(self):
+        batches = []
+
+        async def run(policies):
+            batches.append(sorted(policy.id for policy in policies))
+
+        scheduler = PolicyScheduler(run, batch=True, interval=lambda policy: 10)
+        due = time.monotonic()
+        scheduler.add(make_policy("a"), due=due)
+        scheduler.add(make_policy("b"), due=due)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.01)
+        scheduler.stop()
+        await task
+
+        self.assertEqual(batches, [["a", "b"]])
+
+    async def test_stop_does_not_wait_for_next_due_time(self):
+        async def run(policies):
+            pass
+
+        scheduler = PolicyScheduler(run, interval=lambda policy: 3600)
+        scheduler.add(make_policy("hourly"), due=time.monotonic() + 3600)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        scheduler.stop()
+        await asyncio.wait_for(task, 1)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    async def test_removed_policy_is_not_run(self):
+        runs = []
+
+        async def run(policies):
+            runs.extend(policy.id for policy in policies)
+
+        scheduler = PolicyScheduler(run, interval=lambda policy: 10)
+        scheduler.add(make_policy("gone"), due=time.monotonic())
+        scheduler.remove("gone")
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.01)
+        scheduler.stop()
+        await task
+
+        self.assertEqual(runs, [])
+        self.assertIsNone(scheduler.next_due())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+from condition_compiler import compile_conditions
+from predicate_index import PredicateIndex
+from policy_types import PolicyCondition
+
+FIELDS = {
+    "location": ["westus", "eastus", "northeurope", None],
+    "tags.environment": ["prod", "dev", None],
+    "tags.owner": ["team-a", "team-b", None],
+    "properties.sku": [1, True, "1", None],
+    "properties.ports": [[22], [80, 443], None],
+}
+CONDITIONS = [
+    ("equals", lambda field: rng_choice(FIELDS[field] + [[22]])),
+    ("notEquals", lambda field: rng_choice(FIELDS[field])),
+    ("exists", lambda field: None),
+    ("notExists", lambda field: "ignored"),
+    ("contains", lambda field: rng_choice(["west", "prod", 22])),
+    ("in", lambda field: rng.sample(FIELDS[field], 2) + rng_choice([[], [[22]], [1.0]])),
+    ("matches", lambda field: rng_choice(["^west", "eu", "^team-[ab]$", "^1$"])),
+]
+
+rng = random.Random(5)
+
+
+def rng_choice(options):
+    return rng.choice(options)
+
+
+def random_resource(i):
+    values = {field: rng.choice(options) for field, options in FIELDS.items()}
+    return SimpleNamespace(
+        id=f"r{i}",
+        location=values["location"],
+        tags={key: values[f"tags.{key}"] for key in ("environment", "owner") if values[f"tags.{key}"] is not None},
+        properties={"sku": values["properties.sku"], "ports": values["properties.ports"]},
+    )
+
+
+def random_policy():
+    conditions = []
+    for _ in range(rng.randint(0, 3)):
+        field = rng.choice(list(FIELDS))
+        operator, value = rng.choice(CONDITIONS)
+        conditions.append(PolicyCondition(field=field, operator=operator, value=value(field)))
+    return compile_conditions(conditions)
+
+
+class TestPredicateIndex(unittest.TestCase):
+    def test_matches_per_policy_evaluation(self):
+        resources = [random_resource(i) for i in range(300)]
+        for _ in range(20):
+            evaluators = [random_policy() for _ in range(rng.randint(2, 60))]
+            index = PredicateIndex([(position, evaluator) for position, evaluator in enumerate(evaluators)])
+            for resource in resources:
+                expected = [position for position, evaluator in enumerate(evaluators) if evaluator(resource)]
+                self.assertEqual(index.match(resource), expected, ([e.source for e in evaluators], resource))
+
+    def test_shared_tests_are_indexed_once(self):
+        evaluators = [
+            compile_conditions([PolicyCondition(field="tags.owner", operator="exists"),
+                                PolicyCondition(field="location", operator="equals", value=location)])
+            for location in ("westus", "eastus", "westus")
+        ] + [compile_conditions([PolicyCondition(field="tags.owner", operator="notExists")])]
+        index = PredicateIndex([(f"p{i}", evaluator) for i, evaluator in enumerate(evaluators)])
+
+        self.assertEqual(len(index.tests), 3)
+        self.assertEqual(set(index.fields), {("tags", "owner"), ("location",)})
+        owned = SimpleNamespace(tags={"owner": "a"}, location="westus")
+        self.assertEqual(list(index.matching(owned)), ["p0", "p2"])
+        self.assertEqual(list(index.matching(SimpleNamespace(tags={}, location="westus"))), ["p3"])
+
+    def test_contradictory_conditions_never_match(self):
+        evaluator = compile_conditions([PolicyCondition(field="location", operator="equals", value="westus"),
+                                        PolicyCondition(field="location", operator="notEquals", value="westus")])
+        index = PredicateIndex([("a", evaluator), ("b", compile_conditions([]))])
+
+        self.assertEqual(index.match(SimpleNamespace(location="westus")), [1])
+        self.assertEqual(index.match(SimpleNamespace(location="eastus")), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
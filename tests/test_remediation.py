@@ -0,0 +1,362 @@
+import asyncio
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from azure.core.exceptions import HttpResponseError
+
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, TimingConfig
+from remediation import RemediationPool, RemediationTask, TokenBucket, coalesce, merge_parameters, subscription_of
+from services.monitoring_service import MonitoringService
+from fakes import FakeInventory
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self):
+        super().__init__("Too Many Requests")
+        self.response = SimpleNamespace(headers={"Retry-After": "0"})
+
+
+class FakePoller:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def result(self):
+        await asyncio.sleep(self.delay)
+
+
+def make_resource(index, subscription_id="sub-a", resource_type="Microsoft.Compute/virtualMachines"):
+    return SimpleNamespace(
+        id=f"/subscriptions/{subscription_id}/resourceGroups/rg/providers/{resource_type}/vm{index}",
+        type=resource_type, name=f"vm{index}", resource_group="rg", tags={}
+    )
+
+
+def make_policy(policy_id="p1", timing=None, action_type="delete", parameters=None):
+    return PolicyDefinition(
+        id=policy_id,
+        name=policy_id,
+        description=policy_id,
+        resource_type="Microsoft.Compute/virtualMachines",
+        evaluation_frequency=5,
+        conditions=[PolicyCondition(field="id", operator="exists")],
+        remediation_action=RemediationAction(type=action_type, parameters=parameters or {}, timing=timing)
+    )
+
+
+class TestRemediationPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.monitoring = MonitoringService()
+        self.calls = []
+
+    def make_pool(self, apply, **kwargs):
+        pool = RemediationPool(apply, self.monitoring, **kwargs)
+        self.addAsyncCleanup(pool.close)
+        return pool
+
+    async def test_pollers_do_not_hold_workers(self):
+        async def apply(resource, action):
+            self.calls.append(resource.id)
+            return FakePoller(0.1)
+
+        pool = self.make_pool(apply, workers=1, subscription_burst=100, provider_burst=100)
+        started = time.monotonic()
+        for i in range(10):
+            await pool.submit(RemediationTask(make_resource(i), make_policy(), "immediate_remediation"))
+        await pool.join()
+
+        self.assertEqual(len(self.calls), 10)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.monitoring.get_counters()["remediation_success"], 10)
+        self.assertEqual(self.monitoring.get_gauges()["remediation_queue_depth"], 0)
+
+    async def test_duplicate_submissions_are_dropped(self):
+        async def apply(resource, action):
+            self.calls.append(resource.id)
+
+        pool = self.make_pool(apply)
+        task = RemediationTask(make_resource(1), make_policy(), "remediation")
+        self.assertTrue(await pool.submit(task))
+        self.assertFalse(await pool.submit(RemediationTask(make_resource(1), make_policy(), "remediation")))
+        await pool.join()
+
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_throttled_calls_are_requeued_and_counted(self):
+        attempts = []
+
+        async def apply(resource, action):
+            attempts.append(resource.id)
+            if len(attempts) == 1:
+                raise Throttled()
+
+        pool = self.make_pool(apply)
+        cleared = []
+        await pool.submit(RemediationTask(make_resource(1), make_policy(), "remediation", on_success=lambda: cleared.append(True)))
+        await pool.join()
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(cleared, [True])
+        self.assertEqual(self.monitoring.get_counters()["arm_throttled"], 1)
+
+    async def test_transient_failures_are_retried_a_bounded_number_of_times(self):
+        attempts = []
+
+        async def apply(resource, action):
+            attempts.append(time.monotonic())
+            raise asyncio.TimeoutError()
+
+        pool = self.make_pool(apply, max_retries=2, retry_backoff=0.02)
+        await pool.submit(RemediationTask(make_resource(1), make_policy(), "remediation"))
+        await pool.join()
+
+        self.assertEqual(len(attempts), 3)
+        # Backoff doubles: 20ms, then 40ms
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.035)
+        self.assertEqual(self.monitoring.get_counters()["remediation_failed"], 1)
+
+    async def test_failures_are_recorded(self):
+        async def apply(resource, action):
+            raise RuntimeError("boom")
+
+        pool = self.make_pool(apply)
+        await pool.submit(RemediationTask(make_resource(1), make_policy(), "remediation"))
+        await pool.join()
+
+        self.assertEqual(self.monitoring.get_counters()["remediation_failed"], 1)
+        metric = self.monitoring.get_metrics()[f"p1:{make_resource(1).id}"]
+        self.assertEqual(metric["status"], "failed")
+
+    async def test_token_bucket_limits_rate_per_subscription(self):
+        async def apply(resource, action):
+            self.calls.append((time.monotonic(), subscription_of(resource.id)))
+
+        pool = self.make_pool(apply, workers=8, subscription_rate=50, subscription_burst=1, provider_burst=100)
+        for i in range(5):
+            await pool.submit(RemediationTask(make_resource(i, "sub-a"), make_policy(), "remediation"))
+            await pool.submit(RemediationTask(make_resource(i, "sub-b"), make_policy(), "remediation"))
+        await pool.join()
+
+        for subscription_id in ("sub-a", "sub-b"):
+            times = [t for t, sub in self.calls if sub == subscription_id]
+            # 1 token up front, then 50/s: the 5th call can't start before ~80ms
+            self.assertGreaterEqual(times[-1] - times[0], 0.07)
+
+    async def test_busy_subscription_does_not_hold_workers(self):
+        async def apply(resource, action):
+            self.calls.append(subscription_of(resource.id))
+
+        pool = self.make_pool(apply, workers=2, subscription_rate=1, subscription_burst=3, provider_burst=100)
+        for i in range(20):
+            await pool.submit(RemediationTask(make_resource(i, "sub-a"), make_policy(), "remediation"))
+        for i in range(3):
+            await pool.submit(RemediationTask(make_resource(i, "sub-b"), make_policy(), "remediation"))
+        started = time.monotonic()
+        while self.calls.count("sub-b") < 3 and time.monotonic() - started < 1:
+            await asyncio.sleep(0.01)
+
+        # sub-a's backlog waits for its tokens without parking both workers
+        self.assertEqual(self.calls.count("sub-b"), 3)
+        self.assertEqual(self.calls.count("sub-a"), 3)
+
+
+class TestCoalescing(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.monitoring = MonitoringService()
+        self.calls = []
+
+    def make_pool(self):
+        async def apply(resource, action):
+            self.calls.append((resource.id, action.type, action.parameters))
+
+        pool = RemediationPool(apply, self.monitoring, subscription_burst=100, provider_burst=100)
+        self.addAsyncCleanup(pool.close)
+        return pool
+
+    async def submit_all(self, pool, policies, resource):
+        with pool.coalescing():
+            for policy in policies:
+                await pool.submit(RemediationTask(resource, policy, "immediate_remediation"))
+        await pool.join()
+
+    async def test_tags_are_merged_into_one_call(self):
+        resource = make_resource(1)
+        await self.submit_all(self.make_pool(), [
+            make_policy("owner", action_type="tag", parameters={"owner": "ops"}),
+            make_policy("env", action_type="tag", parameters={"env": "prod"}),
+        ], resource)
+
+        self.assertEqual(self.calls, [(resource.id, "tag", {"owner": "ops", "env": "prod"})])
+        self.assertEqual(self.monitoring.get_counters()["remediation_success"], 2)
+        self.assertEqual(self.monitoring.get_counters()["remediation_coalesced"], 1)
+        for policy_id in ("owner", "env"):
+            self.assertEqual(self.monitoring.get_metrics()[f"{policy_id}:{resource.id}"]["status"], "success")
+
+    async def test_compatible_modifies_are_merged_and_conflicts_kept_apart(self):
+        resource = make_resource(1)
+        await self.submit_all(self.make_pool(), [
+            make_policy("a", action_type="modify", parameters={"properties": {"sku": "B1"}}),
+            make_policy("b", action_type="modify", parameters={"properties": {"httpsOnly": True}}),
+            make_policy("c", action_type="modify", parameters={"properties": {"sku": "S1"}}),
+        ], resource)
+
+        self.assertEqual(self.calls, [
+            (resource.id, "modify", {"properties": {"sku": "B1", "httpsOnly": True}}),
+            (resource.id, "modify", {"properties": {"sku": "S1"}}),
+        ])
+        self.assertEqual(self.monitoring.get_counters()["remediation_success"], 3)
+
+    async def test_delete_supersedes_tag_and_modify(self):
+        resource = make_resource(1)
+        await self.submit_all(self.make_pool(), [
+            make_policy("tag", action_type="tag", parameters={"owner": "ops"}),
+            make_policy("delete"),
+            make_policy("modify", action_type="modify", parameters={"sku": "B1"}),
+        ], resource)
+
+        self.assertEqual(self.calls, [(resource.id, "delete", {})])
+        metrics = self.monitoring.get_metrics()
+        self.assertEqual(metrics[f"delete:{resource.id}"]["status"], "success")
+        self.assertEqual(metrics[f"tag:{resource.id}"]["status"], "superseded")
+        self.assertEqual(metrics[f"modify:{resource.id}"]["status"], "superseded")
+        self.assertEqual(self.monitoring.get_counters()["remediation_superseded"], 2)
+
+    async def test_resources_are_not_merged_with_each_other(self):
+        pool = self.make_pool()
+        with pool.coalescing():
+            for i in range(3):
+                await pool.submit(RemediationTask(make_resource(i), make_policy(action_type="tag", parameters={"a": "b"}),
+                                                  "immediate_remediation"))
+        await pool.join()
+
+        self.assertEqual(sorted(call[0] for call in self.calls), sorted(make_resource(i).id for i in range(3)))
+
+    def test_merge_parameters(self):
+        self.assertEqual(merge_parameters({"a": {"b": 1}}, {"a": {"c": 2}}), {"a": {"b": 1, "c": 2}})
+        self.assertEqual(merge_parameters({"a": 1}, {"a": 1}), {"a": 1})
+        self.assertIsNone(merge_parameters({"a": {"b": 1}}, {"a": {"b": 2}}))
+
+    def test_tags_follow_modifies(self):
+        resource = make_resource(1)
+        batch = coalesce(resource, [
+            RemediationTask(resource, make_policy("t", action_type="tag", parameters={"a": "b"}), "remediation"),
+            RemediationTask(resource, make_policy("m", action_type="modify", parameters={"sku": "B1"}), "remediation"),
+        ])
+        self.assertEqual([step.action.type for step in batch.steps], ["modify", "tag"])
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=100, capacity=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.01)
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.009)
+
+
+class FakeArmClient:
+    """Stands in for the async ResourceManagementClient; fails the first `failures` deletes with `status`"""
+
+    def __init__(self, failures=1, status=429):
+        self.deletes = []
+        self.failures = failures
+        self.status = status
+        self.resources = SimpleNamespace(begin_delete=self.begin_delete)
+
+    async def begin_delete(self, **kwargs):
+        self.deletes.append(kwargs["resource_name"])
+        if len(self.deletes) <= self.failures:
+            response = SimpleNamespace(status_code=self.status, reason="Error", headers={"Retry-After": "0"},
+                                       text=lambda encoding=None: "", request=None, content_type="")
+            raise HttpResponseError(response=response)
+        return FakePoller(0)
+
+    async def close(self):
+        pass
+
+
+class TestApplyRemediation(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=FakeInventory(), state_dir=self.state_dir.name)
+        self.client = FakeArmClient()
+        self.policy_engine.remediation_clients["sub-a"] = self.client
+
+    async def asyncTearDown(self):
+        await self.policy_engine.close()
+
+    async def test_arm_throttling_is_requeued_by_the_pool(self):
+        resource = make_resource(1)
+        await self.policy_engine._handle_remediation(resource, make_policy())
+        await self.policy_engine.remediation_pool.join()
+
+        self.assertEqual(self.client.deletes, ["vm1", "vm1"])
+        counters = self.policy_engine.monitoring.get_counters()
+        self.assertEqual(counters["arm_throttled"], 1)
+        self.assertEqual(counters["remediation_success"], 1)
+        self.assertNotIn("remediation_failed", counters)
+
+    async def test_server_errors_are_retried(self):
+        self.policy_engine.remediation_clients["sub-a"] = client = FakeArmClient(status=503)
+        self.policy_engine.remediation_pool.retry_backoff = 0.01
+        await self.policy_engine._handle_remediation(make_resource(1), make_policy())
+        await self.policy_engine.remediation_pool.join()
+
+        self.assertEqual(client.deletes, ["vm1", "vm1"])
+        counters = self.policy_engine.monitoring.get_counters()
+        self.assertEqual((counters["remediation_retried"], counters["remediation_success"]), (1, 1))
+        self.assertNotIn("remediation_failed", counters)
+
+
+class TestEngineRemediation(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=FakeInventory(), state_dir=self.state_dir.name)
+        self.applied = []
+
+        async def apply(resource, action):
+            self.applied.append(resource.id)
+            return FakePoller(0.01)
+
+        self.policy_engine.remediation_pool.apply = apply
+
+    async def asyncTearDown(self):
+        await self.policy_engine.close()
+
+    async def test_immediate_remediation_is_queued(self):
+        resource = make_resource(1)
+        await self.policy_engine._handle_remediation(resource, make_policy())
+        await self.policy_engine.remediation_pool.join()
+
+        self.assertEqual(self.applied, [resource.id])
+        metric = self.policy_engine.monitoring.get_metrics()[f"p1:{resource.id}"]
+        self.assertEqual((metric["action"], metric["status"]), ("immediate_remediation", "success"))
+
+    async def test_delayed_remediation_clears_state_on_success(self):
+        resource = make_resource(1)
+        policy = make_policy(timing=TimingConfig(delay="1d"))
+        key = self.policy_engine._get_resource_key(resource)
+        self.policy_engine.remediation_state[key] = {
+            "first_violation": (datetime.utcnow() - timedelta(days=2)).isoformat(),
+            "policy_id": policy.id,
+            "warnings_sent": []
+        }
+
+        await self.policy_engine._handle_remediation(resource, policy)
+        await self.policy_engine.remediation_pool.join()
+
+        self.assertEqual(self.applied, [resource.id])
+        self.assertNotIn(key, self.policy_engine.remediation_state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from benchmarks.synthetic import MANAGEMENT_GROUP, SyntheticInventory, synthetic_policies
+from inventory_snapshot import SnapshotReader
+from policy_engine import PolicyEngine
+from policy_types import PolicyCondition, PolicyDefinition, RemediationAction
+from replay import ReplayEngine, capture, main
+
+SCOPE = f"mg:{MANAGEMENT_GROUP}"
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.inventory = SyntheticInventory(resources=2000, subscriptions=3, seed=5, page_size=250)
+        self.policies = synthetic_policies(12, seed=5)
+
+    def capture(self, name, frame_resources=2000):
+        path = str(self.root / name)
+        written = asyncio.run(capture(path, [SCOPE], self.inventory, frame_resources))
+        self.assertEqual(written, 2000)
+        return path
+
+    def live_violations(self):
+        engine = PolicyEngine(self.inventory.subscription_ids[0], inventory=self.inventory,
+                              state_dir=str(self.root / "state"))
+        engine.remediation_pool.submit = AsyncMock()
+        report = asyncio.run(engine.evaluate_policies(self.policies))
+        engine.remediation_state.close()
+        hits = {policy.id: [] for policy in self.policies}
+        for resource_id, policy_ids in report.violations.items():
+            for policy_id in policy_ids:
+                hits[policy_id].append(resource_id)
+        return hits
+
+    def test_snapshot_round_trip(self):
+        for name in ("inventory.snap", "inventory.jsonl.gz"):
+            path = self.capture(name, frame_resources=100)
+            with SnapshotReader(path) as reader:
+                self.assertEqual(reader.scopes(), {SCOPE: 2000})
+                resources = [resource for _, page in reader.pages() for resource in page]
+                disks = [resource for _, page in reader.pages(types={"Microsoft.Compute/disks"}) for resource in page]
+            original = self.inventory.page(self.inventory.subscription_ids[0], 0)[0]
+            replayed = next(resource for resource in resources if resource.id == original["id"])
+            self.assertEqual((replayed.tags, replayed.properties, replayed.location, replayed.changed_time),
+                             (original["tags"], original["properties"], original["location"], original["changedTime"]))
+            self.assertEqual(len(resources), 2000)
+            self.assertTrue(disks and all(resource.type == "Microsoft.Compute/disks" for resource in disks))
+
+    def test_replay_matches_live_evaluation(self):
+        live = self.live_violations()
+        for name, workers in (("inventory.snap", 1), ("inventory.snap", 3), ("inventory.jsonl.gz", 1)):
+            path = self.capture(name, frame_resources=64)
+            hits_path = str(self.root / "hits.jsonl")
+            report = ReplayEngine(path, max_listed=5, workers=workers).run(self.policies, hits_path=hits_path)
+
+            self.assertEqual({policy_id: hits.count for policy_id, hits in report.hits.items()},
+                             {policy_id: len(resources) for policy_id, resources in live.items()})
+            with open(hits_path) as f:
+                written = [json.loads(line) for line in f]
+            by_policy = {policy.id: [] for policy in self.policies}
+            for hit in written:
+                by_policy[hit["policy_id"]].append(hit["resource_id"])
+            self.assertEqual({policy_id: sorted(ids) for policy_id, ids in by_policy.items()},
+                             {policy_id: sorted(ids) for policy_id, ids in live.items()})
+            for policy_id, hits in report.hits.items():
+                self.assertEqual(hits.resources, by_policy[policy_id][:5])
+            if name.endswith(".snap"):
+                # Only the types the policies read were decompressed
+                self.assertGreater(report.frames_skipped, 0)
+
+    def test_missing_scope_and_truncated_file(self):
+        path = self.capture("inventory.snap")
+        unscoped = PolicyDefinition("p", "p", "p", "Microsoft.Compute/disks", 5,
+                                    [PolicyCondition("tags.owner", "notExists")], RemediationAction("tag", {}))
+        with self.assertRaisesRegex(ValueError, "need a subscription"):
+            ReplayEngine(path).run([unscoped])
+        with self.assertRaisesRegex(ValueError, "no listing for scopes: sub:elsewhere"):
+            ReplayEngine(path, subscription_id="elsewhere").run([unscoped])
+
+        data = Path(path).read_bytes()
+        Path(path).write_bytes(data[:len(data) - 10])
+        with self.assertRaisesRegex(ValueError, "truncated"):
+            ReplayEngine(path).run(self.policies)
+
+    def test_cli(self):
+        path = self.capture("inventory.snap")
+        policy_file = self.root / "policies.json"
+        policy_file.write_text(json.dumps({"policies": [{
+            "id": "untagged-disk",
+            "name": "untagged-disk",
+            "description": "untagged-disk",
+            "resource_type": "Microsoft.Compute/disks",
+            "evaluation_frequency": 5,
+            "scope": {"managementGroup": MANAGEMENT_GROUP},
+            "conditions": [{"field": "tags.owner", "operator": "notExists"}],
+            "remediation_action": {"type": "delete", "parameters": {}}
+        }]}))
+        with patch('builtins.print') as printed:
+            self.assertEqual(main(["run", path, str(policy_file), "--workers", "1", "--list", "2"]), 0)
+        lines = [call.args[0] for call in printed.call_args_list]
+        self.assertTrue(lines[1].startswith("untagged-disk"))
+        self.assertEqual(len([line for line in lines if line.startswith("    /subscriptions/")]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+from resource_index import ResourceIndex
+from fakes import FakeInventory
+
+
+def make_resource(resource_id, resource_type, resource_group="rg1", **attrs):
+    return SimpleNamespace(id=resource_id, type=resource_type, resource_group=resource_group, name=resource_id, tags={}, **attrs)
+
+
+class TestResourceIndex(unittest.TestCase):
+    def test_buckets_by_type_and_group(self):
+        vm1 = make_resource("vm1", "Microsoft.Compute/virtualMachines", "rg1")
+        vm2 = make_resource("vm2", "Microsoft.Compute/virtualMachines", "rg2")
+        sa1 = make_resource("sa1", "Microsoft.Storage/storageAccounts", "rg1")
+        index = ResourceIndex([vm1, sa1, vm2])
+
+        self.assertEqual(index.for_type("Microsoft.Compute/virtualMachines"), [vm1, vm2])
+        self.assertEqual(index.for_type("Microsoft.Storage/storageAccounts"), [sa1])
+        self.assertEqual(index.for_type("Microsoft.Web/sites"), [])
+        self.assertEqual(index.for_group("Microsoft.Compute/virtualMachines", "rg2"), [vm2])
+        self.assertEqual(len(index), 3)
+        merged = ResourceIndex([vm1])
+        merged.merge(ResourceIndex([sa1, vm2]))
+        self.assertEqual(merged.for_type("Microsoft.Compute/virtualMachines"), [vm1, vm2])
+        self.assertEqual(len(merged), 3)
+        self.assertCountEqual(list(index), [vm1, vm2, sa1])
+
+
+class TestPolicyEngineIndex(unittest.TestCase):
+    def setUp(self):
+        self.inventory = FakeInventory()
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.addCleanup(self.policy_engine.remediation_state.conn.close)
+        self.policy_engine._handle_remediation = AsyncMock()
+
+    def make_policy(self, resource_type):
+        return PolicyDefinition(
+            id="test-policy",
+            name="Test Policy",
+            description="A test policy",
+            resource_type=resource_type,
+            evaluation_frequency=5,
+            conditions=[PolicyCondition(field="location", operator="equals", value="westus")],
+            remediation_action=RemediationAction(type="delete", parameters={})
+        )
+
+    def test_evaluate_policy_only_visits_matching_type(self):
+        vm = make_resource("vm1", "Microsoft.Compute/virtualMachines", location="westus")
+        sa = make_resource("sa1", "Microsoft.Storage/storageAccounts", location="westus")
+        self.inventory.subscriptions['test-subscription-id'] = [vm, sa]
+
+        asyncio.run(self.policy_engine.evaluate_policy(self.make_policy("Microsoft.Compute/virtualMachines")))
+
+        self.policy_engine._handle_remediation.assert_awaited_once()
+        self.assertEqual(self.policy_engine._handle_remediation.await_args.args[0].id, vm.id)
+
+    def test_empty_listing_is_cached(self):
+
+        policy = self.make_policy("Microsoft.Compute/virtualMachines")
+        asyncio.run(self.policy_engine.evaluate_policy(policy))
+        asyncio.run(self.policy_engine.evaluate_policy(policy))
+
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import asyncio
+import pickle
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from condition_compiler import resolve_path
+from inventory import ArmResource
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+from resource_projection import ResourceProjection
+from fakes import FakeInventory
+
+VM_TYPE = "Microsoft.Compute/virtualMachines"
+VM_ID = f"/subscriptions/s/resourceGroups/rg-a/providers/{VM_TYPE}/vm1"
+
+
+def arm_vm():
+    return ArmResource({
+        "id": VM_ID, "name": "vm1", "type": VM_TYPE, "location": "westus", "kind": None,
+        "sku": {"name": "Standard_D2s_v3", "tier": "Standard"}, "tags": {"env": "prod"},
+        "properties": {
+            "storageProfile": {"osDisk": {"osType": "Linux", "diskSizeGB": 30}, "imageReference": {"sku": "22_04"}},
+            "hardwareProfile": {"vmSize": "Standard_D2s_v3"},
+        },
+    })
+
+
+def make_policy(policy_id, *conditions):
+    return PolicyDefinition(
+        id=policy_id,
+        name=policy_id,
+        description=policy_id,
+        resource_type=VM_TYPE,
+        evaluation_frequency=60,
+        conditions=list(conditions),
+        remediation_action=RemediationAction(type="delete", parameters={})
+    )
+
+
+class TestResourceProjection(unittest.TestCase):
+    def test_keeps_only_referenced_fields(self):
+        projection = ResourceProjection(["location", "properties.storageProfile.osDisk.osType"])
+
+        record = projection.project(arm_vm())
+
+        self.assertEqual(projection.fields, ("id", "type", "name", "resource_group", "tags", "changed_time", "location", "properties"))
+        self.assertEqual((record.id, record.resource_group, record.tags), (VM_ID, "rg-a", {"env": "prod"}))
+        self.assertEqual(resolve_path(record, ("properties", "storageProfile", "osDisk", "osType")), "Linux")
+        self.assertEqual(record.properties.__fields__, ("storageProfile",))
+        self.assertEqual(record.properties.storageProfile.__fields__, ("osDisk",))
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertFalse(hasattr(record, "sku"))
+
+    def test_shorter_path_keeps_whole_value(self):
+        projection = ResourceProjection(["properties.storageProfile.osDisk.osType", "properties.storageProfile"])
+
+        record = projection.project(arm_vm())
+
+        self.assertEqual(set(record.properties.storageProfile), {"osDisk", "imageReference"})
+        self.assertTrue(projection.covers(["properties.storageProfile.imageReference.sku"]))
+        self.assertFalse(projection.covers(["properties.hardwareProfile.vmSize"]))
+        self.assertFalse(projection.covers(["properties"]))
+
+    def test_interns_repeated_strings(self):
+        projection = ResourceProjection(["location"])
+        first = projection.project(arm_vm())
+        second = projection.project(arm_vm())
+
+        self.assertIs(first.type, second.type)
+        self.assertIs(first.resource_group, second.resource_group)
+
+    def test_missing_fields_resolve_to_none(self):
+        projection = ResourceProjection(["sku.name", "identity.type"])
+
+        record = projection.project(SimpleNamespace(id=VM_ID, type=VM_TYPE, name="vm1", tags=None))
+
+        self.assertEqual((record.sku, record.identity, record.resource_group), (None, None, "rg-a"))
+
+    def test_keys_that_are_not_identifiers_stay_in_dicts(self):
+        projection = ResourceProjection(["tags.cost-center", "properties.x-ms-tier", "properties.hardwareProfile.vmSize"])
+        vm = arm_vm()
+        vm.properties["x-ms-tier"] = "gold"
+
+        record = projection.project(vm)
+
+        self.assertEqual(record.properties["x-ms-tier"], "gold")
+        self.assertEqual(record.properties["hardwareProfile"].vmSize, "Standard_D2s_v3")
+        self.assertIs(record.tags, vm.tags)
+
+    def test_field_names_do_not_collide_with_record_attributes(self):
+        vm = arm_vm()
+        vm.properties["fields"] = {"x": 1}
+        projection = ResourceProjection(["properties.fields.x", "properties.hardwareProfile.vmSize"])
+
+        record = projection.project(vm)
+
+        self.assertEqual(resolve_path(record, ("properties", "fields", "x")), 1)
+        self.assertEqual(set(record.properties.__fields__), {"fields", "hardwareProfile"})
+        self.assertEqual(pickle.loads(pickle.dumps(record)).properties.fields.x, 1)
+        self.assertIn("fields=ResourceRecord(x=1)", repr(record.properties))
+
+    def test_records_pickle(self):
+        record = ResourceProjection(["location", "properties.storageProfile.osDisk.osType"]).project(arm_vm())
+
+        restored = pickle.loads(pickle.dumps(record))
+
+        self.assertEqual((restored.id, restored.location), (record.id, record.location))
+        self.assertEqual(restored.properties.storageProfile.osDisk.osType, "Linux")
+
+
+class TestEngineProjection(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = FakeInventory()
+        self.inventory.subscriptions["test-subscription-id"] = [arm_vm()]
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.addCleanup(self.policy_engine.remediation_state.conn.close)
+        self.policy_engine._handle_remediation = AsyncMock()
+
+    def test_new_field_widens_projection_and_relists(self):
+        by_location = make_policy("by-location", PolicyCondition(field="location", operator="equals", value="westus"))
+        by_os = make_policy("by-os", PolicyCondition(
+            field="properties.storageProfile.osDisk.osType", operator="equals", value="Linux"))
+
+        asyncio.run(self.policy_engine.evaluate_policy(by_location))
+        asyncio.run(self.policy_engine.evaluate_policy(by_location))
+        asyncio.run(self.policy_engine.evaluate_policy(by_os))
+
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"] * 2)
+        self.assertEqual(self.policy_engine._handle_remediation.await_count, 3)
+        record = next(iter(self.policy_engine.resource_cache.peek("all")))
+        self.assertEqual(record.properties.storageProfile.osDisk.__fields__, ("osType",))
+
+    def test_fields_path_evaluates(self):
+        by_fields = make_policy("by-fields", PolicyCondition(field="properties.fields.x", operator="equals", value=1))
+        by_location = make_policy("by-location", PolicyCondition(field="location", operator="equals", value="westus"))
+        self.inventory.subscriptions["test-subscription-id"][0].properties["fields"] = {"x": 1}
+
+        report = asyncio.run(self.policy_engine.evaluate_policies([by_fields, by_location]))
+
+        self.assertEqual(report.violations, {VM_ID: ["by-fields", "by-location"]})
+
+    def test_widening_mid_listing_does_not_reuse_the_narrow_load(self):
+        vms = []
+        for i in range(6):
+            data = {"id": f"{VM_ID}-{i}", "name": f"vm{i}", "type": VM_TYPE, "location": "westus",
+                    "tags": {}, "properties": {"owner": "team-a"}}
+            vms.append(ArmResource(data))
+        self.inventory.subscriptions["test-subscription-id"] = vms
+        self.inventory.page_delay = 0.01
+        by_location = make_policy("by-location", PolicyCondition(field="location", operator="equals", value="westus"))
+        unowned = make_policy("unowned", PolicyCondition(field="properties.owner", operator="notExists"))
+
+        async def run():
+            first = asyncio.ensure_future(self.policy_engine.evaluate_policy(by_location))
+            # Registers while the first listing is on its second page
+            await asyncio.sleep(0.015)
+            await self.policy_engine.evaluate_policy(unowned)
+            await first
+
+        asyncio.run(run())
+
+        flagged = [call.args[1].id for call in self.policy_engine._handle_remediation.await_args_list]
+        self.assertEqual(flagged.count("by-location"), 6)
+        self.assertNotIn("unowned", flagged)
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"] * 2)
+        # Only the listing made under the wider projection was cached
+        cached = self.policy_engine.resource_cache.peek("all")
+        self.assertTrue(all(record.properties.owner == "team-a" for record in cached))
+
+    def test_registering_all_policies_up_front_lists_once(self):
+        policies = [
+            make_policy("by-location", PolicyCondition(field="location", operator="equals", value="westus")),
+            make_policy("by-sku", PolicyCondition(field="sku.tier", operator="equals", value="Standard")),
+        ]
+        self.policy_engine.register_policies(policies)
+
+        for policy in policies:
+            asyncio.run(self.policy_engine.evaluate_policy(policy))
+
+        self.assertEqual(self.inventory.calls, ["sub:test-subscription-id"])
+        self.assertEqual(self.policy_engine._handle_remediation.await_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
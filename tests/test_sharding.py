@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.synthetic import MANAGEMENT_GROUP, SyntheticInventory
+from policy_loader import PolicySource
+from services.monitoring_service import MetricData, MonitoringService
+from sharding import HashRing, ShardConfig, ShardCoordinator, ShardInventory, ShardedDaemon, run_worker, shard_key
+
+
+async def collect(pages):
+    return [resource async for page in pages for resource in page]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_keys_spread_and_move_little_on_resize(self):
+        keys = [shard_key(f"sub-{s}", f"Microsoft.Type/t{t}") for s in range(50) for t in range(40)]
+        four, five = HashRing(4), HashRing(5)
+        spread = Counter(four.shard_for(key) for key in keys)
+        self.assertEqual(set(spread), {0, 1, 2, 3})
+        self.assertGreater(min(spread.values()), len(keys) / 4 * 0.5)
+
+        # Another process builds the same ring
+        self.assertEqual([HashRing(4).shard_for(key) for key in keys], [four.shard_for(key) for key in keys])
+        moved = sum(four.shard_for(key) != five.shard_for(key) for key in keys)
+        self.assertLess(moved, len(keys) * 0.35)
+
+    def test_shard_inventories_partition_the_listing(self):
+        inventory = SyntheticInventory(resources=600, subscriptions=3, page_size=50)
+        everything = asyncio.run(collect(inventory.list_management_group(MANAGEMENT_GROUP)))
+        ring = HashRing(3)
+        shards = [asyncio.run(collect(ShardInventory(inventory, ring, shard).list_management_group(MANAGEMENT_GROUP)))
+                  for shard in range(3)]
+
+        ids = [resource.id for shard in shards for resource in shard]
+        self.assertEqual(sorted(ids), sorted(resource.id for resource in everything))
+        # A (subscription, type) pair lives in exactly one shard
+        for shard, resources in enumerate(shards):
+            self.assertTrue(all(ring.owns(shard, resource) for resource in resources))
+
+
+class TestShardCoordinator(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / "shards.db")
+        self.coordinator = ShardCoordinator(self.path, shards=2, lease_ttl=10)
+        self.addCleanup(self.coordinator.close)
+
+    def test_leases(self):
+        self.assertEqual(self.coordinator.acquire("a", now=100), 0)
+        self.assertEqual(self.coordinator.acquire("b", now=100), 1)
+        self.assertIsNone(self.coordinator.acquire("c", now=105))
+        self.assertTrue(self.coordinator.renew(0, "a", now=105))
+
+        # b stopped renewing; c takes over and b finds out on its next renewal
+        self.assertEqual(self.coordinator.acquire("c", now=112), 1)
+        self.assertFalse(self.coordinator.renew(1, "b", now=113))
+        self.assertEqual(self.coordinator.leases(now=113), {0: "a", 1: "c"})
+
+        self.coordinator.release(1, "b")
+        self.assertEqual(self.coordinator.leases(now=113)[1], "c")
+        self.coordinator.release(1, "c")
+        self.assertEqual(self.coordinator.acquire("d", now=113), 1)
+
+        # A worker that serves several shards doesn't lease its own lapsed shard a second time
+        self.assertEqual(self.coordinator.acquire("a", now=200), 1)
+        self.assertIsNone(self.coordinator.acquire("a", now=200))
+
+    def test_snapshots_only_from_the_lease_holder(self):
+        self.coordinator.acquire("a")
+        self.assertTrue(self.coordinator.publish(0, "a", {"counters": {"x": 1}}))
+        self.assertFalse(self.coordinator.publish(0, "b", {"counters": {"x": 2}}))
+        self.assertEqual(self.coordinator.snapshots(), {0: {"counters": {"x": 1}}})
+
+    def test_shard_count_is_fixed(self):
+        with self.assertRaisesRegex(ValueError, "created for 2 shards"):
+            ShardCoordinator(self.path, shards=3)
+
+
+class TestMetricMerge(unittest.TestCase):
+    def test_snapshots_sum(self):
+        shards = [MonitoringService(), MonitoringService()]
+        for i, monitoring in enumerate(shards):
+            monitoring.record_metric(MetricData("p1", f"r{i}", "remediation", "success", 0.2))
+            monitoring.observe("evaluation_pass", 0.5 + i)
+            monitoring.increment("remediation_success")
+            monitoring.set_gauge("inventory_cache_entries", 3)
+
+        total = MonitoringService()
+        for monitoring in shards:
+            total.merge(json.loads(json.dumps(monitoring.snapshot())))
+
+        self.assertEqual(total.action_counts[("p1", "remediation", "success")], 2)
+        self.assertEqual(total.get_histogram("p1", "remediation").count, 2)
+        self.assertEqual(total.get_timing("evaluation_pass").sum, 2.0)
+        self.assertEqual(total.get_counters(), {"remediation_success": 2})
+        self.assertEqual(total.get_gauges(), {"inventory_cache_entries": 6})
+        self.assertIn('policy_actions_total{policy="p1",action="remediation",status="success"} 2',
+                      total.render_prometheus())
+
+
+class TestShardedDaemon(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        bundle = self.root / "policies"
+        bundle.mkdir()
+        (bundle / "disks.json").write_text(json.dumps({"policies": [{
+            "id": "untagged-disk",
+            "name": "untagged-disk",
+            "description": "untagged-disk",
+            "resource_type": "Microsoft.Compute/disks",
+            "evaluation_frequency": 60,
+            "scope": {"managementGroup": MANAGEMENT_GROUP},
+            "conditions": [{"field": "tags.owner", "operator": "notExists"}],
+            # Timed, so a first pass only records violations and never calls ARM
+            "remediation_action": {"type": "delete", "parameters": {}, "timing": {"delay": "7d"}}
+        }]}))
+        # A second file, so each worker loads the bundle through a process pool of its own
+        (bundle / "none.json").write_text(json.dumps({"policies": [{
+            "id": "nothing", "name": "nothing", "description": "nothing",
+            "resource_type": "Example.None/things",
+            "evaluation_frequency": 60,
+            "scope": {"managementGroup": MANAGEMENT_GROUP},
+            "conditions": [{"field": "tags.owner", "operator": "notExists"}],
+            "remediation_action": {"type": "delete", "parameters": {}}
+        }]}))
+        inventory = SyntheticInventory(resources=3000, subscriptions=4, seed=3)
+        self.expected = {f"{resource.id}:{resource.type}"
+                         for resource in asyncio.run(collect(inventory.list_management_group(MANAGEMENT_GROUP)))
+                         if resource.type == "Microsoft.Compute/disks" and "owner" not in resource.tags}
+        self.config = ShardConfig("sub", PolicySource(str(bundle), workers=2), shards=2,
+                                  coordinator=str(self.root / "shards.db"), state_dir=str(self.root / "state"),
+                                  lease_ttl=0.6, inventory=inventory, daemon_options={"start_jitter": 0})
+
+    def run_sharded(self, workers=None):
+        daemon = ShardedDaemon(self.config, workers=workers)
+        daemon.start()
+        try:
+            deadline = time.monotonic() + 60
+            detected = 0
+            while time.monotonic() < deadline:
+                detected = daemon.metrics.collect().action_counts.get(
+                    ("untagged-disk", "violation_detected", "pending"), 0)
+                if detected >= len(self.expected):
+                    break
+                time.sleep(0.1)
+            self.assertEqual(detected, len(self.expected))
+            self.assertIn("shards_leased 2", daemon.metrics.render_prometheus())
+        finally:
+            daemon.stop()
+
+        keys = []
+        for shard in range(2):
+            with sqlite3.connect(str(self.root / "state" / f"shard-{shard}" / "remediation_state.db")) as conn:
+                shard_keys = [key for (key,) in conn.execute("SELECT key FROM remediation_state")]
+            self.assertTrue(shard_keys)
+            keys.extend(shard_keys)
+        # Each violation is tracked by exactly one shard
+        self.assertEqual(sorted(keys), sorted(self.expected))
+
+    def test_workers_split_the_inventory(self):
+        self.run_sharded()
+
+    def test_one_worker_serves_every_shard(self):
+        self.run_sharded(workers=1)
+
+    def test_standby_worker_survives_reload(self):
+        coordinator = ShardCoordinator(self.config.coordinator, 2, lease_ttl=60)
+        self.addCleanup(coordinator.close)
+        coordinator.acquire("a")
+        coordinator.acquire("b")
+        for signum in (signal.SIGHUP, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+
+        stop = threading.Event()
+
+        def reload_then_stop():
+            time.sleep(0.2)
+            os.kill(os.getpid(), signal.SIGHUP)
+            time.sleep(0.2)
+            stop.set()
+
+        sender = threading.Thread(target=reload_then_stop)
+        sender.start()
+        # Every shard is held, so this worker waits as a standby; the default SIGHUP action would end the test run
+        run_worker(self.config, stop)
+        sender.join()
+        self.assertEqual(coordinator.leases(), {0: "a", 1: "b"})
+
+if __name__ == '__main__':
+    unittest.main()
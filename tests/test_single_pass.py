@@ -0,0 +1,77 @@
+import asyncio
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, Scope
+from fakes import FakeInventory
+
+
+def make_resource(resource_id, resource_type, **attrs):
+    return SimpleNamespace(id=resource_id, type=resource_type, resource_group="rg1", name=resource_id, tags={}, **attrs)
+
+
+def make_policy(policy_id, resource_type, conditions, scope=None):
+    return PolicyDefinition(
+        id=policy_id,
+        name=policy_id,
+        description=policy_id,
+        resource_type=resource_type,
+        evaluation_frequency=5,
+        conditions=conditions,
+        remediation_action=RemediationAction(type="delete", parameters={}),
+        scope=scope
+    )
+
+
+class TestSinglePassEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.inventory = FakeInventory()
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+        self.addCleanup(self.policy_engine.remediation_state.conn.close)
+        self.policy_engine._handle_remediation = AsyncMock()
+
+    def test_one_listing_per_scope_and_violation_report(self):
+        vm_west = make_resource("vm1", "Microsoft.Compute/virtualMachines", location="westus")
+        vm_east = make_resource("vm2", "Microsoft.Compute/virtualMachines", location="eastus")
+        sa = make_resource("sa1", "Microsoft.Storage/storageAccounts", location="westus")
+        self.inventory.subscriptions["sub-a"] = [vm_west, vm_east, sa]
+        scope = Scope(subscription="sub-a")
+
+        policies = [
+            make_policy("vm-west", "Microsoft.Compute/virtualMachines",
+                        [PolicyCondition(field="location", operator="equals", value="westus")], Scope(subscription="sub-a")),
+            make_policy("vm-untagged", "Microsoft.Compute/virtualMachines",
+                        [PolicyCondition(field="tags.environment", operator="notExists")], scope),
+            make_policy("sa-west", "Microsoft.Storage/storageAccounts",
+                        [PolicyCondition(field="location", operator="equals", value="westus")], scope),
+        ]
+
+        report = asyncio.run(self.policy_engine.evaluate_policies(policies))
+
+        self.assertEqual(self.inventory.calls, ["sub:sub-a"])
+        self.assertEqual(report.violations, {
+            "vm1": ["vm-west", "vm-untagged"],
+            "vm2": ["vm-untagged"],
+            "sa1": ["sa-west"],
+        })
+        self.assertEqual(report.scopes_listed, 1)
+        self.assertEqual(report.resources_scanned, 3)
+        self.assertEqual(self.policy_engine._handle_remediation.await_count, 4)
+
+    def test_remediation_failure_is_reported_not_raised(self):
+        self.inventory.subscriptions["test-subscription-id"] = [make_resource("vm1", "Microsoft.Compute/virtualMachines")]
+        self.policy_engine._handle_remediation.side_effect = RuntimeError("boom")
+        policy = make_policy("vm-any", "Microsoft.Compute/virtualMachines", [PolicyCondition(field="id", operator="exists")])
+
+        report = asyncio.run(self.policy_engine.evaluate_policies([policy]))
+
+        self.assertEqual(report.errors, {"vm1": ["vm-any"]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from state_store import JsonStateStore, SqliteStateStore, open_state_store
+
+
+def entry(policy_id="p1"):
+    return {"first_violation": "2024-01-01T00:00:00", "policy_id": policy_id, "warnings_sent": []}
+
+
+class TestSqliteStateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "remediation_state.db"
+
+    def open(self, **kwargs):
+        store = SqliteStateStore(self.path, **kwargs)
+        self.addCleanup(store.conn.close)
+        return store
+
+    def rows(self):
+        with sqlite3.connect(str(self.path)) as conn:
+            return dict(conn.execute("SELECT key, value FROM remediation_state").fetchall())
+
+    def test_writes_are_buffered_until_flush(self):
+        store = self.open()
+        store["a"] = entry()
+        store["b"] = entry()
+        self.assertIn("a", store)
+        self.assertEqual(self.rows(), {})
+
+        store.flush()
+        self.assertEqual(set(self.rows()), {"a", "b"})
+
+        del store["a"]
+        self.assertNotIn("a", store)
+        store.flush()
+        self.assertEqual(set(self.rows()), {"b"})
+
+    def test_reopen_reads_lazily(self):
+        store = self.open()
+        store["a"] = entry("p1")
+        store["b"] = entry("p2")
+        store.close()
+
+        reopened = self.open()
+        self.assertEqual(reopened._loaded, {})
+        self.assertEqual(reopened["b"]["policy_id"], "p2")
+        self.assertEqual(list(reopened._loaded), ["b"])
+        self.assertEqual(sorted(reopened), ["a", "b"])
+        self.assertEqual(len(reopened), 2)
+
+    def test_mutations_persist_when_assigned_back(self):
+        store = self.open()
+        store["a"] = entry()
+        store.flush()
+
+        state = store["a"]
+        state["warnings_sent"].append("warning_sent")
+        store["a"] = state
+        store.flush()
+
+        self.assertEqual(json.loads(self.rows()["a"])["warnings_sent"], ["warning_sent"])
+
+    def test_read_cache_is_bounded(self):
+        store = self.open(cache_size=2)
+        for key in "abcd":
+            store[key] = entry()
+        store.flush()
+        self.assertEqual(list(store._loaded), ["c", "d"])
+
+        store["c"]
+        store["a"]
+        self.assertEqual(list(store._loaded), ["c", "a"])
+        self.assertEqual(store["b"], entry())
+        self.assertEqual(len(store), 4)
+
+    def test_len_accounts_for_pending_changes(self):
+        store = self.open()
+        store["a"] = entry()
+        store.flush()
+        store["b"] = entry()
+        del store["a"]
+        self.assertEqual(len(store), 1)
+        self.assertEqual(list(store), ["b"])
+
+    def test_migrates_legacy_json_once(self):
+        legacy = Path(self.tmp.name) / "remediation_state.json"
+        legacy.write_text(json.dumps({"a": entry("p1"), "b": entry("p2")}))
+
+        store = self.open(legacy_json=legacy)
+
+        self.assertFalse(legacy.exists())
+        self.assertTrue(legacy.with_suffix(".json.migrated").exists())
+        self.assertEqual(store["a"]["policy_id"], "p1")
+        self.assertEqual(len(store), 2)
+
+    def test_uses_wal_and_configured_synchronous_mode(self):
+        store = self.open(synchronous="full")
+        self.assertEqual(store.conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(store.conn.execute("PRAGMA synchronous").fetchone()[0], 2)
+
+
+class TestJsonStateStore(unittest.TestCase):
+    def test_flush_replaces_file_atomically(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = open_state_store("json", Path(tmp))
+            self.assertIsInstance(store, JsonStateStore)
+            store["a"] = entry()
+            store.flush()
+
+            self.assertEqual(json.loads((Path(tmp) / "remediation_state.json").read_text()), {"a": entry()})
+            self.assertFalse((Path(tmp) / "remediation_state.json.tmp").exists())
+
+    def test_unknown_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                open_state_store("redis", Path(tmp))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction
+
+
+class CountingInventory:
+    """Generates pages on demand and records how far the listing has got."""
+
+    def __init__(self, total, page_size=10):
+        self.total = total
+        self.page_size = page_size
+        self.produced = 0
+
+    async def list_subscription(self, subscription_id):
+        for start in range(0, self.total, self.page_size):
+            page = []
+            for i in range(start, min(start + self.page_size, self.total)):
+                resource_type = "Microsoft.Compute/virtualMachines" if i % 2 else "Microsoft.Storage/storageAccounts"
+                page.append(SimpleNamespace(id=f"r{i}", type=resource_type, name=f"r{i}", resource_group="rg", tags={}, location="westus"))
+            self.produced += len(page)
+            yield page
+
+    async def close(self):
+        pass
+
+
+def make_policy(policy_id, resource_type):
+    return PolicyDefinition(
+        id=policy_id,
+        name=policy_id,
+        description=policy_id,
+        resource_type=resource_type,
+        evaluation_frequency=5,
+        conditions=[PolicyCondition(field="location", operator="equals", value="westus")],
+        remediation_action=RemediationAction(type="delete", parameters={})
+    )
+
+
+class TestStreamingEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.inventory = CountingInventory(total=200)
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, streaming=True, stream_window=5,
+                                          state_dir=self.state_dir.name)
+        self.addCleanup(self.policy_engine.remediation_state.conn.close)
+        self.remediated = []
+        self.max_backlog = 0
+
+        async def remediate(resource, policy):
+            self.remediated.append((resource.id, policy.id))
+            # Resources listed but not yet remediated (or skipped by the type filter)
+            backlog = self.inventory.produced - 2 * len(self.remediated)
+            self.max_backlog = max(self.max_backlog, backlog)
+            await asyncio.sleep(0)
+
+        self.policy_engine._handle_remediation = remediate
+
+    def test_streaming_applies_backpressure_and_skips_cache(self):
+        policy = make_policy("vm-west", "Microsoft.Compute/virtualMachines")
+
+        report = asyncio.run(self.policy_engine.evaluate_streaming([policy]))
+
+        self.assertEqual(len(self.remediated), 100)
+        self.assertEqual(report.violation_count, 100)
+        self.assertEqual(report.resources_scanned, 100)
+        self.assertEqual(report.violations, {})
+        self.assertEqual(len(self.policy_engine.resource_cache), 0)
+        # window of 5 violations plus the page being evaluated, doubled for the type filter
+        self.assertLessEqual(self.max_backlog, 2 * (5 + self.inventory.page_size) + 2)
+
+    def test_evaluate_policy_uses_streaming_when_enabled(self):
+        asyncio.run(self.policy_engine.evaluate_policy(make_policy("sa-west", "Microsoft.Storage/storageAccounts")))
+
+        self.assertEqual(len(self.remediated), 100)
+        self.assertTrue(all(resource_id in {f"r{i}" for i in range(0, 200, 2)} for resource_id, _ in self.remediated))
+
+
+class TestStreamingThroughPool(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = CountingInventory(total=400)
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, streaming=True,
+                                          stream_window=1, remediation_workers=2, state_dir=self.state_dir.name)
+        self.pool = self.policy_engine.remediation_pool
+        self.pool.queue_size = 4
+        self.pool.subscription_burst = self.pool.provider_burst = 1000
+        self.deleted = []
+        self.max_tasks = 0
+        self.max_staged = 0
+
+        async def apply(resource, action):
+            self.deleted.append(resource.id)
+            self.max_tasks = max(self.max_tasks, len(asyncio.all_tasks()))
+            self.max_staged = max(self.max_staged, len(self.pool.staged))
+            await asyncio.sleep(0.002)
+
+        self.pool.apply = apply
+
+    def test_full_queue_holds_back_submissions(self):
+        async def run():
+            try:
+                report = await self.policy_engine.evaluate_streaming([make_policy("vm-west", "Microsoft.Compute/virtualMachines")])
+                await self.pool.join()
+                return report
+            finally:
+                await self.policy_engine.close()
+
+        report = asyncio.run(run())
+
+        self.assertEqual(report.violation_count, 200)
+        self.assertEqual(sorted(self.deleted), sorted(f"r{i}" for i in range(1, 400, 2)))
+        self.assertEqual(self.policy_engine.monitoring.get_counters()["remediation_success"], 200)
+        # Workers, the streaming worker and one flush, not a flush or a timer per submission
+        self.assertLessEqual(self.max_tasks, self.pool.workers + 4)
+        self.assertLessEqual(self.max_staged, self.pool.queue_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from collections import Counter
+from contextlib import redirect_stdout
+from io import StringIO
+
+from benchmarks import bench_suite
+from benchmarks.synthetic import MANAGEMENT_GROUP, FakeResourceManagementClient, SyntheticInventory, synthetic_policies
+
+
+async def collect(pages):
+    return [resource async for page in pages for resource in page]
+
+
+class TestSyntheticInventory(unittest.TestCase):
+    def test_listing_is_deterministic_and_complete(self):
+        inventory = SyntheticInventory(resources=2500, subscriptions=3, seed=7, page_size=100)
+        first = asyncio.run(collect(inventory.list_management_group(MANAGEMENT_GROUP)))
+        second = asyncio.run(collect(SyntheticInventory(2500, 3, seed=7, page_size=100).list_management_group(MANAGEMENT_GROUP)))
+
+        self.assertEqual(len(first), 2500)
+        self.assertEqual(len({resource.id for resource in first}), 2500)
+        self.assertEqual([(r.id, r.tags, r.properties) for r in first], [(r.id, r.tags, r.properties) for r in second])
+        other_seed = asyncio.run(collect(SyntheticInventory(2500, 3, seed=8, page_size=100).list_management_group(MANAGEMENT_GROUP)))
+        self.assertNotEqual([r.id for r in first], [r.id for r in other_seed])
+
+    def test_type_mix(self):
+        inventory = SyntheticInventory(resources=5000, subscriptions=1)
+        types = Counter(resource.type for resource in asyncio.run(collect(inventory.list_subscription(inventory.subscription_ids[0]))))
+        self.assertGreater(types["Microsoft.Network/networkInterfaces"], types["Microsoft.KeyVault/vaults"])
+        self.assertGreaterEqual(len(types), 10)
+
+    def test_fake_client_lists_and_counts_calls(self):
+        inventory = SyntheticInventory(resources=10, subscriptions=2)
+        client = FakeResourceManagementClient(inventory, inventory.subscription_ids[1])
+
+        async def run():
+            listed = [resource async for resource in client.resources.list()]
+            poller = await client.tags.begin_create_or_update_at_scope(scope=listed[0].id, parameters={"tags": {}})
+            await poller.result()
+            await client.resources.begin_delete(resource_name="x")
+            return listed
+
+        listed = asyncio.run(run())
+        self.assertEqual(len(listed), 5)
+        self.assertEqual(client.calls, {"tag": 1, "delete": 1})
+
+    def test_policy_mix(self):
+        policies = synthetic_policies(25)
+        self.assertEqual(len({policy.id for policy in policies}), 25)
+        self.assertGreaterEqual(len({policy.resource_type for policy in policies}), 8)
+        self.assertEqual({policy.remediation_action.type for policy in policies}, {"tag", "modify", "delete"})
+        self.assertEqual(synthetic_policies(25), policies)
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_small_run_writes_and_compares_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            argv = ["--resources", "300", "--policies", "1", "3", "--repeat", "1", "--in-process",
+                    "--arm-latency", "0", "--output", output]
+            with redirect_stdout(StringIO()):
+                self.assertEqual(bench_suite.main(argv), 0)
+                # Comparing against itself finds nothing to report
+                self.assertEqual(bench_suite.main(argv + ["--compare", output, "--threshold", "10"]), 0)
+            with open(output) as f:
+                results = json.load(f)["results"]
+
+        points = {bench_suite.point_key(result) for result in results}
+        self.assertIn(("evaluate", 300, 3, "warm"), points)
+        self.assertIn(("daemon", 300, 1, "single_pass"), points)
+        remediation = [result for result in results if result["scenario"] == "remediation"]
+        self.assertTrue(all(result["remediations"] == result["violations"] for result in remediation))
+        self.assertTrue(all(result["resources_per_second"] > 0 and result["peak_rss_mb"] > 0 for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
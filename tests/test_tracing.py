@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from policy_engine import PolicyEngine
+from policy_types import PolicyDefinition, PolicyCondition, RemediationAction, Scope
+from tracing import InMemoryExporter, JsonlExporter, SamplingProfiler, Tracer, configure_from_env, tracer
+from fakes import FakeInventory
+
+
+async def pages(*items):
+    for item in items:
+        await asyncio.sleep(0)
+        yield item
+
+
+class TestTracer(unittest.TestCase):
+    def test_disabled_tracer_returns_shared_noop(self):
+        local = Tracer()
+        first = local.span("a", policy_id="p1")
+        self.assertIs(first, local.span("b"))
+        with first as span:
+            span.set("ignored", 1)
+        iterator = pages(1)
+        self.assertIs(local.traced("page", iterator), iterator)
+
+    def test_spans_nest_and_carry_attributes(self):
+        local = Tracer()
+        exporter = InMemoryExporter()
+        local.add_exporter(exporter)
+
+        with local.span("outer", policy_id="p1") as outer:
+            with local.span("inner", scope="sub:a"):
+                pass
+            with local.span("detached", root=True):
+                pass
+        with self.assertRaises(ValueError):
+            with local.span("failing"):
+                raise ValueError()
+
+        inner, detached = exporter.by_name("inner")[0], exporter.by_name("detached")[0]
+        self.assertEqual([span.name for span in exporter.spans], ["inner", "detached", "outer", "failing"])
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertIsNone(detached.parent_id)
+        self.assertEqual(outer.attributes, {"policy_id": "p1"})
+        self.assertEqual(exporter.by_name("failing")[0].attributes["error"], "ValueError")
+
+    def test_traced_iterator_times_each_step(self):
+        local = Tracer()
+        exporter = InMemoryExporter()
+        local.add_exporter(exporter)
+
+        async def collect():
+            with local.span("listing"):
+                return [item async for item in local.traced("page", pages(1, 2), scope="all")]
+
+        self.assertEqual(asyncio.run(collect()), [1, 2])
+        listing = exporter.by_name("listing")[0]
+        # Two pages plus the step that finds the end
+        self.assertEqual(len(exporter.by_name("page")), 3)
+        self.assertTrue(all(span.parent_id == listing.span_id for span in exporter.by_name("page")))
+
+    def test_jsonl_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spans.jsonl")
+            local = Tracer()
+            local.add_exporter(JsonlExporter(path))
+            with local.span("outer", policy_id="p1"):
+                with local.span("inner"):
+                    pass
+            local.close()
+
+            with open(path) as f:
+                spans = [json.loads(line) for line in f]
+        self.assertEqual([span["name"] for span in spans], ["inner", "outer"])
+        self.assertEqual(spans[0]["parent_id"], spans[1]["span_id"])
+        self.assertEqual(spans[1]["attributes"], {"policy_id": "p1"})
+        self.assertFalse(local.enabled)
+
+
+class TestEngineSpans(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.inventory = FakeInventory()
+        self.policy_engine = PolicyEngine('test-subscription-id', inventory=self.inventory, state_dir=self.state_dir.name)
+
+        async def apply(resource, action):
+            return None
+
+        self.policy_engine.remediation_pool.apply = apply
+        self.exporter = InMemoryExporter()
+        tracer.add_exporter(self.exporter)
+        self.addCleanup(tracer.remove_exporter, self.exporter)
+
+    def test_evaluate_policy_stages(self):
+        self.inventory.subscriptions["sub-a"] = [
+            SimpleNamespace(id=f"vm{i}", type="Microsoft.Compute/virtualMachines", resource_group="rg",
+                            name=f"vm{i}", tags={}) for i in range(3)
+        ]
+        policy = PolicyDefinition(
+            id="vm-any", name="vm-any", description="vm-any", resource_type="Microsoft.Compute/virtualMachines",
+            evaluation_frequency=5, conditions=[PolicyCondition(field="id", operator="exists")],
+            remediation_action=RemediationAction(type="tag", parameters={"a": "b"}, timing=None),
+            scope=Scope(subscription="sub-a")
+        )
+
+        async def evaluate():
+            await self.policy_engine.evaluate_policy(policy)
+            await self.policy_engine.remediation_pool.join()
+            await self.policy_engine.close()
+
+        asyncio.run(evaluate())
+
+        evaluation = self.exporter.by_name("evaluate_policy")[0]
+        self.assertEqual(evaluation.attributes, {"policy_id": "vm-any", "scope": "sub:sub-a"})
+        for stage in ("list_page", "match_conditions", "handle_remediation", "save_state"):
+            spans = self.exporter.by_name(stage)
+            self.assertTrue(spans, stage)
+            self.assertTrue(all(span.parent_id == evaluation.span_id for span in spans), stage)
+        self.assertEqual(len(self.exporter.by_name("handle_remediation")), 3)
+        self.assertTrue(all(span.parent_id is None for span in self.exporter.by_name("remediation_call")))
+        self.assertEqual(len(self.exporter.by_name("remediation_call")), 3)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def test_collects_folded_stacks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "profile.folded")
+            profiler = SamplingProfiler(output=output, interval=0.001)
+            stop = threading.Event()
+
+            def busy_loop():
+                while not stop.is_set():
+                    sum(range(100))
+
+            worker = threading.Thread(target=busy_loop)
+            worker.start()
+            profiler.toggle()
+            time.sleep(0.05)
+            profiler.toggle()
+            stop.set()
+            worker.join()
+
+            with open(output) as f:
+                lines = f.read().splitlines()
+        self.assertFalse(profiler.running)
+        self.assertGreater(profiler.samples, 0)
+        self.assertTrue(any("test_tracing.py:busy_loop" in line for line in lines))
+
+    def test_configure_from_env(self):
+        profiler = configure_from_env({"POLICY_TRACE": "memory"})
+        self.addCleanup(tracer.close)
+        self.assertTrue(tracer.enabled)
+        self.assertIsInstance(tracer.exporters[0], InMemoryExporter)
+        self.assertFalse(profiler.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+import contextvars
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from logging import getLogger
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+logger = getLogger(__name__)
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'attributes')
+
+    def __init__(self, name: str, span_id: int, parent_id: Optional[int], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+class _NoopSpan:
+    """Returned by a disabled tracer; entering, leaving and set() do nothing"""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    def set(self, key: str, value: Any):
+        pass
+
+_NOOP = _NoopSpan()
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+class _ActiveSpan:
+    __slots__ = ('tracer', 'span', 'token')
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current.reset(self.token)
+        self.span.end = time.time()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        self.tracer._export(self.span)
+
+class InMemoryExporter:
+    """Keeps the most recent finished spans"""
+
+    def __init__(self, max_spans: int = 100000):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def by_name(self, name: str) -> List[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def clear(self):
+        self.spans.clear()
+
+    def close(self):
+        pass
+
+class JsonlExporter:
+    """Appends one JSON object per finished span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', buffering=1)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class Tracer:
+    """Nested timing spans, handed to exporters as they finish.
+
+    With no exporter the tracer is disabled and span() returns a shared no-op,
+    so instrumented code pays one attribute check per span.
+    """
+
+    def __init__(self):
+        self.exporters: List[Any] = []
+        self.enabled = False
+        self._ids = itertools.count(1)
+
+    def add_exporter(self, exporter: Any):
+        self.exporters.append(exporter)
+        self.enabled = True
+
+    def remove_exporter(self, exporter: Any):
+        self.exporters.remove(exporter)
+        self.enabled = bool(self.exporters)
+
+    def span(self, name: str, root: bool = False, **attributes: Any):
+        """Time a block; root=True starts a new tree instead of nesting under the current span"""
+        if not self.enabled:
+            return _NOOP
+        parent = None if root else _current.get()
+        return _ActiveSpan(self, Span(name, next(self._ids), parent.span_id if parent else None, attributes))
+
+    def traced(self, name: str, iterator: AsyncIterator[T], **attributes: Any) -> AsyncIterator[T]:
+        """Time each step of an async iterator, such as fetching one page, as its own span"""
+        if not self.enabled:
+            return iterator
+        return self._traced(name, iterator, attributes)
+
+    async def _traced(self, name: str, iterator: AsyncIterator[T], attributes: Dict[str, Any]) -> AsyncIterator[T]:
+        iterator = iterator.__aiter__()
+        while True:
+            with self.span(name, **attributes):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+
+    def _export(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"Span exporter {type(exporter).__name__} failed: {e}")
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters.clear()
+        self.enabled = False
+
+tracer = Tracer()
+
+class SamplingProfiler:
+    """Samples every thread's Python stack on a timer and counts collapsed stacks.
+
+    The output is in the folded format read by flamegraph.pl and speedscope:
+    one "outer;...;inner count" line per distinct stack.
+    """
+
+    def __init__(self, output: str = "profile.folded", interval: float = 0.005, max_stacks: int = 20000):
+        self.output = output
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = self._collapse(frame)
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                stack = "[other]"
+            self.stacks[stack] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started, every {self.interval * 1000:.1f}ms")
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks to output"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.write()
+        logger.info(f"Sampling profiler wrote {self.samples} samples to {self.output}")
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def write(self):
+        with open(self.output, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def install_signal(self, signum: int = getattr(signal, 'SIGUSR2', 0)):
+        """Toggle the profiler whenever the process receives signum"""
+        if signum:
+            signal.signal(signum, lambda *_: self.toggle())
+
+def configure_from_env(environ: Optional[Dict[str, str]] = None) -> Optional[SamplingProfiler]:
+    """Set up tracing and profiling from POLICY_TRACE and POLICY_PROFILE.
+
+    POLICY_TRACE is "memory" or the path of a JSONL file. The profiler can
+    always be toggled with SIGUSR2; POLICY_PROFILE=true also starts it now.
+    """
+    environ = os.environ if environ is None else environ
+    trace = environ.get('POLICY_TRACE', '')
+    if trace == 'memory':
+        tracer.add_exporter(InMemoryExporter())
+    elif trace:
+        tracer.add_exporter(JsonlExporter(trace))
+
+    profiler = SamplingProfiler(
+        output=environ.get('POLICY_PROFILE_OUTPUT', 'profile.folded'),
+        interval=float(environ.get('POLICY_PROFILE_INTERVAL', '0.005'))
+    )
+    if threading.current_thread() is threading.main_thread():
+        profiler.install_signal()
+    if environ.get('POLICY_PROFILE', '').lower() in ('1', 'true', 'yes'):
+        profiler.start()
+    return profiler